@@ -0,0 +1,410 @@
+"""
+Rapprochement des produits identiques entre sources (groupes de quasi-doublons).
+
+Chaque titre est normalisé puis découpé en trigrammes de caractères par mot; sa
+signature MinHash estime la similarité de Jaccard entre deux titres. Les signatures
+sont découpées en bandes LSH (product_lsh_bands): un groupe dont un membre partage
+une bande avec un produit est candidat. Le produit rejoint le groupe si le
+représentant du groupe (product_clusters.cluster_id = id de ce produit) atteint
+MATCH_SIMILARITY_THRESHOLD avec lui, si leurs prix restent dans un rapport de
+MATCH_MAX_PRICE_RATIO et si leurs nombres (modèle, capacité) ne se contredisent pas.
+La comparaison au seul représentant évite l'enchaînement de variantes proches
+("iPhone 13 case" ~ "iPhone 14 case" ~ ...) en un groupe géant; la taille des
+groupes est en outre plafonnée à MATCH_MAX_CLUSTER_SIZE.
+
+Le rapprochement est incrémental: seuls les produits nouveaux ou dont l'empreinte de
+contenu (titre, prix...) a changé depuis leur dernier rapprochement sont traités,
+par lots.
+
+Maintenance manuelle (depuis backend/):
+    python -m analytics.product_matching match [--batch-size 1000]
+    python -m analytics.product_matching rebuild
+"""
+import argparse
+import hashlib
+import os
+import re
+import unicodedata
+import zlib
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+from loguru import logger
+from sqlalchemy import delete, func, insert, or_, select, update
+from sqlalchemy.orm import Session, aliased
+
+from models import Product, ProductCluster, ProductLshBand
+
+
+# Taille des signatures et découpage LSH: 16 bandes de 4 valeurs, soit une
+# probabilité d'être candidats de 50% vers une similarité de 0.5.
+# Les modifier impose un rebuild (signatures et bandes stockées incompatibles).
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+
+# Similarité de Jaccard estimée minimale entre un titre et celui du représentant du groupe
+MATCH_SIMILARITY_THRESHOLD = float(os.getenv("MATCH_SIMILARITY_THRESHOLD", "0.6"))
+
+# Rapport maximal entre le prix d'un produit et celui du représentant (prix inconnus ignorés)
+MATCH_MAX_PRICE_RATIO = float(os.getenv("MATCH_MAX_PRICE_RATIO", "3"))
+
+# Taille maximale d'un groupe: au-delà, les produits similaires forment un autre groupe
+# (un groupe plein est journalisé: titres trop génériques ou seuil trop bas)
+MATCH_MAX_CLUSTER_SIZE = int(os.getenv("MATCH_MAX_CLUSTER_SIZE", "50"))
+
+# Produits rapprochés par transaction
+MATCH_BATCH_SIZE = int(os.getenv("MATCH_BATCH_SIZE", "1000"))
+
+# Clés de bande par requête de recherche des candidats
+_CANDIDATE_CHUNK_SIZE = 5000
+
+# Permutations MinHash h(x) = (a * x + b) mod p, graine fixe: les signatures stockées restent comparables
+_PRIME = (1 << 31) - 1
+_permutations = np.random.RandomState(20240601)
+_PERM_A = _permutations.randint(1, _PRIME, size=MINHASH_PERMUTATIONS).astype(np.uint64)
+_PERM_B = _permutations.randint(0, _PRIME, size=MINHASH_PERMUTATIONS).astype(np.uint64)
+
+_NON_ALPHANUMERIC = re.compile(r"[^a-z0-9]+")
+_DIGITS = re.compile(r"\d+")
+
+# Mots sans valeur pour identifier un produit (mots outils et accroches de listing)
+_STOP_WORDS = {
+    "a", "an", "and", "the", "for", "with", "of", "in", "on", "to", "by",
+    "de", "du", "des", "la", "le", "les", "et", "pour", "avec", "en", "un", "une",
+    "new", "hot", "sale", "free", "shipping", "original", "genuine", "nouveau", "livraison", "gratuite"
+}
+
+
+def normalize_title(title: Optional[str]) -> List[str]:
+    """Mots significatifs d'un titre: minuscules, sans accents ni ponctuation ni mots outils"""
+    if not title:
+        return []
+
+    ascii_title = unicodedata.normalize("NFKD", title).encode("ascii", "ignore").decode("ascii")
+    return [word for word in _NON_ALPHANUMERIC.split(ascii_title.lower()) if word and word not in _STOP_WORDS]
+
+
+def title_shingles(title: Optional[str]) -> Set[str]:
+    """
+    Trigrammes de caractères de chaque mot (bornés par des espaces): insensibles à
+    l'ordre des mots et peu sensibles aux fautes de frappe et aux pluriels
+    """
+    shingles = set()
+    for word in normalize_title(title):
+        padded = f" {word} "
+        shingles.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return shingles
+
+
+def minhash_signature(shingles: Iterable[str]) -> Optional[np.ndarray]:
+    """Signature MinHash (MINHASH_PERMUTATIONS entiers 32 bits), None sans trigramme"""
+    hashes = np.fromiter(
+        (zlib.crc32(shingle.encode("utf-8")) % _PRIME for shingle in shingles),
+        dtype=np.uint64
+    )
+    if not hashes.size:
+        return None
+
+    return ((np.outer(_PERM_A, hashes) + _PERM_B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def band_keys(signature: Optional[np.ndarray]) -> List[int]:
+    """Clé (BIGINT) de chaque bande de la signature, numéro de bande inclus"""
+    if signature is None:
+        return []
+
+    keys = []
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        digest = hashlib.blake2b(bytes([band]) + rows.tobytes(), digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "big", signed=True))
+    return keys
+
+
+def signature_similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Similarité de Jaccard estimée: part des valeurs MinHash égales"""
+    return float(np.mean(first == second))
+
+
+def title_numbers(title: Optional[str]) -> Set[str]:
+    """Nombres d'un titre (modèle, génération, capacité): "iPhone 13 128GB" -> {"13", "128"}"""
+    return set(_DIGITS.findall(" ".join(normalize_title(title))))
+
+
+def _prices_compatible(first, second) -> bool:
+    if not first or not second or first <= 0 or second <= 0:
+        return True
+    return max(first, second) / min(first, second) <= MATCH_MAX_PRICE_RATIO
+
+
+def _similarity(product: tuple, representative: tuple) -> Optional[float]:
+    """
+    Similarité d'un produit et d'un représentant de groupe (signature, prix, nombres),
+    None s'ils ne peuvent pas être rapprochés: titre vide, prix incompatibles, ou
+    nombres contradictoires (aucun des deux ensembles n'inclut l'autre: "13" / "14")
+    """
+    signature, prix, numbers = product
+    other_signature, other_prix, other_numbers = representative
+
+    if signature is None or other_signature is None or not _prices_compatible(prix, other_prix):
+        return None
+    if not (numbers <= other_numbers or other_numbers <= numbers):
+        return None
+
+    similarity = signature_similarity(signature, other_signature)
+    return similarity if similarity >= MATCH_SIMILARITY_THRESHOLD else None
+
+
+def _detach(db: Session, product_ids: List[int]):
+    """
+    Retirer des produits de leurs groupes avant de les rapprocher à nouveau.
+    Un groupe représenté par l'un d'eux prend pour représentant son plus petit membre restant.
+    """
+    labels = db.execute(
+        select(ProductCluster.cluster_id).where(
+            ProductCluster.product_id.in_(product_ids),
+            ProductCluster.cluster_id.in_(product_ids)
+        ).distinct()
+    ).scalars().all()
+
+    db.execute(delete(ProductLshBand).where(ProductLshBand.product_id.in_(product_ids)))
+    db.execute(delete(ProductCluster).where(ProductCluster.product_id.in_(product_ids)))
+
+    if labels:
+        member = aliased(ProductCluster)
+        db.execute(
+            update(ProductCluster).where(ProductCluster.cluster_id.in_(labels)).values(
+                cluster_id=select(func.min(member.product_id)).where(
+                    member.cluster_id == ProductCluster.cluster_id
+                ).scalar_subquery()
+            ),
+            execution_options={"synchronize_session": False}
+        )
+
+
+def _load_candidates(db: Session, keys: Set[int]) -> Dict[int, Set[int]]:
+    """Groupes dont un membre partage une bande: clé -> ids de groupe"""
+    by_key = defaultdict(set)
+    keys = list(keys)
+
+    for start in range(0, len(keys), _CANDIDATE_CHUNK_SIZE):
+        rows = db.execute(
+            select(ProductLshBand.band_key, ProductCluster.cluster_id)
+            .join(ProductCluster, ProductCluster.product_id == ProductLshBand.product_id)
+            .where(ProductLshBand.band_key.in_(keys[start:start + _CANDIDATE_CHUNK_SIZE]))
+        ).all()
+
+        for band_key, cluster_id in rows:
+            by_key[band_key].add(cluster_id)
+
+    return by_key
+
+
+def _load_representatives(db: Session, cluster_ids: Set[int]):
+    """Représentant (produit dont l'id est celui du groupe) et taille de chaque groupe"""
+    representatives = {}
+    sizes = {}
+    cluster_ids = list(cluster_ids)
+
+    for start in range(0, len(cluster_ids), _CANDIDATE_CHUNK_SIZE):
+        chunk = cluster_ids[start:start + _CANDIDATE_CHUNK_SIZE]
+
+        for cluster_id, signature, prix, nom in db.execute(
+            select(ProductCluster.cluster_id, ProductCluster.signature, Product.prix, Product.nom)
+            .join(Product, Product.id == ProductCluster.product_id)
+            .where(ProductCluster.product_id.in_(chunk), ProductCluster.cluster_id == ProductCluster.product_id)
+        ).all():
+            representatives[cluster_id] = (
+                np.frombuffer(signature, dtype=np.uint32) if signature is not None else None,
+                prix,
+                title_numbers(nom)
+            )
+
+        sizes.update(db.execute(
+            select(ProductCluster.cluster_id, func.count(ProductCluster.product_id))
+            .where(ProductCluster.cluster_id.in_(chunk))
+            .group_by(ProductCluster.cluster_id)
+        ).all())
+
+    return representatives, sizes
+
+
+def match_batch(db: Session, products: List) -> Dict[str, int]:
+    """
+    Rattacher un lot de produits (lignes id, nom, prix, content_hash) aux groupes
+    existants, ou à de nouveaux groupes, dans la transaction courante.
+    Un produit rejoint le groupe dont le représentant lui ressemble le plus (jamais
+    un membre quelconque: pas d'enchaînement de variantes proches), s'il n'a pas
+    atteint MATCH_MAX_CLUSTER_SIZE; sinon il représente un nouveau groupe.
+    Retourne {"matched", "clustered", "capped"}: produits traités, produits dans un
+    groupe d'au moins deux produits, groupes pleins qui ont refusé un produit.
+    """
+    if not products:
+        return {"matched": 0, "clustered": 0, "capped": 0}
+
+    products = sorted(products, key=lambda product: product.id)
+    signatures = {product.id: minhash_signature(title_shingles(product.nom)) for product in products}
+    keys = {product_id: band_keys(signature) for product_id, signature in signatures.items()}
+    profiles = {
+        product.id: (signatures[product.id], product.prix, title_numbers(product.nom))
+        for product in products
+    }
+
+    _detach(db, [product.id for product in products])
+    by_key = _load_candidates(db, {key for product_keys in keys.values() for key in product_keys})
+    representatives, sizes = _load_representatives(db, {cluster_id for ids in by_key.values() for cluster_id in ids})
+
+    # Représentants des groupes créés par ce lot, par clé de bande
+    batch_by_key = defaultdict(set)
+    assigned = {}
+    capped = set()
+
+    for product in products:
+        best, best_similarity = None, 0.0
+
+        for key in keys[product.id]:
+            for cluster_id in by_key.get(key, set()) | batch_by_key.get(key, set()):
+                representative = representatives.get(cluster_id)
+                similarity = _similarity(profiles[product.id], representative) if representative else None
+
+                # Le plus ressemblant, puis le plus petit id à égalité
+                if similarity is None or (best is not None and (similarity, -cluster_id) <= (best_similarity, -best)):
+                    continue
+
+                if sizes[cluster_id] >= MATCH_MAX_CLUSTER_SIZE:
+                    capped.add(cluster_id)
+                    continue
+
+                best, best_similarity = cluster_id, similarity
+
+        if best is None:
+            # Nouveau groupe, représenté par ce produit
+            best = product.id
+            representatives[best] = profiles[product.id]
+            sizes[best] = 0
+            for key in keys[product.id]:
+                batch_by_key[key].add(best)
+
+        sizes[best] += 1
+        assigned[product.id] = best
+
+    if capped:
+        logger.warning(
+            f"Product matching: {len(capped)} clusters at MATCH_MAX_CLUSTER_SIZE={MATCH_MAX_CLUSTER_SIZE} "
+            f"refused products (e.g. cluster {min(capped)}), check for over-merged titles"
+        )
+
+    now = datetime.utcnow()
+    db.execute(insert(ProductCluster), [
+        {
+            "product_id": product.id,
+            "cluster_id": assigned[product.id],
+            "signature": signatures[product.id].tobytes() if signatures[product.id] is not None else None,
+            "content_hash": product.content_hash,
+            "matched_at": now
+        }
+        for product in products
+    ])
+
+    band_rows = [{"band_key": key, "product_id": product_id} for product_id, product_keys in keys.items() for key in set(product_keys)]
+    if band_rows:
+        db.execute(insert(ProductLshBand), band_rows)
+
+    return {
+        "matched": len(products),
+        "clustered": sum(1 for cluster_id in assigned.values() if sizes[cluster_id] > 1),
+        "capped": len(capped)
+    }
+
+
+def match_pending_products(db: Session, batch_size: int = MATCH_BATCH_SIZE, max_batches: Optional[int] = None) -> Dict[str, int]:
+    """
+    Rapprocher les produits jamais rapprochés ou modifiés depuis (empreinte de contenu
+    différente), par lots de `batch_size` validés un à un
+    """
+    counts = {"matched": 0, "clustered": 0, "capped": 0, "batches": 0}
+
+    while max_batches is None or counts["batches"] < max_batches:
+        products = db.execute(
+            select(Product.id, Product.nom, Product.prix, Product.content_hash)
+            .outerjoin(ProductCluster, ProductCluster.product_id == Product.id)
+            .where(or_(
+                ProductCluster.product_id.is_(None),
+                ProductCluster.content_hash.is_distinct_from(Product.content_hash)
+            ))
+            .order_by(Product.id)
+            .limit(batch_size)
+        ).all()
+
+        if not products:
+            break
+
+        for key, value in match_batch(db, products).items():
+            counts[key] += value
+        counts["batches"] += 1
+        db.commit()
+
+    if counts["matched"]:
+        logger.info(
+            f"Product matching: {counts['matched']} products matched in {counts['batches']} batches, "
+            f"{counts['clustered']} grouped, {counts['capped']} full clusters"
+        )
+    return counts
+
+
+def rebuild_clusters(db: Session, batch_size: int = MATCH_BATCH_SIZE) -> Dict[str, int]:
+    """Effacer tous les groupes et rapprocher à nouveau l'ensemble des produits"""
+    db.execute(delete(ProductLshBand))
+    db.execute(delete(ProductCluster))
+    db.commit()
+    return match_pending_products(db, batch_size)
+
+
+def cluster_sizes():
+    """Sous-requête (cluster_id, size): nombre de produits de chaque groupe"""
+    return select(
+        ProductCluster.cluster_id,
+        func.count(ProductCluster.product_id).label("size")
+    ).group_by(ProductCluster.cluster_id).subquery()
+
+
+def cluster_competitor_count(db: Session, product_id: int) -> Optional[int]:
+    """Nombre d'autres produits du groupe d'un produit, None s'il n'a pas encore été rapproché"""
+    cluster_id = db.execute(
+        select(ProductCluster.cluster_id).where(ProductCluster.product_id == product_id)
+    ).scalar()
+    if cluster_id is None:
+        return None
+
+    return db.execute(
+        select(func.count(ProductCluster.product_id)).where(
+            ProductCluster.cluster_id == cluster_id,
+            ProductCluster.product_id != product_id
+        )
+    ).scalar()
+
+
+if __name__ == "__main__":
+    from models import SessionLocal
+
+    arg_parser = argparse.ArgumentParser(description="Cross-source product matching")
+    arg_parser.add_argument("command", choices=["match", "rebuild"])
+    arg_parser.add_argument("--batch-size", type=int, default=MATCH_BATCH_SIZE)
+    args = arg_parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        started = datetime.utcnow()
+        if args.command == "rebuild":
+            result = rebuild_clusters(session, args.batch_size)
+        else:
+            result = match_pending_products(session, args.batch_size)
+        print(
+            f"Matched {result['matched']} products ({result['clustered']} grouped, "
+            f"{result['capped']} full clusters) in {(datetime.utcnow() - started).total_seconds():.1f}s"
+        )
+    finally:
+        session.close()
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime
-from models import get_db, Alert, Product
+from models import get_async_db, Alert, Product
 from pydantic import BaseModel
 from decimal import Decimal
 
@@ -31,24 +32,24 @@ class AlertResponse(BaseModel):
 @router.get("/", response_model=List[AlertResponse])
 async def get_alerts(
     actif_only: bool = True,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Récupérer la liste des alertes
     """
-    query = db.query(Alert).join(Product)
+    query = select(Alert, Product.nom).join(Product)
     
     if actif_only:
-        query = query.filter(Alert.actif == True)
+        query = query.where(Alert.actif == True)
     
-    alerts = query.all()
+    alerts = (await db.execute(query)).all()
     
     result = []
-    for alert in alerts:
+    for alert, product_name in alerts:
         result.append(AlertResponse(
             id=alert.id,
             product_id=alert.product_id,
-            product_name=alert.product.nom,
+            product_name=product_name,
             type_alerte=alert.type_alerte,
             seuil=alert.seuil,
             actif=alert.actif,
@@ -59,12 +60,12 @@ async def get_alerts(
 
 
 @router.post("/", response_model=AlertResponse)
-async def create_alert(alert: AlertCreate, db: Session = Depends(get_db)):
+async def create_alert(alert: AlertCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Créer une nouvelle alerte
     """
     # Vérifier que le produit existe
-    product = db.query(Product).filter(Product.id == alert.product_id).first()
+    product = await db.get(Product, alert.product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
@@ -77,8 +78,8 @@ async def create_alert(alert: AlertCreate, db: Session = Depends(get_db)):
     )
     
     db.add(new_alert)
-    db.commit()
-    db.refresh(new_alert)
+    await db.commit()
+    await db.refresh(new_alert)
     
     return AlertResponse(
         id=new_alert.id,
@@ -96,12 +97,12 @@ async def update_alert(
     alert_id: int,
     actif: Optional[bool] = None,
     seuil: Optional[Decimal] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Modifier une alerte
     """
-    alert = db.query(Alert).filter(Alert.id == alert_id).first()
+    alert = await db.get(Alert, alert_id)
     if not alert:
         raise HTTPException(status_code=404, detail="Alert not found")
     
@@ -110,22 +111,21 @@ async def update_alert(
     if seuil is not None:
         alert.seuil = seuil
     
-    db.commit()
-    db.refresh(alert)
+    await db.commit()
     
     return {"message": "Alert updated successfully", "alert_id": alert_id}
 
 
 @router.delete("/{alert_id}")
-async def delete_alert(alert_id: int, db: Session = Depends(get_db)):
+async def delete_alert(alert_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Supprimer une alerte
     """
-    alert = db.query(Alert).filter(Alert.id == alert_id).first()
+    alert = await db.get(Alert, alert_id)
     if not alert:
         raise HTTPException(status_code=404, detail="Alert not found")
     
-    db.delete(alert)
-    db.commit()
+    await db.delete(alert)
+    await db.commit()
     
     return {"message": "Alert deleted successfully", "alert_id": alert_id}
@@ -1,9 +1,9 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import datetime, timedelta
-from models import get_db, Product, PriceHistory, Competitor, Trend
+from models import get_async_db, Product, ProductCluster, ProductObservationDaily, PriceHistoryDaily, Competitor, Trend
 from pydantic import BaseModel
 from decimal import Decimal
 
@@ -40,29 +40,40 @@ class TrendPrediction(BaseModel):
 async def calculate_profit_potential(
     limit: int = 50,
     min_margin: Optional[float] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Calculer le potentiel de profit (prix AliExpress vs Amazon)
     """
+    # Prix AliExpress (le plus bas) et Amazon (moyen) de chaque groupe de produits
+    # identiques (analytics.product_matching), limités aux groupes présents sur les deux
+    aliexpress_min = func.min(Product.prix).filter(Product.source == "aliexpress")
+    amazon_avg = func.avg(Product.prix).filter(Product.source == "amazon")
+    
+    cluster_prices = select(
+        ProductCluster.cluster_id,
+        aliexpress_min.label("aliexpress_price"),
+        amazon_avg.label("amazon_price")
+    ).join(Product, Product.id == ProductCluster.product_id).group_by(ProductCluster.cluster_id).having(
+        aliexpress_min.isnot(None),
+        amazon_avg.isnot(None)
+    ).subquery()
+    
     # Récupérer les produits avec prix AliExpress et Amazon
-    products = db.query(Product).all()
+    products = (await db.execute(select(
+        Product.id,
+        Product.nom,
+        cluster_prices.c.aliexpress_price,
+        cluster_prices.c.amazon_price
+    ).join(
+        ProductCluster, ProductCluster.product_id == Product.id
+    ).join(
+        cluster_prices, cluster_prices.c.cluster_id == ProductCluster.cluster_id
+    ))).all()
     
     profit_analysis = []
     
-    for product in products:
-        # Trouver le prix le plus bas sur AliExpress
-        aliexpress_price = db.query(func.min(Product.prix)).filter(
-            Product.nom.ilike(f"%{product.nom[:20]}%"),
-            Product.source == "aliexpress"
-        ).scalar()
-        
-        # Trouver le prix moyen sur Amazon
-        amazon_price = db.query(func.avg(Product.prix)).filter(
-            Product.nom.ilike(f"%{product.nom[:20]}%"),
-            Product.source == "amazon"
-        ).scalar()
-        
+    for product_id, product_name, aliexpress_price, amazon_price in products:
         if aliexpress_price and amazon_price:
             marge_brute = amazon_price - aliexpress_price
             
@@ -74,8 +85,8 @@ async def calculate_profit_potential(
             
             if min_margin is None or marge_nette >= min_margin:
                 profit_analysis.append(ProfitAnalysis(
-                    product_id=product.id,
-                    product_name=product.nom,
+                    product_id=product_id,
+                    product_name=product_name,
                     aliexpress_price=aliexpress_price,
                     amazon_price=amazon_price,
                     marge_brute=marge_brute,
@@ -92,21 +103,22 @@ async def calculate_profit_potential(
 @router.get("/saturation", response_model=List[SaturationScore])
 async def analyze_market_saturation(
     limit: int = 50,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Analyser la saturation du marché pour chaque produit
     """
-    products = db.query(Product).all()
+    # Nombre de concurrents de chaque produit, en une requête
+    competitors = select(func.count(Competitor.id)).where(
+        Competitor.product_id == Product.id
+    ).scalar_subquery()
+    
+    products = (await db.execute(select(Product.id, Product.nom, competitors))).all()
     
     saturation_scores = []
     
-    for product in products:
-        # Compter le nombre de concurrents
-        competitors_count = db.query(Competitor).filter(
-            Competitor.product_id == product.id
-        ).count()
-        
+    for product_id, product_name, competitors_count in products:
+    
         # Calculer le score de saturation (0-100)
         # Plus il y a de concurrents, plus le marché est saturé
         if competitors_count == 0:
@@ -123,8 +135,8 @@ async def analyze_market_saturation(
             opportunity = "low"
         
         saturation_scores.append(SaturationScore(
-            product_id=product.id,
-            product_name=product.nom,
+            product_id=product_id,
+            product_name=product_name,
             competitors_count=competitors_count,
             saturation_score=saturation_score,
             market_opportunity=opportunity
@@ -139,22 +151,23 @@ async def analyze_market_saturation(
 @router.get("/trends/predictions", response_model=List[TrendPrediction])
 async def predict_trends(
     limit: int = 50,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Prédire les tendances futures basées sur l'historique
     """
-    products = db.query(Product).all()
+    # Récupérer les tendances des 30 derniers jours de tous les produits, en une requête
+    rows = (await db.execute(select(Trend, Product.nom).join(Product).where(
+        Trend.date_calcul >= datetime.utcnow() - timedelta(days=30)
+    ).order_by(Trend.product_id, Trend.date_calcul.asc()))).all()
+    
+    trends_by_product = {}
+    for trend, product_name in rows:
+        trends_by_product.setdefault((trend.product_id, product_name), []).append(trend)
     
     predictions = []
     
-    for product in products:
-        # Récupérer les tendances des 30 derniers jours
-        trends = db.query(Trend).filter(
-            Trend.product_id == product.id,
-            Trend.date_calcul >= datetime.utcnow() - timedelta(days=30)
-        ).order_by(Trend.date_calcul.asc()).all()
-        
+    for (product_id, product_name), trends in trends_by_product.items():
         if len(trends) >= 2:
             current_score = trends[-1].score_tendance
             
@@ -172,8 +185,8 @@ async def predict_trends(
                 direction = "stable"
             
             predictions.append(TrendPrediction(
-                product_id=product.id,
-                product_name=product.nom,
+                product_id=product_id,
+                product_name=product_name,
                 current_trend_score=current_score,
                 predicted_trend_30d=predicted_score,
                 trend_direction=direction
@@ -186,60 +199,83 @@ async def predict_trends(
 
 
 @router.get("/seasonal")
-async def detect_seasonal_products(db: Session = Depends(get_db)):
+async def detect_seasonal_products(db: AsyncSession = Depends(get_async_db)):
     """
     Détecter les produits saisonniers basés sur les patterns de ventes
     """
-    # Récupérer les produits avec historique de prix sur 90+ jours
+    # Moyennes mensuelles sur 90 jours, en une requête sur le rollup journalier
     seasonal_products = []
+    since = (datetime.utcnow() - timedelta(days=90)).date()
+    
+    month = func.date_trunc('month', PriceHistoryDaily.bucket)
+    
+    rows = (await db.execute(select(
+        PriceHistoryDaily.product_id,
+        month,
+        func.sum(PriceHistoryDaily.sum_prix),
+        func.sum(PriceHistoryDaily.sample_count)
+    ).where(
+        PriceHistoryDaily.bucket >= since
+    ).group_by(PriceHistoryDaily.product_id, month))).all()
+    
+    monthly_by_product = {}
+    for product_id, month_start, price_sum, sample_count in rows:
+        monthly_by_product.setdefault(product_id, {})[month_start.month] = (float(price_sum), sample_count)
     
-    products = db.query(Product).all()
+    # Au moins 30 relevés sur la période, prix changé ou non (l'historique ne
+    # reçoit que les changements de prix)
+    observed = set((await db.scalars(select(ProductObservationDaily.product_id).where(
+        ProductObservationDaily.bucket >= since
+    ).group_by(ProductObservationDaily.product_id).having(
+        func.sum(ProductObservationDaily.observations) >= 30
+    ))).all()) if monthly_by_product else set()
     
-    for product in products:
-        price_history = db.query(PriceHistory).filter(
-            PriceHistory.product_id == product.id,
-            PriceHistory.date >= datetime.utcnow() - timedelta(days=90)
-        ).all()
+    candidates = {}
+    
+    for product_id, monthly in monthly_by_product.items():
+        if product_id not in observed:
+            continue
+        
+        # Analyser les variations de prix par mois
+        monthly_avg = {month_number: price_sum / count for month_number, (price_sum, count) in monthly.items()}
         
-        if len(price_history) >= 30:
-            # Analyser les variations de prix par mois
-            monthly_avg = {}
-            for record in price_history:
-                month = record.date.month
-                if month not in monthly_avg:
-                    monthly_avg[month] = []
-                monthly_avg[month].append(float(record.prix))
+        # Calculer la variance
+        if len(monthly_avg) >= 2:
+            averages = list(monthly_avg.values())
+            variance = max(averages) - min(averages)
             
-            # Calculer la variance
-            if len(monthly_avg) >= 2:
-                averages = [sum(prices)/len(prices) for prices in monthly_avg.values()]
-                variance = max(averages) - min(averages)
-                
-                # Si variance > 20% du prix moyen, considéré comme saisonnier
-                avg_price = sum(averages) / len(averages)
-                if variance / avg_price > 0.2:
-                    seasonal_products.append({
-                        "product_id": product.id,
-                        "product_name": product.nom,
-                        "price_variance": round(variance, 2),
-                        "is_seasonal": True,
-                        "peak_month": max(monthly_avg, key=lambda k: sum(monthly_avg[k])/len(monthly_avg[k]))
-                    })
+            # Si variance > 20% du prix moyen, considéré comme saisonnier
+            avg_price = sum(averages) / len(averages)
+            if avg_price and variance / avg_price > 0.2:
+                candidates[product_id] = (variance, max(monthly_avg, key=monthly_avg.get))
+    
+    names = dict((await db.execute(
+        select(Product.id, Product.nom).where(Product.id.in_(candidates))
+    )).all()) if candidates else {}
+    
+    for product_id, (variance, peak_month) in candidates.items():
+        seasonal_products.append({
+            "product_id": product_id,
+            "product_name": names.get(product_id),
+            "price_variance": round(variance, 2),
+            "is_seasonal": True,
+            "peak_month": peak_month
+        })
     
     return seasonal_products
 
 
 @router.get("/dashboard/summary")
-async def get_dashboard_summary(db: Session = Depends(get_db)):
+async def get_dashboard_summary(db: AsyncSession = Depends(get_async_db)):
     """
     Récupérer un résumé pour le dashboard principal
     """
-    total_products = db.query(Product).count()
+    total_products = await db.scalar(select(func.count(Product.id)))
     
     # Top 5 produits tendances
-    top_trending = db.query(Product, Trend).join(Trend).order_by(
+    top_trending = (await db.execute(select(Product, Trend).join(Trend).order_by(
         desc(Trend.score_tendance)
-    ).limit(5).all()
+    ).limit(5))).all()
     
     # Meilleurs opportunités de profit
     top_profit = await calculate_profit_potential(limit=5, db=db)
@@ -256,13 +292,13 @@ async def get_dashboard_summary(db: Session = Depends(get_db)):
 
 
 @router.get("/trending")
-async def get_trending_products(limit: int = 20, db: Session = Depends(get_db)):
+async def get_trending_products(limit: int = 20, db: AsyncSession = Depends(get_async_db)):
     """
     Get trending products with their scores
     """
-    trending = db.query(Product, Trend).join(Trend).order_by(
+    trending = (await db.execute(select(Product, Trend).join(Trend).order_by(
         desc(Trend.score_tendance)
-    ).limit(limit).all()
+    ).limit(limit))).all()
     
     return [{
         "id": p.id,
@@ -276,25 +312,25 @@ async def get_trending_products(limit: int = 20, db: Session = Depends(get_db)):
 
 
 @router.get("/stats")
-async def get_analytics_stats(db: Session = Depends(get_db)):
+async def get_analytics_stats(db: AsyncSession = Depends(get_async_db)):
     """
     Get analytics statistics
     """
-    total_products = db.query(Product).count()
-    avg_price = db.query(func.avg(Product.prix)).scalar() or 0
-    total_reviews = db.query(func.sum(Product.reviews_count)).scalar() or 0
+    total_products = await db.scalar(select(func.count(Product.id)))
+    avg_price = await db.scalar(select(func.avg(Product.prix))) or 0
+    total_reviews = await db.scalar(select(func.sum(Product.reviews_count))) or 0
     
     # Group by category
-    categories = db.query(
+    categories = (await db.execute(select(
         Product.categorie,
         func.count(Product.id).label('count')
-    ).group_by(Product.categorie).all()
+    ).group_by(Product.categorie))).all()
     
     # Group by source
-    sources = db.query(
+    sources = (await db.execute(select(
         Product.source,
         func.count(Product.id).label('count')
-    ).group_by(Product.source).all()
+    ).group_by(Product.source))).all()
     
     return {
         "total_products": total_products,
@@ -306,11 +342,11 @@ async def get_analytics_stats(db: Session = Depends(get_db)):
 
 
 @router.get("/product/{product_id}/trend")
-async def get_product_trend(product_id: int, db: Session = Depends(get_db)):
+async def get_product_trend(product_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Get trend data for a specific product
     """
-    trend = db.query(Trend).filter(Trend.product_id == product_id).first()
+    trend = await db.scalar(select(Trend).where(Trend.product_id == product_id).limit(1))
     
     if not trend:
         return None
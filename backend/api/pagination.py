@@ -0,0 +1,99 @@
+"""
+Pagination par curseur (keyset) des listes de l'API.
+
+Une page est triée par (clé de tri, id): l'id départage les ex aequo, si bien qu'une
+ligne insérée ou modifiée pendant le parcours ne fait ni sauter ni répéter de ligne.
+Le curseur, opaque pour le client, encode le tri et le couple (clé, id) de la
+dernière ligne servie; la page suivante reprend strictement après ce couple, par
+l'index composite correspondant, quelle que soit la profondeur.
+Le curseur de la page suivante est renvoyé dans l'en-tête X-Next-Cursor (absent sur
+la dernière page).
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import Select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Types des valeurs de clé encodées dans un curseur
+_ENCODERS = {
+    datetime: ("t", datetime.isoformat),
+    Decimal: ("n", str),
+    float: ("f", repr),
+    int: ("i", str),
+    str: ("s", str)
+}
+_DECODERS = {
+    "t": datetime.fromisoformat,
+    "n": Decimal,
+    "f": float,
+    "i": int,
+    "s": str
+}
+
+
+def encode_cursor(sort: str, values: Tuple) -> str:
+    """Curseur opaque (base64 url-safe) pour le tri `sort` et les valeurs (clé, id)"""
+    encoded = []
+    for value in values:
+        tag, encode = _ENCODERS[type(value)]
+        encoded.append([tag, encode(value)])
+
+    payload = json.dumps({"sort": sort, "after": encoded}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, sort: str) -> List[Any]:
+    """Valeurs (clé, id) d'un curseur; 400 si le curseur est invalide ou d'un autre tri"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        if payload["sort"] != sort:
+            raise ValueError("sort mismatch")
+        return [_DECODERS[tag](value) for tag, value in payload["after"]]
+    except (binascii.Error, json.JSONDecodeError, KeyError, TypeError, ValueError, ArithmeticError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+async def fetch_keyset_page(
+    db: AsyncSession,
+    query: Select,
+    sort: str,
+    sort_key,
+    id_column,
+    descending: bool,
+    limit: int,
+    cursor: Optional[str] = None
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Exécuter `query` (une entité sélectionnée) triée par (sort_key, id_column) et
+    limitée à `limit` lignes après `cursor`.
+    Retourne (entités, curseur de la page suivante ou None).
+    """
+    keys = tuple_(sort_key, id_column)
+
+    if cursor:
+        after = tuple_(*decode_cursor(cursor, sort))
+        query = query.where(keys < after if descending else keys > after)
+
+    if descending:
+        query = query.order_by(sort_key.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_key.asc(), id_column.asc())
+
+    # Une ligne de plus pour savoir s'il reste une page
+    rows = (await db.execute(query.add_columns(sort_key, id_column).limit(limit + 1))).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sort, (rows[-1][-2], rows[-1][-1]))
+
+    return [row[0] for row in rows], next_cursor
@@ -1,14 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import Float, desc, func, literal, literal_column, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from datetime import datetime, timedelta
-from models import get_db, Product, PriceHistory, Competitor, Trend
+from datetime import datetime, time, timedelta
+from models import get_async_db, SEARCH_TEXT_CONFIG, Product, PriceHistory, PriceHistoryDaily, PriceHistoryWeekly, Competitor, Trend
+from tasks.price_history import history_resolution
+from api.pagination import NEXT_CURSOR_HEADER, fetch_keyset_page
 from pydantic import BaseModel
 from decimal import Decimal
 
 router = APIRouter()
 
+# sort_by -> (clé de tri, ordre décroissant); l'id départage les ex aequo.
+# Chaque tri a son index composite (clé, id), seul ou précédé de categorie / source.
+PRODUCT_SORTS = {
+    "date_scrape": (Product.date_scrape, True),
+    "prix_asc": (Product.prix, False),
+    "prix_desc": (Product.prix, True),
+    "rating": (func.coalesce(Product.rating, literal_column("0")), True)  # Produits sans note en dernier
+}
+
+# Configuration plein texte de la colonne search_vector (littéral: comparée au plan)
+SEARCH_REGCONFIG = literal_column(f"'{SEARCH_TEXT_CONFIG}'::regconfig")
+
 
 # Pydantic schemas
 class ProductResponse(BaseModel):
@@ -22,6 +36,8 @@ class ProductResponse(BaseModel):
     rating: Optional[Decimal]
     reviews_count: int
     date_scrape: datetime
+    last_seen_at: Optional[datetime] = None
+    next_refresh_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
@@ -37,10 +53,13 @@ class ProductDetailResponse(ProductResponse):
 
 
 class PriceHistoryResponse(BaseModel):
-    id: int
-    prix: Decimal
+    id: Optional[int] = None
+    prix: Decimal  # Dernier prix du bucket pour les résolutions daily / weekly
     date: datetime
-    source: str
+    source: Optional[str] = None
+    min_prix: Optional[Decimal] = None
+    max_prix: Optional[Decimal] = None
+    avg_prix: Optional[Decimal] = None
     
     class Config:
         from_attributes = True
@@ -72,41 +91,50 @@ class TrendResponse(BaseModel):
 
 @router.get("/", response_model=List[ProductResponse])
 async def get_products(
+    response: Response,
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=1000),
     categorie: Optional[str] = None,
     source: Optional[str] = None,
     prix_min: Optional[float] = None,
     prix_max: Optional[float] = None,
     sort_by: str = "date_scrape",
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Récupérer la liste des produits avec filtres avancés
+    Récupérer la liste des produits avec filtres avancés.
+    Pagination par curseur: passer la valeur de l'en-tête X-Next-Cursor de la page
+    précédente dans `cursor` (mêmes filtres et même tri); `skip` n'est plus appliqué
+    dès qu'un curseur est fourni.
     """
-    query = db.query(Product)
+    query = select(Product)
     
     # Filtres
     if categorie:
-        query = query.filter(Product.categorie == categorie)
+        query = query.where(Product.categorie == categorie)
     if source:
-        query = query.filter(Product.source == source)
+        query = query.where(Product.source == source)
     if prix_min:
-        query = query.filter(Product.prix >= prix_min)
+        query = query.where(Product.prix >= prix_min)
     if prix_max:
-        query = query.filter(Product.prix <= prix_max)
-    
-    # Tri
-    if sort_by == "prix_asc":
-        query = query.order_by(Product.prix.asc())
-    elif sort_by == "prix_desc":
-        query = query.order_by(Product.prix.desc())
-    elif sort_by == "rating":
-        query = query.order_by(desc(Product.rating))
-    else:
-        query = query.order_by(desc(Product.date_scrape))
+        query = query.where(Product.prix <= prix_max)
+    
+    # Tri (par défaut: date de scrape)
+    if sort_by not in PRODUCT_SORTS:
+        sort_by = "date_scrape"
+    sort_key, descending = PRODUCT_SORTS[sort_by]
     
-    products = query.offset(skip).limit(limit).all()
+    # Première page sans curseur: décalage historique (lit et ignore `skip` lignes)
+    if skip and not cursor:
+        query = query.offset(skip)
+    
+    products, next_cursor = await fetch_keyset_page(
+        db, query, sort_by, sort_key, Product.id, descending, limit, cursor
+    )
+    
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return products
 
 
@@ -114,26 +142,77 @@ async def get_products(
 async def get_trending_products(
     limit: int = 100,
     categorie: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Récupérer le top 100 des produits tendances
     """
-    query = db.query(Product).join(Trend)
+    query = select(Product).join(Trend)
     
     if categorie:
-        query = query.filter(Product.categorie == categorie)
+        query = query.where(Product.categorie == categorie)
     
-    products = query.order_by(desc(Trend.score_tendance)).limit(limit).all()
+    products = (await db.scalars(query.order_by(desc(Trend.score_tendance)).limit(limit))).all()
+    return products
+
+
+@router.get("/search", response_model=List[ProductResponse])
+async def search_products(
+    response: Response,
+    q: str = Query(..., min_length=2, max_length=200),
+    categorie: Optional[str] = None,
+    source: Optional[str] = None,
+    sort_by: str = "relevance",
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Rechercher des produits par nom et description.
+    Un produit correspond si ses mots contiennent la requête (plein texte, syntaxe web:
+    "expression exacte", -exclu, or) ou si son nom est proche de la requête (trigrammes:
+    fautes de frappe, mots partiels). Tri par pertinence, ou par un tri de la liste
+    des produits (sort_by); pagination par curseur (en-tête X-Next-Cursor).
+    """
+    text_query = func.websearch_to_tsquery(SEARCH_REGCONFIG, q)
+    
+    # Chaque condition est servie par son index GIN (search_vector / nom gin_trgm_ops)
+    query = select(Product).where(or_(
+        Product.search_vector.bool_op("@@")(text_query),
+        literal(q).bool_op("<%")(Product.nom)
+    ))
+    
+    if categorie:
+        query = query.where(Product.categorie == categorie)
+    if source:
+        query = query.where(Product.source == source)
+    
+    if sort_by in PRODUCT_SORTS:
+        sort_key, descending = PRODUCT_SORTS[sort_by]
+    else:
+        # Pertinence: rang plein texte (normalisé entre 0 et 1) + similarité du nom
+        sort_by = "relevance"
+        sort_key = (
+            func.ts_rank_cd(Product.search_vector, text_query, 32, type_=Float)
+            + func.word_similarity(q, Product.nom, type_=Float)
+        )
+        descending = True
+    
+    products, next_cursor = await fetch_keyset_page(
+        db, query, sort_by, sort_key, Product.id, descending, limit, cursor
+    )
+    
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     return products
 
 
 @router.get("/{product_id}", response_model=ProductDetailResponse)
-async def get_product_detail(product_id: int, db: Session = Depends(get_db)):
+async def get_product_detail(product_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Récupérer les détails d'un produit
     """
-    product = db.query(Product).filter(Product.id == product_id).first()
+    product = await db.get(Product, product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     return product
@@ -142,42 +221,66 @@ async def get_product_detail(product_id: int, db: Session = Depends(get_db)):
 @router.get("/{product_id}/history", response_model=List[PriceHistoryResponse])
 async def get_price_history(
     product_id: int,
+    response: Response,
     days: int = 30,
-    db: Session = Depends(get_db)
+    resolution: Optional[str] = Query(None, pattern="^(raw|daily|weekly)$"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Récupérer l'historique des prix d'un produit
+    Récupérer l'historique des prix d'un produit.
+    Points bruts sur les périodes courtes, rollups journaliers puis hebdomadaires
+    au-delà (résolution forçable avec `resolution`, indiquée dans X-History-Resolution)
     """
+    resolution = resolution or history_resolution(days)
+    response.headers["X-History-Resolution"] = resolution
+    
     start_date = datetime.utcnow() - timedelta(days=days)
     
-    history = db.query(PriceHistory).filter(
-        PriceHistory.product_id == product_id,
-        PriceHistory.date >= start_date
-    ).order_by(PriceHistory.date.asc()).all()
+    if resolution == "raw":
+        return (await db.scalars(select(PriceHistory).where(
+            PriceHistory.product_id == product_id,
+            PriceHistory.date >= start_date
+        ).order_by(PriceHistory.date.asc()))).all()
+    
+    rollup = PriceHistoryDaily if resolution == "daily" else PriceHistoryWeekly
+    
+    buckets = (await db.scalars(select(rollup).where(
+        rollup.product_id == product_id,
+        rollup.bucket >= start_date.date()
+    ).order_by(rollup.bucket.asc()))).all()
     
-    return history
+    return [
+        PriceHistoryResponse(
+            prix=bucket.last_prix,
+            date=datetime.combine(bucket.bucket, time.min),
+            min_prix=bucket.min_prix,
+            max_prix=bucket.max_prix,
+            avg_prix=(bucket.sum_prix / bucket.sample_count).quantize(Decimal("0.01"))
+        )
+        for bucket in buckets
+    ]
 
 
 @router.get("/{product_id}/competitors", response_model=List[CompetitorResponse])
-async def get_competitors(product_id: int, db: Session = Depends(get_db)):
+async def get_competitors(product_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Récupérer la liste des concurrents pour un produit
     """
-    competitors = db.query(Competitor).filter(
+    competitors = (await db.scalars(select(Competitor).where(
         Competitor.product_id == product_id
-    ).order_by(Competitor.prix.asc()).all()
+    ).order_by(Competitor.prix.asc()))).all()
     
     return competitors
 
 
 @router.get("/{product_id}/trend", response_model=TrendResponse)
-async def get_product_trend(product_id: int, db: Session = Depends(get_db)):
+async def get_product_trend(product_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Récupérer les données de tendance d'un produit
     """
-    trend = db.query(Trend).filter(
+    trend = await db.scalar(select(Trend).where(
         Trend.product_id == product_id
-    ).order_by(desc(Trend.date_calcul)).first()
+    ).order_by(desc(Trend.date_calcul)).limit(1))
     
     if not trend:
         raise HTTPException(status_code=404, detail="Trend data not found")
@@ -186,20 +289,20 @@ async def get_product_trend(product_id: int, db: Session = Depends(get_db)):
 
 
 @router.post("/compare")
-async def compare_products(product_ids: List[int], db: Session = Depends(get_db)):
+async def compare_products(product_ids: List[int], db: AsyncSession = Depends(get_async_db)):
     """
     Comparer plusieurs produits
     """
-    products = db.query(Product).filter(Product.id.in_(product_ids)).all()
+    products = (await db.scalars(select(Product).where(Product.id.in_(product_ids)))).all()
     
     if len(products) != len(product_ids):
         raise HTTPException(status_code=404, detail="Some products not found")
     
     comparison = []
     for product in products:
-        trend = db.query(Trend).filter(
+        trend = await db.scalar(select(Trend).where(
             Trend.product_id == product.id
-        ).order_by(desc(Trend.date_calcul)).first()
+        ).order_by(desc(Trend.date_calcul)).limit(1))
         
         comparison.append({
             "product": ProductDetailResponse.from_orm(product),
@@ -210,31 +313,33 @@ async def compare_products(product_ids: List[int], db: Session = Depends(get_db)
 
 
 @router.get("/categories/list")
-async def get_categories(db: Session = Depends(get_db)):
+async def get_categories(db: AsyncSession = Depends(get_async_db)):
     """
     Récupérer la liste des catégories disponibles
     """
-    categories = db.query(Product.categorie).distinct().all()
-    return [cat[0] for cat in categories if cat[0]]
+    categories = (await db.scalars(select(Product.categorie).distinct())).all()
+    return [cat for cat in categories if cat]
 
 
 @router.get("/sources/list")
-async def get_sources(db: Session = Depends(get_db)):
+async def get_sources(db: AsyncSession = Depends(get_async_db)):
     """
     Récupérer la liste des sources disponibles
     """
-    sources = db.query(Product.source).distinct().all()
-    return [src[0] for src in sources if src[0]]
+    sources = (await db.scalars(select(Product.source).distinct())).all()
+    return [src for src in sources if src]
 
 
 @router.get("/{product_id}/price-history", response_model=List[PriceHistoryResponse])
 async def get_price_history_alias(
     product_id: int,
+    response: Response,
     days: int = 30,
-    db: Session = Depends(get_db)
+    resolution: Optional[str] = Query(None, pattern="^(raw|daily|weekly)$"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Alias for price history endpoint
     """
-    return await get_price_history(product_id, days, db)
+    return await get_price_history(product_id, response, days, resolution, db)
 
@@ -0,0 +1,140 @@
+"""
+Test de charge de l'API sous un trafic de dashboard concurrent.
+Des clients simultanés enchaînent les appels du dashboard (mélange pondéré) pendant
+une durée fixe; rapporte par endpoint: requêtes, erreurs, req/s, p50 / p95 / p99 (ms).
+/health sert de sonde: sa latence monte dès qu'une route bloque la boucle d'événements.
+
+Comparer deux versions de l'API (serveur lancé séparément, même base et même nombre de workers):
+    python -m benchmarks.api_load_test --url http://localhost:8000 --json before.json
+    python -m benchmarks.api_load_test --url http://localhost:8000 --json after.json --baseline before.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from typing import Dict, List
+
+import httpx
+
+
+# Endpoint -> poids dans le trafic (rafraîchissement du dashboard et des listes)
+DASHBOARD_TRAFFIC = {
+    "/api/analytics/dashboard/summary": 1,
+    "/api/analytics/stats": 2,
+    "/api/analytics/trending?limit=20": 3,
+    "/api/products/?limit=50": 4,
+    "/api/products/trending?limit=20": 2,
+    "/api/alerts/": 2,
+    "/health": 2
+}
+
+
+def percentile(values: List[float], rank: float) -> float:
+    """Percentile (méthode du rang le plus proche) d'une liste triée"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, math.ceil(rank / 100 * len(values)) - 1))
+    return values[index]
+
+
+async def client_loop(client: httpx.AsyncClient, paths: List[str], weights: List[int],
+                      deadline: float, samples: Dict[str, List[float]], errors: Dict[str, int]):
+    while time.perf_counter() < deadline:
+        path = random.choices(paths, weights)[0]
+        start = time.perf_counter()
+        try:
+            response = await client.get(path)
+            failed = response.status_code >= 400
+        except httpx.HTTPError:
+            failed = True
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if failed:
+            errors[path] = errors.get(path, 0) + 1
+        else:
+            samples.setdefault(path, []).append(elapsed_ms)
+
+
+async def run_load_test(args) -> Dict[str, Dict]:
+    paths = list(DASHBOARD_TRAFFIC)
+    weights = [DASHBOARD_TRAFFIC[path] for path in paths]
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        # Préchauffage: pools de connexions et caches du serveur
+        if args.warmup:
+            await asyncio.gather(*(
+                client_loop(client, paths, weights, time.perf_counter() + args.warmup, {}, {})
+                for _ in range(args.concurrency)
+            ))
+
+        samples: Dict[str, List[float]] = {}
+        errors: Dict[str, int] = {}
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            client_loop(client, paths, weights, start + args.duration, samples, errors)
+            for _ in range(args.concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+
+    results = {}
+    for path in paths + ["all"]:
+        latencies = sorted(
+            sum(samples.values(), []) if path == "all" else samples.get(path, [])
+        )
+        failed = sum(errors.values()) if path == "all" else errors.get(path, 0)
+
+        results[path] = {
+            "requests": len(latencies) + failed,
+            "errors": failed,
+            "req_per_sec": round((len(latencies) + failed) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50), 1),
+            "p95_ms": round(percentile(latencies, 95), 1),
+            "p99_ms": round(percentile(latencies, 99), 1)
+        }
+
+    return results
+
+
+def print_results(results: Dict[str, Dict], baseline: Dict[str, Dict] = None):
+    print(f"{'endpoint':<36} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+          + (f" {'p99 before':>11} {'change':>8}" if baseline else ""))
+
+    for path, result in results.items():
+        line = (f"{path:<36} {result['requests']:>9} {result['errors']:>7} {result['req_per_sec']:>8.1f} "
+                f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f}")
+
+        previous = (baseline or {}).get(path)
+        if previous and previous.get("p99_ms"):
+            change = (result["p99_ms"] - previous["p99_ms"]) / previous["p99_ms"]
+            line += f" {previous['p99_ms']:>11.1f} {change:>+8.0%}"
+
+        print(line)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Concurrent dashboard load test for the API")
+    arg_parser.add_argument("--url", default="http://localhost:8000")
+    arg_parser.add_argument("--concurrency", type=int, default=50)
+    arg_parser.add_argument("--duration", type=float, default=30.0)
+    arg_parser.add_argument("--warmup", type=float, default=5.0)
+    arg_parser.add_argument("--timeout", type=float, default=30.0)
+    arg_parser.add_argument("--json", dest="json_path")
+    arg_parser.add_argument("--baseline")
+    args = arg_parser.parse_args()
+
+    results = asyncio.run(run_load_test(args))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print(f"{args.concurrency} concurrent clients, {args.duration:.0f}s against {args.url}")
+    print_results(results, baseline)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,91 @@
+"""
+Benchmark parse-only des scrapers sur des pages HTML sauvegardées.
+Compare les backends de parsing et vérifie que les produits extraits sont identiques.
+
+Usage (depuis backend/):
+    python -m benchmarks.parse_benchmark [--fixtures benchmarks/fixtures] [--repeat 20]
+"""
+import argparse
+import os
+import time
+
+from loguru import logger
+
+from scrapers import parsing
+from scrapers.amazon_scraper import amazon_scraper
+from scrapers.aliexpress_scraper import aliexpress_scraper
+from scrapers.ebay_scraper import ebay_scraper
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+BACKENDS = ["bs4", "lxml"]
+
+# Préfixe du fichier de fixture -> fonction de parsing
+PARSERS = {
+    "amazon_bestsellers": lambda html: amazon_scraper._parse_bestsellers(html, "electronics", 50),
+    "amazon_product": lambda html: amazon_scraper._parse_product_details(html, "B000000000", ""),
+    "aliexpress_search": lambda html: aliexpress_scraper._parse_trending_products(html, "electronics", 50),
+    "aliexpress_product": lambda html: aliexpress_scraper._parse_product_details(html, "0", ""),
+    "ebay_sold": lambda html: ebay_scraper._parse_sold_items(html, "electronics", 50)
+}
+
+
+def find_parser(filename: str):
+    for prefix, parser in PARSERS.items():
+        if filename.startswith(prefix):
+            return parser
+    return None
+
+
+def run_benchmark(fixtures_dir: str, repeat: int) -> bool:
+    """
+    Parser chaque fixture avec chaque backend et afficher le temps moyen par page
+    """
+    # Les logs par produit fausseraient la mesure
+    logger.disable("scrapers")
+
+    all_identical = True
+
+    print(f"{'fixture':<40} {'items':>6} " + " ".join(f"{b + ' ms':>10}" for b in BACKENDS) + f" {'speedup':>8}  identical")
+
+    for filename in sorted(os.listdir(fixtures_dir)):
+        parser = find_parser(filename)
+        if parser is None or not filename.endswith(".html"):
+            continue
+
+        with open(os.path.join(fixtures_dir, filename), encoding="utf-8") as f:
+            html = f.read()
+
+        timings = {}
+        results = {}
+
+        for backend in BACKENDS:
+            parsing.PARSER_BACKEND = backend
+            results[backend] = parser(html)
+
+            start = time.perf_counter()
+            for _ in range(repeat):
+                parser(html)
+            timings[backend] = (time.perf_counter() - start) * 1000 / repeat
+
+        identical = all(results[b] == results[BACKENDS[0]] for b in BACKENDS)
+        all_identical = all_identical and identical
+
+        items = results[BACKENDS[0]]
+        count = len(items) if isinstance(items, list) else 1
+        speedup = timings["bs4"] / timings["lxml"] if timings["lxml"] else 0
+
+        print(f"{filename:<40} {count:>6} " + " ".join(f"{timings[b]:>10.2f}" for b in BACKENDS) + f" {speedup:>7.1f}x  {identical}")
+
+    return all_identical
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Parse-only benchmark for scrapers")
+    arg_parser.add_argument("--fixtures", default=FIXTURES_DIR)
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    args = arg_parser.parse_args()
+
+    if not run_benchmark(args.fixtures, args.repeat):
+        raise SystemExit("Parser backends produced different results")
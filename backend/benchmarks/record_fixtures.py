@@ -0,0 +1,57 @@
+"""
+Enregistrer les réponses réelles d'un scraper pour les rejouer hors ligne.
+Le cache scraper est contourné: chaque page est réellement téléchargée.
+
+Usage (depuis backend/):
+    python -m benchmarks.record_fixtures amazon --category electronics
+    python -m benchmarks.record_fixtures shopify --store gymshark.com --limit 250
+"""
+import argparse
+import asyncio
+import os
+
+from benchmarks.replay import REPLAY_DIR, FixtureSet, Recorder
+from scrapers.amazon_scraper import amazon_scraper
+from scrapers.aliexpress_scraper import aliexpress_scraper
+from scrapers.browser_pool import browser_pool
+from scrapers.ebay_scraper import ebay_scraper
+from scrapers.http_client import http_clients
+from scrapers.shopify_scraper import shopify_scraper
+from scrapers.streaming import collect
+
+
+# Source -> scrape à enregistrer (sans passer par le cache)
+SCRAPES = {
+    "amazon": lambda args: amazon_scraper._iter_bestsellers(args.category, args.limit),
+    "aliexpress": lambda args: aliexpress_scraper._iter_trending_products(args.category, args.limit),
+    "ebay": lambda args: ebay_scraper._iter_sold_items(args.category, args.limit),
+    "shopify": lambda args: shopify_scraper._iter_products(args.store, args.limit)
+}
+
+
+async def record(args) -> int:
+    fixtures = FixtureSet(os.path.join(args.output, args.source))
+    Recorder(fixtures).install()
+
+    try:
+        products = await collect(SCRAPES[args.source](args))
+    finally:
+        await browser_pool.close()
+        await http_clients.aclose()
+
+    fixtures.save()
+    print(f"Recorded {len(fixtures.entries)} responses ({len(products)} products) into {fixtures.directory}")
+    return len(products)
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Record live scraper responses as replay fixtures")
+    arg_parser.add_argument("source", choices=sorted(SCRAPES))
+    arg_parser.add_argument("--category", default="electronics")
+    arg_parser.add_argument("--store", default="gymshark.com")
+    arg_parser.add_argument("--limit", type=int, default=50)
+    arg_parser.add_argument("--output", default=REPLAY_DIR)
+    args = arg_parser.parse_args()
+
+    if not asyncio.run(record(args)):
+        raise SystemExit("No products scraped, fixtures are probably a block page")
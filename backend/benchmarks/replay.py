@@ -0,0 +1,208 @@
+"""
+Enregistrement et rejeu hors ligne des réponses des sites scrapés.
+
+Le Recorder capture les réponses reçues par les scrapers (clients httpx partagés et
+pages du pool Playwright) dans un dossier de fixtures par source. Le ReplayServer
+sert ces fixtures en local, avec latence et erreurs injectables.
+
+Rejouer un dossier (depuis backend/):
+    python -m benchmarks.replay benchmarks/fixtures/replay/ebay --port 8081 --latency-ms 50
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from aiohttp import web
+from loguru import logger
+
+
+REPLAY_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "replay")
+
+MANIFEST = "manifest.json"
+
+
+def request_key(url: str) -> str:
+    """Clé d'une requête indépendante de l'hôte: chemin + query"""
+    parts = urlsplit(url)
+    return f"{parts.path or '/'}?{parts.query}" if parts.query else (parts.path or "/")
+
+
+class FixtureSet:
+    """Réponses enregistrées d'une source: manifest.json + un fichier par corps"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.entries: Dict[str, Dict] = {}
+
+        manifest = os.path.join(directory, MANIFEST)
+        if os.path.exists(manifest):
+            with open(manifest, encoding="utf-8") as f:
+                self.entries = json.load(f)["entries"]
+
+    def add(self, url: str, status: int, content_type: str, body: bytes):
+        key = request_key(url)
+        extension = ".json" if "json" in content_type else ".html"
+        filename = hashlib.sha1(key.encode()).hexdigest()[:12] + extension
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, filename), "wb") as f:
+            f.write(body)
+
+        self.entries[key] = {"status": status, "content_type": content_type, "file": filename}
+        logger.info(f"Recorded {key} ({status}, {len(body)} bytes)")
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, MANIFEST), "w", encoding="utf-8") as f:
+            json.dump({"entries": self.entries}, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    def lookup(self, key: str) -> Optional[Dict]:
+        """Correspondance exacte, sinon sur le chemin seul (pagination, paramètres variables)"""
+        entry = self.entries.get(key)
+        if entry is None:
+            path = key.split("?", 1)[0]
+            entry = next((e for k, e in self.entries.items() if k.split("?", 1)[0] == path), None)
+        return entry
+
+    def body(self, entry: Dict) -> bytes:
+        with open(os.path.join(self.directory, entry["file"]), "rb") as f:
+            return f.read()
+
+
+class Recorder:
+    """Capture les réponses des scrapers via les hooks des clients HTTP et du pool de navigateurs"""
+
+    def __init__(self, fixtures: FixtureSet):
+        self.fixtures = fixtures
+
+    def install(self):
+        from scrapers.browser_pool import browser_pool
+        from scrapers.http_client import http_clients
+
+        http_clients.response_hooks.append(self.on_http_response)
+        browser_pool.response_hooks.append(self.on_page_response)
+
+    async def on_http_response(self, response):
+        # Un 304 (validateurs en cache) n'a pas de corps à rejouer
+        if response.status_code == 304:
+            return
+        body = await response.aread()
+        self.fixtures.add(str(response.url), response.status_code,
+                          response.headers.get("content-type", "text/html"), body)
+
+    async def on_page_response(self, response):
+        # Seul le document principal est utile au parsing
+        if response.request.resource_type != "document":
+            return
+        body = await response.body()
+        self.fixtures.add(response.url, response.status,
+                          response.headers.get("content-type", "text/html"), body)
+
+
+class ReplayServer:
+    """
+    Serveur local qui rejoue un FixtureSet.
+    `latency_ms` (+ jitter) est ajouté à chaque réponse et une fraction
+    `error_rate` des requêtes reçoit `error_status` à la place de la fixture.
+    """
+
+    def __init__(
+        self,
+        fixtures: FixtureSet,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        host: str = "127.0.0.1",
+        port: int = 0
+    ):
+        self.fixtures = fixtures
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.errors = 0
+        self.bytes_served = 0
+        self._runner: Optional[web.AppRunner] = None
+        self._bodies: Dict[str, bytes] = {}
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> str:
+        app = web.Application()
+        app.router.add_route("GET", "/{tail:.*}", self._handle)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+
+        # Port choisi par l'OS si port=0
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self.base_url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=self.error_status, text="Injected error")
+
+        entry = self.fixtures.lookup(request.path_qs)
+        if entry is None:
+            return web.Response(status=404, text=f"No fixture for {request.path_qs}")
+
+        body = self._bodies.get(entry["file"])
+        if body is None:
+            body = self._bodies[entry["file"]] = self.fixtures.body(entry)
+
+        self.bytes_served += len(body)
+
+        # Pas d'ETag / Last-Modified au rejeu: chaque page est re-téléchargée et re-parsée
+        return web.Response(status=entry["status"], body=body, headers={"Content-Type": entry["content_type"]})
+
+
+async def serve(directory: str, port: int, latency_ms: float, jitter_ms: float, error_rate: float):
+    server = ReplayServer(FixtureSet(directory), latency_ms, jitter_ms, error_rate, port=port)
+    base_url = await server.start()
+    print(f"Replaying {len(server.fixtures.entries)} responses from {directory} on {base_url}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Replay recorded scraper responses")
+    arg_parser.add_argument("directory")
+    arg_parser.add_argument("--port", type=int, default=8081)
+    arg_parser.add_argument("--latency-ms", type=float, default=0.0)
+    arg_parser.add_argument("--jitter-ms", type=float, default=0.0)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    args = arg_parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.directory, args.port, args.latency_ms, args.jitter_ms, args.error_rate))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,255 @@
+"""
+Benchmark de débit des scrapers sur des réponses rejouées en local (aucun accès réseau).
+Chaque source est servie par un ReplayServer; le scraper complet est exécuté
+(rate limiter, retries, clients partagés, parsing) sans passer par le cache.
+
+Rapporte par source: pages/s, produits/s, ms de parsing par page et RSS max
+(process + navigateurs). Avec --baseline, échoue si le débit ou le parsing régresse.
+
+Usage (depuis backend/):
+    python -m benchmarks.throughput_benchmark [--sources ebay,shopify] [--rounds 20] [--concurrency 4]
+        [--latency-ms 50 --jitter-ms 20 --error-rate 0.05] [--json out.json]
+        [--baseline previous.json --max-regression 0.2]
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Dict, List
+
+import psutil
+from loguru import logger
+
+from benchmarks.replay import REPLAY_DIR, FixtureSet, ReplayServer
+from scrapers import resilience
+from scrapers.amazon_scraper import amazon_scraper
+from scrapers.aliexpress_scraper import aliexpress_scraper
+from scrapers.browser_pool import browser_pool
+from scrapers.cache import scraper_cache
+from scrapers.ebay_scraper import ebay_scraper
+from scrapers.http_client import http_clients
+from scrapers.shopify_scraper import shopify_scraper
+from scrapers.streaming import collect
+
+
+# Source -> scrape complet contre le serveur de rejeu (sans cache)
+SCRAPES = {
+    "amazon": lambda base_url, args: amazon_scraper._iter_bestsellers(args.category, args.limit),
+    "aliexpress": lambda base_url, args: aliexpress_scraper._iter_trending_products(args.category, args.limit),
+    "ebay": lambda base_url, args: ebay_scraper._iter_sold_items(args.category, args.limit),
+    "shopify": lambda base_url, args: shopify_scraper._iter_products(base_url, args.limit)
+}
+
+# Scrapers dont l'URL de base est redirigée vers le serveur de rejeu
+BASE_URL_OWNERS = {
+    "amazon": amazon_scraper,
+    "aliexpress": aliexpress_scraper,
+    "ebay": ebay_scraper
+}
+
+# Source -> parsing seul d'un corps de réponse
+PARSERS = {
+    "amazon": lambda body, args: amazon_scraper._parse_bestsellers(body.decode("utf-8"), args.category, args.limit),
+    "aliexpress": lambda body, args: aliexpress_scraper._parse_trending_products(body.decode("utf-8"), args.category, args.limit),
+    "ebay": lambda body, args: ebay_scraper._parse_sold_items(body.decode("utf-8"), args.category, args.limit),
+    "shopify": lambda body, args: shopify_scraper._parse_products(json.loads(body), "https://store.example/")
+}
+
+# Métriques comparées à la baseline: (nom, plus grand = meilleur)
+REGRESSION_METRICS = [("pages_per_sec", True), ("products_per_sec", True), ("parse_ms", False)]
+
+
+class RssSampler:
+    """Échantillonne la RSS du process et de ses enfants (navigateurs) pour en garder le pic"""
+
+    def __init__(self, interval: float = 0.02):
+        self.interval = interval
+        self.peak = 0
+        self._task = None
+
+    def start(self):
+        self.peak = self._rss()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> float:
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self.peak = max(self.peak, self._rss())
+        return self.peak / 1024 / 1024
+
+    async def _run(self):
+        while True:
+            self.peak = max(self.peak, self._rss())
+            await asyncio.sleep(self.interval)
+
+    def _rss(self) -> int:
+        process = psutil.Process()
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                continue
+        return total
+
+
+def measure_parse_ms(source: str, fixtures: FixtureSet, args) -> float:
+    """Temps moyen de parsing par page sur les corps enregistrés"""
+    bodies = [fixtures.body(entry) for entry in fixtures.entries.values() if entry["status"] == 200]
+    if not bodies:
+        return 0.0
+
+    start = time.perf_counter()
+    for _ in range(args.parse_repeat):
+        for body in bodies:
+            PARSERS[source](body, args)
+    return (time.perf_counter() - start) * 1000 / (args.parse_repeat * len(bodies))
+
+
+async def benchmark_source(source: str, args) -> Dict:
+    fixtures = FixtureSet(os.path.join(args.fixtures, source))
+    if not fixtures.entries:
+        return {"skipped": f"no fixtures in {fixtures.directory}"}
+
+    if source == "amazon":
+        # Le scraper absorbe les erreurs: vérifier d'abord que Chromium démarre
+        try:
+            await browser_pool.start()
+        except Exception as e:
+            return {"skipped": f"browser unavailable: {str(e).splitlines()[0]}"}
+
+    # Pas de limitation de débit contre le serveur local
+    os.environ[f"RATE_LIMIT_{source.upper()}"] = "1000000/100000"
+
+    server = ReplayServer(fixtures, args.latency_ms, args.jitter_ms, args.error_rate)
+    base_url = await server.start()
+    if source in BASE_URL_OWNERS:
+        BASE_URL_OWNERS[source].base_url = base_url
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def run_once() -> int:
+        async with semaphore:
+            return len(await collect(SCRAPES[source](base_url, args)))
+
+    sampler = RssSampler()
+    sampler.start()
+    start = time.perf_counter()
+
+    try:
+        counts: List[int] = await asyncio.gather(*(run_once() for _ in range(args.rounds)))
+    except Exception as e:
+        await sampler.stop()
+        await server.stop()
+        return {"skipped": f"{type(e).__name__}: {str(e)}"}
+
+    elapsed = time.perf_counter() - start
+    peak_rss_mb = await sampler.stop()
+    await server.stop()
+
+    pages = server.requests - server.errors
+    products = sum(counts)
+
+    if not products:
+        return {"skipped": f"no products scraped from {server.requests} requests, see scraper logs"}
+
+    return {
+        "pages": pages,
+        "products": products,
+        "injected_errors": server.errors,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(pages / elapsed, 1),
+        "products_per_sec": round(products / elapsed, 1),
+        "parse_ms": round(measure_parse_ms(source, fixtures, args), 2),
+        "peak_rss_mb": round(peak_rss_mb, 1)
+    }
+
+
+async def run_benchmark(args) -> Dict[str, Dict]:
+    # Mesure isolée: ni Redis, ni attentes de retry longues
+    scraper_cache.redis_url = None
+    resilience.circuit_breaker.redis_url = None
+    resilience.RETRY_MAX_WAIT = args.retry_max_wait
+
+    results = {}
+    try:
+        for source in args.sources:
+            results[source] = await benchmark_source(source, args)
+    finally:
+        await browser_pool.close()
+        await http_clients.aclose()
+
+    return results
+
+
+def print_results(results: Dict[str, Dict]):
+    print(f"{'source':<12} {'pages':>6} {'products':>9} {'pages/s':>9} {'products/s':>11} {'parse ms':>9} {'peak RSS MB':>12}")
+
+    for source, result in results.items():
+        if "skipped" in result:
+            print(f"{source:<12} skipped: {result['skipped']}")
+            continue
+
+        print(f"{source:<12} {result['pages']:>6} {result['products']:>9} {result['pages_per_sec']:>9.1f} "
+              f"{result['products_per_sec']:>11.1f} {result['parse_ms']:>9.2f} {result['peak_rss_mb']:>12.1f}")
+
+
+def find_regressions(results: Dict[str, Dict], baseline: Dict[str, Dict], max_regression: float) -> List[str]:
+    regressions = []
+
+    for source, result in results.items():
+        previous = baseline.get(source)
+        if not previous or "skipped" in result or "skipped" in previous:
+            continue
+
+        for metric, higher_is_better in REGRESSION_METRICS:
+            old, new = previous.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+
+            change = (new - old) / old
+            if (higher_is_better and change < -max_regression) or (not higher_is_better and change > max_regression):
+                regressions.append(f"{source} {metric}: {old} -> {new} ({change:+.0%})")
+
+    return regressions
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Offline throughput benchmark for scrapers")
+    arg_parser.add_argument("--sources", default="aliexpress,ebay,shopify,amazon")
+    arg_parser.add_argument("--fixtures", default=REPLAY_DIR)
+    arg_parser.add_argument("--category", default="electronics")
+    arg_parser.add_argument("--limit", type=int, default=50)
+    arg_parser.add_argument("--rounds", type=int, default=20)
+    arg_parser.add_argument("--concurrency", type=int, default=4)
+    arg_parser.add_argument("--latency-ms", type=float, default=0.0)
+    arg_parser.add_argument("--jitter-ms", type=float, default=0.0)
+    arg_parser.add_argument("--error-rate", type=float, default=0.0)
+    arg_parser.add_argument("--retry-max-wait", type=float, default=0.2)
+    arg_parser.add_argument("--parse-repeat", type=int, default=10)
+    arg_parser.add_argument("--json", dest="json_path")
+    arg_parser.add_argument("--baseline")
+    arg_parser.add_argument("--max-regression", type=float, default=0.2)
+    args = arg_parser.parse_args()
+    args.sources = [s.strip() for s in args.sources.split(",") if s.strip()]
+
+    # Les logs par produit fausseraient la mesure
+    logger.disable("scrapers")
+
+    results = asyncio.run(run_benchmark(args))
+    print_results(results)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = find_regressions(results, json.load(f), args.max_regression)
+
+        if regressions:
+            raise SystemExit("Performance regressions:\n" + "\n".join(regressions))
@@ -1,5 +1,6 @@
 from celery import Celery
 from celery.schedules import crontab
+from celery.signals import worker_process_shutdown, worker_shutdown
 import os
 from dotenv import load_dotenv
 
@@ -34,15 +35,30 @@ app.conf.update(
 
 # Planification des tâches périodiques
 app.conf.beat_schedule = {
-    # Scraping quotidien à 2h du matin
-    'scrape-all-sources-daily': {
-        'task': 'tasks.scraping_tasks.scrape_all_sources',
-        'schedule': crontab(hour=2, minute=0),
+    # Ajout des listings au frontier de crawl (les jobs existants gardent leur échéance)
+    'seed-crawl-frontier-hourly': {
+        'task': 'tasks.scraping_tasks.seed_crawl_frontier',
+        'schedule': crontab(minute=5),
     },
-    # Mise à jour des prix toutes les 6h
-    'update-prices-6h': {
+    # Crawl des jobs dus du frontier, réparti sur tous les workers disponibles
+    'crawl-frontier-every-minute': {
+        'task': 'tasks.scraping_tasks.crawl_frontier_batch',
+        'schedule': crontab(),
+    },
+    # Rafraîchissement des prix arrivés à échéance (intervalle propre à chaque produit)
+    'update-prices-every-15-minutes': {
         'task': 'tasks.scraping_tasks.update_prices',
-        'schedule': crontab(minute=0, hour='*/6'),
+        'schedule': crontab(minute='*/15'),
+    },
+    # Partitions mensuelles de l'historique des prix (création à l'avance, détachement)
+    'maintain-price-history-daily': {
+        'task': 'tasks.scraping_tasks.maintain_price_history',
+        'schedule': crontab(hour=2, minute=30),
+    },
+    # Rapprochement des produits nouveaux ou modifiés (groupes entre sources)
+    'match-products-every-30-minutes': {
+        'task': 'tasks.scraping_tasks.match_products',
+        'schedule': crontab(minute='20,50'),
     },
     # Calcul des tendances quotidien à 3h du matin
     'calculate-trends-daily': {
@@ -61,5 +77,31 @@ app.conf.beat_schedule = {
     },
 }
 
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def shutdown_scraper_resources(**kwargs):
+    """
+    Libérer les ressources persistantes du worker (navigateurs, boucle async)
+    """
+    from loguru import logger
+    from scrapers.utils import run_async, close_worker_loop
+    from scrapers.browser_pool import browser_pool
+    from scrapers.http_client import http_clients
+    from scrapers.cache import scraper_cache
+    from scrapers.frontier import crawl_frontier
+
+    try:
+        run_async(browser_pool.close())
+        run_async(http_clients.aclose())
+        run_async(scraper_cache.aclose())
+        run_async(crawl_frontier.aclose())
+    except Exception as e:
+        logger.error(f"Error closing scraper resources: {str(e)}")
+    finally:
+        close_worker_loop()
+
+
 if __name__ == '__main__':
     app.start()
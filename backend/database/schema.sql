@@ -1,5 +1,20 @@
 -- E-Commerce Scraper Database Schema
 
+-- Clé d'URL normalisée des produits: schéma, www, query string, fragment et slash final
+-- ignorés, fiches Amazon ramenées à /dp/<ASIN> (même définition que models.py)
+CREATE OR REPLACE FUNCTION product_url_key(url TEXT) RETURNS TEXT AS $$
+    SELECT regexp_replace(
+        regexp_replace(
+            regexp_replace(
+                regexp_replace(lower(url), '^([a-z]+:)?//(www\.)?', ''),
+                '[?#].*$', ''),
+            '^(amazon\.[a-z.]+)/(.*/)?(dp|gp/product)/([a-z0-9]{10})([/].*)?$', '\1/dp/\4'),
+        '/+$', '')
+$$ LANGUAGE SQL IMMUTABLE;
+
+-- Recherche floue (trigrammes) sur le nom des produits
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 -- Products table
 CREATE TABLE IF NOT EXISTS products (
     id SERIAL PRIMARY KEY,
@@ -7,25 +22,135 @@ CREATE TABLE IF NOT EXISTS products (
     categorie VARCHAR(200),
     prix DECIMAL(10, 2) NOT NULL,
     url TEXT NOT NULL,
+    url_key TEXT GENERATED ALWAYS AS (product_url_key(url)) STORED, -- Clé de déduplication
     source VARCHAR(50) NOT NULL, -- amazon, aliexpress, ebay, shopify
-    date_scrape TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    date_scrape TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
     image_url TEXT,
     description TEXT,
     asin VARCHAR(20), -- Amazon ASIN
     reviews_count INTEGER DEFAULT 0,
     rating DECIMAL(3, 2),
     stock_status VARCHAR(50),
+    content_hash VARCHAR(32), -- Empreinte du dernier contenu scrapé
+    last_seen_at TIMESTAMP, -- Dernier scrape, même sans changement (date_scrape = dernier changement)
+    next_refresh_at TIMESTAMP, -- Prochain rafraîchissement du prix (planifié selon la volatilité)
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(nom, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ) STORED, -- Recherche plein texte (nom prioritaire sur la description)
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
--- Price history table
+-- Colonnes ajoutées après la création initiale (bases existantes)
+ALTER TABLE products ADD COLUMN IF NOT EXISTS next_refresh_at TIMESTAMP;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS content_hash VARCHAR(32);
+ALTER TABLE products ADD COLUMN IF NOT EXISTS last_seen_at TIMESTAMP;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS url_key TEXT GENERATED ALWAYS AS (product_url_key(url)) STORED;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', coalesce(nom, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+) STORED;
+
+-- date_scrape sert de clé de tri à la pagination par curseur: jamais NULL
+UPDATE products SET date_scrape = COALESCE(created_at, CURRENT_TIMESTAMP) WHERE date_scrape IS NULL;
+ALTER TABLE products ALTER COLUMN date_scrape SET NOT NULL;
+
+-- Price history table, partitionnée par mois sur date.
+-- Les partitions mensuelles sont créées à l'avance et détachées après la
+-- période de rétention par la tâche maintain_price_history.
+-- Une table non partitionnée existante devient la partition price_history_legacy.
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class WHERE relname = 'price_history' AND relkind = 'r') THEN
+        ALTER TABLE price_history RENAME TO price_history_legacy;
+        ALTER TABLE price_history_legacy RENAME CONSTRAINT price_history_pkey TO price_history_legacy_pkey;
+        ALTER INDEX IF EXISTS idx_price_history_product_id RENAME TO idx_price_history_legacy_product_id;
+        ALTER INDEX IF EXISTS idx_price_history_date RENAME TO idx_price_history_legacy_date;
+        UPDATE price_history_legacy SET date = CURRENT_TIMESTAMP WHERE date IS NULL;
+        ALTER TABLE price_history_legacy ALTER COLUMN date SET NOT NULL;
+    END IF;
+END $$;
+
 CREATE TABLE IF NOT EXISTS price_history (
-    id SERIAL PRIMARY KEY,
+    id SERIAL,
     product_id INTEGER REFERENCES products(id) ON DELETE CASCADE,
     prix DECIMAL(10, 2) NOT NULL,
-    date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    source VARCHAR(50) NOT NULL
+    date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    source VARCHAR(50) NOT NULL,
+    PRIMARY KEY (id, date)
+) PARTITION BY RANGE (date);
+
+-- Lignes hors des partitions mensuelles existantes
+CREATE TABLE IF NOT EXISTS price_history_default PARTITION OF price_history DEFAULT;
+
+-- Ancienne table: rattachée pour tout ce qui précède le mois prochain
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class WHERE relname = 'price_history_legacy' AND relkind = 'r')
+        AND NOT EXISTS (SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass('price_history_legacy')) THEN
+        PERFORM setval(
+            pg_get_serial_sequence('price_history', 'id'),
+            COALESCE((SELECT MAX(id) FROM price_history_legacy), 0) + 1,
+            false
+        );
+        EXECUTE format(
+            'ALTER TABLE price_history ATTACH PARTITION price_history_legacy FOR VALUES FROM (MINVALUE) TO (%L)',
+            date_trunc('month', CURRENT_DATE) + INTERVAL '1 month'
+        );
+    END IF;
+END $$;
+
+-- Rollups journalier et hebdomadaire (semaines ISO, lundi) de l'historique,
+-- maintenus à chaque écriture d'historique: moyenne = sum_prix / sample_count
+CREATE TABLE IF NOT EXISTS price_history_daily (
+    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    bucket DATE NOT NULL,
+    min_prix DECIMAL(10, 2) NOT NULL,
+    max_prix DECIMAL(10, 2) NOT NULL,
+    sum_prix DECIMAL(14, 2) NOT NULL,
+    sample_count INTEGER NOT NULL,
+    last_prix DECIMAL(10, 2) NOT NULL,
+    last_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (product_id, bucket)
+);
+
+CREATE TABLE IF NOT EXISTS price_history_weekly (
+    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    bucket DATE NOT NULL,
+    min_prix DECIMAL(10, 2) NOT NULL,
+    max_prix DECIMAL(10, 2) NOT NULL,
+    sum_prix DECIMAL(14, 2) NOT NULL,
+    sample_count INTEGER NOT NULL,
+    last_prix DECIMAL(10, 2) NOT NULL,
+    last_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (product_id, bucket)
+);
+
+-- Relevés par produit et par jour, prix changé ou non (price_history ne reçoit que les
+-- changements de prix): mesure de l'activité de scraping d'un produit
+CREATE TABLE IF NOT EXISTS product_observations_daily (
+    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    bucket DATE NOT NULL,
+    observations INTEGER NOT NULL,
+    PRIMARY KEY (product_id, bucket)
+);
+
+-- Groupes de produits identiques entre sources (analytics.product_matching):
+-- cluster_id est l'id d'un produit membre du groupe
+CREATE TABLE IF NOT EXISTS product_clusters (
+    product_id INTEGER PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+    cluster_id INTEGER NOT NULL,
+    signature BYTEA, -- Signature MinHash du titre normalisé
+    content_hash VARCHAR(32), -- Empreinte du produit au moment du rapprochement
+    matched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Bandes LSH des signatures MinHash (candidats au rapprochement)
+CREATE TABLE IF NOT EXISTS product_lsh_bands (
+    band_key BIGINT NOT NULL,
+    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    PRIMARY KEY (band_key, product_id)
 );
 
 -- Competitors table
@@ -84,13 +209,68 @@ CREATE TABLE IF NOT EXISTS shopify_stores (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Fusion des doublons existants (même url_key) avant l'index unique:
+-- le produit le plus récent est conservé et reprend l'historique et les alertes des autres
+CREATE TEMP TABLE product_duplicates AS
+SELECT id, keep_id FROM (
+    SELECT id, MAX(id) OVER (PARTITION BY url_key) AS keep_id FROM products
+) ranked
+WHERE id <> keep_id;
+
+UPDATE price_history SET product_id = d.keep_id FROM product_duplicates d WHERE price_history.product_id = d.id;
+UPDATE alerts SET product_id = d.keep_id FROM product_duplicates d WHERE alerts.product_id = d.id;
+DELETE FROM products USING product_duplicates d WHERE products.id = d.id;
+DROP TABLE product_duplicates;
+
+-- Remplissage initial des rollups depuis l'historique existant
+INSERT INTO price_history_daily (product_id, bucket, min_prix, max_prix, sum_prix, sample_count, last_prix, last_at)
+SELECT product_id, CAST(date_trunc('day', date) AS DATE), MIN(prix), MAX(prix), SUM(prix), COUNT(*),
+    (ARRAY_AGG(prix ORDER BY date DESC))[1], MAX(date)
+FROM price_history
+WHERE product_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM price_history_daily)
+GROUP BY product_id, CAST(date_trunc('day', date) AS DATE);
+
+INSERT INTO price_history_weekly (product_id, bucket, min_prix, max_prix, sum_prix, sample_count, last_prix, last_at)
+SELECT product_id, CAST(date_trunc('week', date) AS DATE), MIN(prix), MAX(prix), SUM(prix), COUNT(*),
+    (ARRAY_AGG(prix ORDER BY date DESC))[1], MAX(date)
+FROM price_history
+WHERE product_id IS NOT NULL AND NOT EXISTS (SELECT 1 FROM price_history_weekly)
+GROUP BY product_id, CAST(date_trunc('week', date) AS DATE);
+
+-- Relevés initiaux: une entrée d'historique par scrape avant l'historisation sur changement
+INSERT INTO product_observations_daily (product_id, bucket, observations)
+SELECT product_id, CAST(date_trunc('day', date) AS DATE), COUNT(*)
+FROM price_history
+WHERE product_id IS NOT NULL AND date >= CURRENT_DATE - INTERVAL '120 days'
+    AND NOT EXISTS (SELECT 1 FROM product_observations_daily)
+GROUP BY product_id, CAST(date_trunc('day', date) AS DATE);
+
 -- Indexes for performance
-CREATE INDEX IF NOT EXISTS idx_products_categorie ON products(categorie);
-CREATE INDEX IF NOT EXISTS idx_products_source ON products(source);
-CREATE INDEX IF NOT EXISTS idx_products_date_scrape ON products(date_scrape);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_products_url_key ON products(url_key);
+-- Pagination par curseur de /api/products: (clé de tri, id) par tri, seul ou précédé de categorie / source.
+-- Ils couvrent aussi les filtres simples sur categorie, source et date_scrape (anciens index remplacés).
+DROP INDEX IF EXISTS idx_products_categorie;
+DROP INDEX IF EXISTS idx_products_source;
+DROP INDEX IF EXISTS idx_products_date_scrape;
+CREATE INDEX IF NOT EXISTS idx_products_date_scrape_id ON products(date_scrape DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_products_prix_id ON products(prix, id);
+CREATE INDEX IF NOT EXISTS idx_products_rating_id ON products((COALESCE(rating, 0)) DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_products_categorie_date_scrape_id ON products(categorie, date_scrape DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_products_categorie_prix_id ON products(categorie, prix, id);
+CREATE INDEX IF NOT EXISTS idx_products_categorie_rating_id ON products(categorie, (COALESCE(rating, 0)) DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_products_source_date_scrape_id ON products(source, date_scrape DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_products_source_prix_id ON products(source, prix, id);
+CREATE INDEX IF NOT EXISTS idx_products_source_rating_id ON products(source, (COALESCE(rating, 0)) DESC, id DESC);
+-- Recherche /api/products/search: plein texte (nom + description) et trigrammes (nom, aussi utilisé par ILIKE '%...%')
+CREATE INDEX IF NOT EXISTS idx_products_search_vector ON products USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_products_nom_trgm ON products USING GIN (nom gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_products_next_refresh_at ON products(next_refresh_at);
 CREATE INDEX IF NOT EXISTS idx_price_history_product_id ON price_history(product_id);
 CREATE INDEX IF NOT EXISTS idx_price_history_date ON price_history(date);
+CREATE INDEX IF NOT EXISTS idx_price_history_product_date ON price_history(product_id, date);
 CREATE INDEX IF NOT EXISTS idx_competitors_product_id ON competitors(product_id);
+CREATE INDEX IF NOT EXISTS idx_product_clusters_cluster_id ON product_clusters(cluster_id);
+CREATE INDEX IF NOT EXISTS idx_product_lsh_bands_product_id ON product_lsh_bands(product_id);
 CREATE INDEX IF NOT EXISTS idx_trends_product_id ON trends(product_id);
 CREATE INDEX IF NOT EXISTS idx_trends_score_tendance ON trends(score_tendance DESC);
 CREATE INDEX IF NOT EXISTS idx_alerts_product_id ON alerts(product_id);
@@ -1,8 +1,9 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
 from sqlalchemy import text
-from models import get_db, Base, engine
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import get_async_db, Base, engine, async_engine
 import os
 from dotenv import load_dotenv
 
@@ -11,10 +12,19 @@ load_dotenv()
 # Create tables
 Base.metadata.create_all(bind=engine)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Fermer les connexions du pool async à l'arrêt du worker
+    await async_engine.dispose()
+
+
 app = FastAPI(
     title="E-Commerce Scraper API",
     description="API pour la plateforme de veille e-commerce",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS configuration
@@ -24,6 +34,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-History-Resolution"],  # Lus par le frontend (pagination, historique)
 )
 
 # Import routes
@@ -45,10 +56,10 @@ async def root():
 
 
 @app.get("/health")
-async def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_async_db)):
     try:
         # Test database connection
-        db.execute(text("SELECT 1"))
+        await db.execute(text("SELECT 1"))
         return {"status": "healthy", "database": "connected"}
     except Exception as e:
         return {"status": "unhealthy", "error": str(e)}
@@ -1,9 +1,31 @@
-import httpx
-from bs4 import BeautifulSoup
 from typing import List, Dict, Optional
 from loguru import logger
-from scrapers.utils import get_headers, rate_limiter, scraper_cache, handle_scraping_error
+from scrapers.utils import get_headers, handle_scraping_error
+from scrapers.cache import scraper_cache
+from scrapers.http_client import conditional_get
+from scrapers.parsing import SelectorSet, parse_html
+from scrapers.streaming import ProductStream, collect, stream_cached
 import json
+import re
+
+
+# Affectation de window.runParams (le décodage commence à l'accolade ouvrante)
+_RUN_PARAMS = re.compile(r'window\.runParams\s*=\s*(?=\{)')
+
+_json_decoder = json.JSONDecoder()
+
+# Identifiant produit dans une URL /item/<id>.html
+_ITEM_ID = re.compile(r'/item/(\d+)\.html')
+
+
+# Sélecteurs précompilés pour les pages AliExpress
+SELECTORS = SelectorSet(
+    item="div.list-item",
+    title="a.item-title",
+    price="span.price-current",
+    image="img",
+    description="div.product-description"
+)
 
 
 class AliExpressScraper:
@@ -18,171 +40,204 @@ class AliExpressScraper:
         Scraper les produits tendances AliExpress
         """
         cache_key = f"aliexpress_trending_{category}"
-        cached_data = scraper_cache.get(cache_key)
+        return await scraper_cache.get_or_set(cache_key, lambda: collect(self._iter_trending_products(category, limit)))
+    
+    def iter_trending_products(self, category: str = "electronics", limit: int = 50) -> ProductStream:
+        """
+        Produits tendances AliExpress en flux
+        """
+        cache_key = f"aliexpress_trending_{category}"
+        return stream_cached(cache_key, lambda: self._iter_trending_products(category, limit))
+    
+    async def _iter_trending_products(self, category: str, limit: int) -> ProductStream:
+        # URL de recherche pour produits tendances
+        url = f"{self.base_url}/wholesale?SearchText={category}&SortType=total_tranpro_desc"
+        
+        try:
+            logger.info(f"Scraping AliExpress trending: {url}")
+            
+            # Le résultat parsé d'une page est conservé entier pour les réponses 304
+            products = await conditional_get(
+                "aliexpress", url, self.headers,
+                parse=lambda response: self._parse_trending_products(response.text, category, limit),
+                variant=str(limit)
+            )
+        
+        except Exception as e:
+            error = handle_scraping_error(e, "aliexpress", url)
+            return
         
-        if cached_data:
-            return cached_data
+        for product in products:
+            yield product
         
+        logger.info(f"Successfully scraped {len(products)} AliExpress products")
+    
+    def _parse_trending_products(self, html: str, category: str, limit: int) -> List[Dict]:
+        """
+        Parser la page de recherche AliExpress (JSON embarqué puis fallback HTML)
+        """
         products = []
         
-        try:
-            async with httpx.AsyncClient(
-                headers=self.headers, 
-                timeout=30.0,
-                follow_redirects=True
-            ) as client:
-                # URL de recherche pour produits tendances
-                url = f"{self.base_url}/wholesale?SearchText={category}&SortType=total_tranpro_desc"
-                
-                logger.info(f"Scraping AliExpress trending: {url}")
-                rate_limiter.wait()
-                
-                response = await client.get(url)
-                response.raise_for_status()
-                
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # Chercher les données JSON embarquées (AliExpress utilise du JavaScript)
-                script_tags = soup.find_all('script')
-                
-                for script in script_tags:
-                    if script.string and 'window.runParams' in script.string:
-                        # Extraire les données JSON
-                        try:
-                            json_start = script.string.find('{')
-                            json_end = script.string.rfind('}') + 1
-                            json_data = json.loads(script.string[json_start:json_end])
-                            
-                            # Parser les produits depuis les données JSON
-                            if 'mods' in json_data and 'itemList' in json_data['mods']:
-                                items = json_data['mods']['itemList']['content'][:limit]
-                                
-                                for item in items:
-                                    try:
-                                        product = {
-                                            "nom": item.get('title', {}).get('displayTitle', 'Unknown'),
-                                            "prix": float(item.get('prices', {}).get('salePrice', {}).get('minPrice', 0)),
-                                            "url": f"https:{item.get('productDetailUrl', '')}",
-                                            "source": "aliexpress",
-                                            "categorie": category,
-                                            "image_url": f"https:{item.get('image', {}).get('imgUrl', '')}",
-                                            "rating": float(item.get('evaluation', {}).get('starRating', 0)),
-                                            "reviews_count": int(item.get('trade', {}).get('tradeDesc', '0').replace('+', '').replace('sold', '').strip() or 0),
-                                            "stock_status": "in_stock"
-                                        }
-                                        
-                                        products.append(product)
-                                        logger.info(f"Scraped AliExpress product: {product['nom'][:50]}...")
-                                    
-                                    except Exception as e:
-                                        logger.error(f"Error parsing AliExpress item: {str(e)}")
-                                        continue
-                            
-                            break
-                        
-                        except json.JSONDecodeError:
-                            continue
+        # Chemin rapide: décoder le JSON runParams dans le texte brut,
+        # sans construire d'arbre HTML
+        items = self._extract_run_params_items(html, limit)
+        
+        for item in items or []:
+            try:
+                product = {
+                    "nom": item.get('title', {}).get('displayTitle', 'Unknown'),
+                    "prix": float(item.get('prices', {}).get('salePrice', {}).get('minPrice', 0)),
+                    "url": f"https:{item.get('productDetailUrl', '')}",
+                    "source": "aliexpress",
+                    "categorie": category,
+                    "image_url": f"https:{item.get('image', {}).get('imgUrl', '')}",
+                    "rating": float(item.get('evaluation', {}).get('starRating', 0)),
+                    "reviews_count": int(item.get('trade', {}).get('tradeDesc', '0').replace('+', '').replace('sold', '').strip() or 0),
+                    "stock_status": "in_stock"
+                }
                 
-                # Si pas de données JSON, fallback sur parsing HTML classique
-                if not products:
-                    product_items = soup.find_all('div', {'class': 'list-item'})[:limit]
+                products.append(product)
+                logger.info(f"Scraped AliExpress product: {product['nom'][:50]}...")
+            
+            except Exception as e:
+                logger.error(f"Error parsing AliExpress item: {str(e)}")
+                continue
+        
+        # Si pas de données JSON, fallback sur parsing HTML classique
+        if not products:
+            doc = parse_html(html)
+            product_items = doc.select(SELECTORS.item, limit)
+            
+            for item in product_items:
+                try:
+                    title_elem = item.select_one(SELECTORS.title)
+                    title = title_elem.text.strip() if title_elem else "Unknown"
                     
-                    for item in product_items:
+                    price_elem = item.select_one(SELECTORS.price)
+                    price = 0.0
+                    if price_elem:
+                        price_text = price_elem.text.replace('$', '').replace(',', '').strip()
                         try:
-                            title_elem = item.find('a', {'class': 'item-title'})
-                            title = title_elem.text.strip() if title_elem else "Unknown"
-                            
-                            price_elem = item.find('span', {'class': 'price-current'})
+                            price = float(price_text)
+                        except:
                             price = 0.0
-                            if price_elem:
-                                price_text = price_elem.text.replace('$', '').replace(',', '').strip()
-                                try:
-                                    price = float(price_text)
-                                except:
-                                    price = 0.0
-                            
-                            link_elem = item.find('a', {'class': 'item-title'})
-                            product_url = link_elem['href'] if link_elem and 'href' in link_elem.attrs else ""
-                            if product_url and not product_url.startswith('http'):
-                                product_url = f"https:{product_url}"
-                            
-                            img_elem = item.find('img')
-                            image_url = img_elem['src'] if img_elem and 'src' in img_elem.attrs else ""
-                            if image_url and not image_url.startswith('http'):
-                                image_url = f"https:{image_url}"
-                            
-                            product = {
-                                "nom": title,
-                                "prix": price,
-                                "url": product_url,
-                                "source": "aliexpress",
-                                "categorie": category,
-                                "image_url": image_url,
-                                "rating": 0.0,
-                                "reviews_count": 0,
-                                "stock_status": "in_stock"
-                            }
-                            
-                            products.append(product)
-                            logger.info(f"Scraped AliExpress product (HTML): {title[:50]}...")
-                        
-                        except Exception as e:
-                            logger.error(f"Error parsing AliExpress product: {str(e)}")
-                            continue
-                
-                # Mettre en cache
-                scraper_cache.set(cache_key, products)
+                    
+                    link_elem = item.select_one(SELECTORS.title)
+                    href = link_elem.attr('href') if link_elem else None
+                    product_url = href if href is not None else ""
+                    if product_url and not product_url.startswith('http'):
+                        product_url = f"https:{product_url}"
+                    
+                    img_elem = item.select_one(SELECTORS.image)
+                    src = img_elem.attr('src') if img_elem else None
+                    image_url = src if src is not None else ""
+                    if image_url and not image_url.startswith('http'):
+                        image_url = f"https:{image_url}"
+                    
+                    product = {
+                        "nom": title,
+                        "prix": price,
+                        "url": product_url,
+                        "source": "aliexpress",
+                        "categorie": category,
+                        "image_url": image_url,
+                        "rating": 0.0,
+                        "reviews_count": 0,
+                        "stock_status": "in_stock"
+                    }
+                    
+                    products.append(product)
+                    logger.info(f"Scraped AliExpress product (HTML): {title[:50]}...")
                 
-                logger.info(f"Successfully scraped {len(products)} AliExpress products")
-                return products
+                except Exception as e:
+                    logger.error(f"Error parsing AliExpress product: {str(e)}")
+                    continue
         
-        except Exception as e:
-            error = handle_scraping_error(e, "aliexpress", url)
-            return []
+        return products
+    
+    def _extract_run_params_items(self, html: str, limit: int) -> Optional[List[Dict]]:
+        """
+        Extraire mods.itemList.content de window.runParams directement dans le
+        texte brut: l'objet est décodé avec raw_decode depuis son accolade ouvrante,
+        puis parcouru explicitement. Retourne None si le payload est absent.
+        """
+        for match in _RUN_PARAMS.finditer(html):
+            try:
+                run_params, _ = _json_decoder.raw_decode(html, match.end())
+            except ValueError as e:
+                logger.warning(f"Invalid AliExpress runParams payload: {str(e)}")
+                continue
+            
+            mods = run_params.get('mods') if isinstance(run_params, dict) else None
+            item_list = mods.get('itemList') if isinstance(mods, dict) else None
+            content = item_list.get('content') if isinstance(item_list, dict) else None
+            
+            # La page peut initialiser window.runParams à vide avant le vrai payload
+            if isinstance(content, list):
+                return content[:limit]
+        
+        return None
     
     async def scrape_product_details(self, product_id: str) -> Optional[Dict]:
         """
         Scraper les détails d'un produit AliExpress
         """
         cache_key = f"aliexpress_product_{product_id}"
-        cached_data = scraper_cache.get(cache_key)
-        
-        if cached_data:
-            return cached_data
+        return await scraper_cache.get_or_set(cache_key, lambda: self._scrape_product_details(product_id))
+    
+    async def _scrape_product_details(self, product_id: str) -> Optional[Dict]:
+        url = f"{self.base_url}/item/{product_id}.html"
         
         try:
-            async with httpx.AsyncClient(
-                headers=self.headers, 
-                timeout=30.0,
-                follow_redirects=True
-            ) as client:
-                url = f"{self.base_url}/item/{product_id}.html"
-                
-                logger.info(f"Scraping AliExpress product details: {url}")
-                rate_limiter.wait()
-                
-                response = await client.get(url)
-                response.raise_for_status()
-                
-                soup = BeautifulSoup(response.text, 'html.parser')
-                
-                # Extraire description
-                description_elem = soup.find('div', {'class': 'product-description'})
-                description = description_elem.text.strip() if description_elem else ""
-                
-                product_details = {
-                    "product_id": product_id,
-                    "description": description,
-                    "url": url
-                }
-                
-                scraper_cache.set(cache_key, product_details)
-                
-                return product_details
+            logger.info(f"Scraping AliExpress product details: {url}")
+            
+            return await conditional_get(
+                "aliexpress", url, self.headers,
+                parse=lambda response: self._parse_product_details(response.text, product_id, url)
+            )
         
         except Exception as e:
-            handle_scraping_error(e, "aliexpress", f"{self.base_url}/item/{product_id}.html")
+            handle_scraping_error(e, "aliexpress", url)
+            return None
+    
+    async def fetch_current_price(self, product_url: str) -> Optional[float]:
+        """
+        Prix actuel d'un produit à partir de son URL, sans passer par le cache
+        """
+        match = _ITEM_ID.search(product_url or "")
+        if not match:
             return None
+        
+        details = await self._scrape_product_details(match.group(1))
+        return details.get("prix") if details else None
+    
+    def _parse_product_details(self, html: str, product_id: str, url: str) -> Dict:
+        """
+        Parser la page produit AliExpress
+        """
+        doc = parse_html(html)
+        
+        # Extraire description
+        description_elem = doc.select_one(SELECTORS.description)
+        description = description_elem.text.strip() if description_elem else ""
+        
+        # Extraire le prix actuel
+        price = None
+        price_elem = doc.select_one(SELECTORS.price)
+        if price_elem:
+            try:
+                price = float(price_elem.text.replace('$', '').replace(',', '').strip())
+            except ValueError:
+                price = None
+        
+        product_details = {
+            "product_id": product_id,
+            "description": description,
+            "prix": price,
+            "url": url
+        }
+        
+        return product_details
 
 
 # Instance globale
@@ -1,9 +1,45 @@
-from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional
 from loguru import logger
-from scrapers.utils import get_headers, rate_limiter, scraper_cache, handle_scraping_error
+from scrapers.utils import get_headers, handle_scraping_error
+from scrapers.cache import scraper_cache
+from scrapers.rate_limiter import rate_limiter
+from scrapers.browser_pool import browser_pool
+from scrapers.proxy_rotator import proxy_rotator
+from scrapers.resilience import RETRYABLE_STATUS_CODES, RetryableStatusError, resilient_fetch
+from scrapers.parsing import SelectorSet, parse_html
+from scrapers.streaming import ProductStream, collect, stream_cached
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from collections import deque
 import asyncio
+import os
+import time
+
+
+# Sélecteurs précompilés pour les pages Amazon
+SELECTORS = SelectorSet(
+    item="div.zg-grid-general-faceout",
+    title="div._cDEzb_p13n-sc-css-line-clamp-3_g3dy1",
+    link="a.a-link-normal",
+    price="span.a-price-whole",
+    image="img",
+    rating="span.a-icon-alt",
+    reviews="span.a-size-small",
+    description="div#feature-bullets",
+    detail_price="#corePrice_feature_div span.a-offscreen, #corePrice_desktop span.a-offscreen",
+    product_ready="#productTitle, #feature-bullets"
+)
+
+# Mode lean: ressources lourdes bloquées et attente d'un sélecteur au lieu de networkidle + sleep
+LEAN_MODE = os.getenv("AMAZON_LEAN_MODE", "true").lower() == "true"
+
+# Page "Robot Check" servie à la place du contenu quand l'IP est bloquée
+CAPTCHA_MARKER = "/errors/validateCaptcha"
+
+# Délai max d'attente du sélecteur de contenu (ms)
+READY_TIMEOUT_MS = 15000
+
+# Pages chargées en parallèle lors de l'enrichissement par lot
+DETAIL_CONCURRENCY = int(os.getenv("AMAZON_DETAIL_CONCURRENCY", "4"))
 
 
 class AmazonScraper:
@@ -12,173 +48,306 @@ class AmazonScraper:
     def __init__(self):
         self.base_url = "https://www.amazon.com"
         self.headers = get_headers()
+        self.page_timings = deque(maxlen=500)
     
     async def scrape_bestsellers(self, category: str = "electronics", limit: int = 50) -> List[Dict]:
         """
         Scraper les bestsellers Amazon
         """
         cache_key = f"amazon_bestsellers_{category}"
-        cached_data = scraper_cache.get(cache_key)
+        return await scraper_cache.get_or_set(cache_key, lambda: collect(self._iter_bestsellers(category, limit)))
+    
+    def iter_bestsellers(self, category: str = "electronics", limit: int = 50) -> ProductStream:
+        """
+        Bestsellers Amazon en flux, produits au fil du parsing
+        """
+        cache_key = f"amazon_bestsellers_{category}"
+        return stream_cached(cache_key, lambda: self._iter_bestsellers(category, limit))
+    
+    async def _iter_bestsellers(self, category: str, limit: int) -> ProductStream:
+        # URL des bestsellers
+        url = f"{self.base_url}/Best-Sellers-{category}/zgbs/{category}"
         
-        if cached_data:
-            return cached_data
+        try:
+            logger.info(f"Scraping Amazon bestsellers: {url}")
+            content = await self._load_page(url, ready_selector=SELECTORS.item.css)
         
-        products = []
+        except Exception as e:
+            error = handle_scraping_error(e, "amazon", url)
+            return
         
-        try:
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(headless=True)
-                context = await browser.new_context(user_agent=self.headers["User-Agent"])
-                page = await context.new_page()
-                
-                # URL des bestsellers
-                url = f"{self.base_url}/Best-Sellers-{category}/zgbs/{category}"
-                
-                logger.info(f"Scraping Amazon bestsellers: {url}")
-                rate_limiter.wait()
+        count = 0
+        for product in self._iter_parse_bestsellers(content, category, limit):
+            count += 1
+            yield product
+        
+        logger.info(f"Successfully scraped {count} Amazon products")
+    
+    async def _load_page(self, url: str, ready_selector: str) -> str:
+        """
+        Charger une page via le pool de navigateurs et retourner son HTML.
+        Les erreurs transitoires sont retentées, derrière le circuit breaker Amazon.
+        """
+        return await resilient_fetch("amazon", lambda: self._fetch_page(url, ready_selector))
+    
+    async def _fetch_page(self, url: str, ready_selector: str) -> str:
+        """
+        Un essai de chargement de page; son temps de chargement est mesuré et conservé
+        """
+        await rate_limiter.acquire("amazon", url)
+        
+        async with proxy_rotator.lease() as lease:
+            async with browser_pool.page(user_agent=self.headers["User-Agent"], lean=LEAN_MODE, proxy=lease.proxy) as page:
+                start = time.perf_counter()
                 
-                await page.goto(url, wait_until="networkidle")
-                await asyncio.sleep(2)  # Attendre le chargement complet
+                if LEAN_MODE:
+                    response = await page.goto(url, wait_until="domcontentloaded")
+                else:
+                    response = await page.goto(url, wait_until="networkidle")
                 
-                # Extraire le HTML
-                content = await page.content()
-                soup = BeautifulSoup(content, 'html.parser')
+                if response:
+                    lease.report(response.status, latency=time.perf_counter() - start)
+                    await rate_limiter.observe("amazon", url, response.status, response.headers)
+                    
+                    if response.status in RETRYABLE_STATUS_CODES:
+                        raise RetryableStatusError(response.status, url)
                 
-                # Parser les produits
-                product_items = soup.find_all('div', {'class': 'zg-grid-general-faceout'})[:limit]
+                navigated = time.perf_counter()
                 
-                for item in product_items:
+                if LEAN_MODE:
+                    # Prêt dès que le contenu utile est présent dans le DOM
                     try:
-                        # Nom du produit
-                        title_elem = item.find('div', {'class': '_cDEzb_p13n-sc-css-line-clamp-3_g3dy1'})
-                        if not title_elem:
-                            title_elem = item.find('a', {'class': 'a-link-normal'})
-                        
-                        title = title_elem.text.strip() if title_elem else "Unknown"
-                        
-                        # Prix
-                        price_elem = item.find('span', {'class': 'a-price-whole'})
-                        price = 0.0
-                        if price_elem:
-                            price_text = price_elem.text.replace(',', '').replace('$', '').strip()
-                            try:
-                                price = float(price_text)
-                            except:
-                                price = 0.0
-                        
-                        # URL
-                        link_elem = item.find('a', {'class': 'a-link-normal'})
-                        product_url = self.base_url + link_elem['href'] if link_elem and 'href' in link_elem.attrs else ""
-                        
-                        # ASIN
-                        asin = ""
-                        if '/dp/' in product_url:
-                            asin = product_url.split('/dp/')[1].split('/')[0]
-                        
-                        # Image
-                        img_elem = item.find('img')
-                        image_url = img_elem['src'] if img_elem and 'src' in img_elem.attrs else ""
-                        
-                        # Rating
-                        rating_elem = item.find('span', {'class': 'a-icon-alt'})
-                        rating = 0.0
-                        if rating_elem:
-                            rating_text = rating_elem.text.split()[0]
-                            try:
-                                rating = float(rating_text)
-                            except:
-                                rating = 0.0
-                        
-                        # Reviews count
-                        reviews_elem = item.find('span', {'class': 'a-size-small'})
-                        reviews_count = 0
-                        if reviews_elem:
-                            reviews_text = reviews_elem.text.replace(',', '').strip()
-                            try:
-                                reviews_count = int(reviews_text)
-                            except:
-                                reviews_count = 0
-                        
-                        product = {
-                            "nom": title,
-                            "prix": price,
-                            "url": product_url,
-                            "source": "amazon",
-                            "categorie": category,
-                            "asin": asin,
-                            "image_url": image_url,
-                            "rating": rating,
-                            "reviews_count": reviews_count,
-                            "stock_status": "in_stock"
-                        }
-                        
-                        products.append(product)
-                        logger.info(f"Scraped Amazon product: {title[:50]}...")
-                    
-                    except Exception as e:
-                        logger.error(f"Error parsing Amazon product: {str(e)}")
-                        continue
+                        await page.wait_for_selector(ready_selector, state="attached", timeout=READY_TIMEOUT_MS)
+                    except PlaywrightTimeoutError:
+                        logger.warning(f"Selector {ready_selector} not found on {url}")
+                else:
+                    await asyncio.sleep(2)  # Attendre le chargement complet
                 
-                await browser.close()
+                ready = time.perf_counter()
+                
+                # Extraire le HTML
+                content = await page.content()
+                if CAPTCHA_MARKER in content:
+                    logger.warning(f"Amazon captcha served for {url}")
+                    lease.ban()
                 
-                # Mettre en cache
-                scraper_cache.set(cache_key, products)
+                timing = {
+                    "url": url,
+                    "lean": LEAN_MODE,
+                    "navigation_ms": round((navigated - start) * 1000, 1),
+                    "ready_ms": round((ready - navigated) * 1000, 1),
+                    "total_ms": round((time.perf_counter() - start) * 1000, 1)
+                }
+                self.page_timings.append(timing)
+                logger.info(f"Amazon page timing ({'lean' if LEAN_MODE else 'full'}): "
+                            f"navigation={timing['navigation_ms']}ms ready={timing['ready_ms']}ms "
+                            f"total={timing['total_ms']}ms for {url}")
                 
-                logger.info(f"Successfully scraped {len(products)} Amazon products")
-                return products
+                return content
+    
+    def page_timing_summary(self) -> Dict:
+        """
+        Résumé des temps de chargement des dernières pages
+        """
+        if not self.page_timings:
+            return {"pages": 0}
         
-        except Exception as e:
-            error = handle_scraping_error(e, "amazon", url)
-            return []
+        totals = sorted(t["total_ms"] for t in self.page_timings)
+        
+        return {
+            "pages": len(totals),
+            "lean": LEAN_MODE,
+            "avg_ms": round(sum(totals) / len(totals), 1),
+            "p50_ms": totals[len(totals) // 2],
+            "max_ms": totals[-1]
+        }
     
-    async def scrape_product_details(self, asin: str) -> Optional[Dict]:
+    def _parse_bestsellers(self, content: str, category: str, limit: int) -> List[Dict]:
         """
-        Scraper les détails d'un produit Amazon par ASIN
+        Parser la page des bestsellers Amazon
         """
-        cache_key = f"amazon_product_{asin}"
-        cached_data = scraper_cache.get(cache_key)
+        return list(self._iter_parse_bestsellers(content, category, limit))
+    
+    def _iter_parse_bestsellers(self, content: str, category: str, limit: int):
+        """
+        Parser la page des bestsellers Amazon, un produit à la fois
+        """
+        doc = parse_html(content)
         
-        if cached_data:
-            return cached_data
+        # Parser les produits
+        product_items = doc.select(SELECTORS.item, limit)
         
-        try:
-            async with async_playwright() as p:
-                browser = await p.chromium.launch(headless=True)
-                context = await browser.new_context(user_agent=self.headers["User-Agent"])
-                page = await context.new_page()
+        for item in product_items:
+            try:
+                # Nom du produit
+                title_elem = item.select_one(SELECTORS.title)
+                if not title_elem:
+                    title_elem = item.select_one(SELECTORS.link)
                 
-                url = f"{self.base_url}/dp/{asin}"
+                title = title_elem.text.strip() if title_elem else "Unknown"
                 
-                logger.info(f"Scraping Amazon product details: {url}")
-                rate_limiter.wait()
+                # Prix
+                price_elem = item.select_one(SELECTORS.price)
+                price = 0.0
+                if price_elem:
+                    price_text = price_elem.text.replace(',', '').replace('$', '').strip()
+                    try:
+                        price = float(price_text)
+                    except:
+                        price = 0.0
                 
-                await page.goto(url, wait_until="networkidle")
-                await asyncio.sleep(2)
+                # URL
+                link_elem = item.select_one(SELECTORS.link)
+                href = link_elem.attr('href') if link_elem else None
+                product_url = self.base_url + href if href is not None else ""
                 
-                content = await page.content()
-                soup = BeautifulSoup(content, 'html.parser')
+                # ASIN
+                asin = ""
+                if '/dp/' in product_url:
+                    asin = product_url.split('/dp/')[1].split('/')[0]
                 
-                # Extraire description
-                description_elem = soup.find('div', {'id': 'feature-bullets'})
-                description = description_elem.text.strip() if description_elem else ""
+                # Image
+                img_elem = item.select_one(SELECTORS.image)
+                src = img_elem.attr('src') if img_elem else None
+                image_url = src if src is not None else ""
                 
-                # Extraire plus de détails si nécessaire
+                # Rating
+                rating_elem = item.select_one(SELECTORS.rating)
+                rating = 0.0
+                if rating_elem:
+                    rating_text = rating_elem.text.split()[0]
+                    try:
+                        rating = float(rating_text)
+                    except:
+                        rating = 0.0
                 
-                await browser.close()
+                # Reviews count
+                reviews_elem = item.select_one(SELECTORS.reviews)
+                reviews_count = 0
+                if reviews_elem:
+                    reviews_text = reviews_elem.text.replace(',', '').strip()
+                    try:
+                        reviews_count = int(reviews_text)
+                    except:
+                        reviews_count = 0
                 
-                product_details = {
+                product = {
+                    "nom": title,
+                    "prix": price,
+                    "url": product_url,
+                    "source": "amazon",
+                    "categorie": category,
                     "asin": asin,
-                    "description": description,
-                    "url": url
+                    "image_url": image_url,
+                    "rating": rating,
+                    "reviews_count": reviews_count,
+                    "stock_status": "in_stock"
                 }
                 
-                scraper_cache.set(cache_key, product_details)
-                
-                return product_details
+                logger.info(f"Scraped Amazon product: {title[:50]}...")
+            
+            except Exception as e:
+                logger.error(f"Error parsing Amazon product: {str(e)}")
+                continue
+            
+            yield product
+    
+    async def scrape_product_details(self, asin: str) -> Optional[Dict]:
+        """
+        Scraper les détails d'un produit Amazon par ASIN
+        """
+        cache_key = f"amazon_product_{asin}"
+        return await scraper_cache.get_or_set(cache_key, lambda: self._scrape_product_details(asin))
+    
+    async def _scrape_product_details(self, asin: str) -> Optional[Dict]:
+        try:
+            return await self._fetch_product_details(asin)
         
         except Exception as e:
             handle_scraping_error(e, "amazon", f"{self.base_url}/dp/{asin}")
             return None
+    
+    async def _fetch_product_details(self, asin: str) -> Dict:
+        url = f"{self.base_url}/dp/{asin}"
+        
+        logger.info(f"Scraping Amazon product details: {url}")
+        content = await self._load_page(url, ready_selector=SELECTORS.product_ready.css)
+        
+        return self._parse_product_details(content, asin, url)
+    
+    async def fetch_current_price(self, asin: Optional[str]) -> Optional[float]:
+        """
+        Prix actuel d'un produit, sans passer par le cache (rafraîchissement planifié)
+        """
+        if not asin:
+            return None
+        
+        details = await self._scrape_product_details(asin)
+        return details.get("prix") if details else None
+    
+    async def iter_product_details(self, asins: List[str], concurrency: Optional[int] = None) -> AsyncIterator[Dict]:
+        """
+        Enrichir un lot d'ASINs en parallèle (pages d'un même contexte navigateur).
+        Les résultats sont produits dans l'ordre où ils se terminent; une erreur
+        sur un ASIN produit un dict d'erreur sans interrompre le lot.
+        """
+        semaphore = asyncio.Semaphore(concurrency or DETAIL_CONCURRENCY)
+        
+        async def enrich(asin: str) -> Dict:
+            async with semaphore:
+                cache_key = f"amazon_product_{asin}"
+                try:
+                    return await scraper_cache.get_or_set(cache_key, lambda: self._fetch_product_details(asin))
+                except Exception as e:
+                    error = handle_scraping_error(e, "amazon", f"{self.base_url}/dp/{asin}")
+                    error["asin"] = asin
+                    return error
+        
+        # Dédoublonner en conservant l'ordre
+        tasks = [asyncio.ensure_future(enrich(asin)) for asin in dict.fromkeys(a for a in asins if a)]
+        
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Consommateur arrêté avant la fin: annuler les chargements restants
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    async def scrape_products_details(self, asins: List[str], concurrency: Optional[int] = None) -> List[Dict]:
+        """
+        Enrichir un lot d'ASINs et retourner tous les résultats
+        """
+        return [details async for details in self.iter_product_details(asins, concurrency)]
+    
+    def _parse_product_details(self, content: str, asin: str, url: str) -> Dict:
+        """
+        Parser la page produit Amazon
+        """
+        doc = parse_html(content)
+        
+        # Extraire description
+        description_elem = doc.select_one(SELECTORS.description)
+        description = description_elem.text.strip() if description_elem else ""
+        
+        # Extraire le prix affiché (None si absent: produit indisponible)
+        price = None
+        price_elem = doc.select_one(SELECTORS.detail_price)
+        if price_elem:
+            try:
+                price = float(price_elem.text.replace(',', '').replace('$', '').strip())
+            except ValueError:
+                price = None
+        
+        product_details = {
+            "asin": asin,
+            "description": description,
+            "prix": price,
+            "url": url
+        }
+        
+        return product_details
 
 
 # Instance globale
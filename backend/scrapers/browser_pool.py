@@ -0,0 +1,308 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+
+import psutil
+from loguru import logger
+from playwright.async_api import async_playwright, Browser, BrowserContext, Page, Response, Route
+
+from scrapers.proxy_rotator import playwright_proxy, proxy_rotator
+
+
+# Types de ressources bloqués en mode lean
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+
+# Domaines de tracking tiers bloqués en mode lean
+BLOCKED_DOMAINS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "amazon-adsystem.com",
+    "facebook.net",
+    "scorecardresearch.com",
+    "fls-na.amazon.com",
+    "unagi.amazon.com"
+)
+
+
+async def block_heavy_resources(route: Route):
+    """Interrompre les images, médias, polices et trackers tiers"""
+    request = route.request
+    host = urlparse(request.url).hostname or ""
+
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or host.endswith(BLOCKED_DOMAINS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+
+class PooledBrowser:
+    """Navigateur Chromium chaud avec ses contextes réutilisables"""
+
+    def __init__(self, browser: Browser):
+        self.browser = browser
+        self.contexts: Dict[str, BrowserContext] = {}
+        self.pages_served = 0
+        self.in_flight = 0
+        self.launched_at = time.time()
+
+
+class BrowserPool:
+    """
+    Pool de navigateurs Chromium persistants, propre au process worker.
+    Les navigateurs sont recyclés après un nombre de pages donné ou
+    lorsque la mémoire (RSS) des process navigateurs a trop augmenté.
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        pages_per_browser: int = 4,
+        max_pages_per_browser: int = 200,
+        max_rss_growth_mb: int = 500,
+        headless: bool = True,
+        proxied: bool = False
+    ):
+        self.size = size
+        self.pages_per_browser = pages_per_browser
+        self.max_pages_per_browser = max_pages_per_browser
+        self.max_rss_growth_mb = max_rss_growth_mb
+        self.headless = headless
+        self.proxied = proxied
+        # Hooks appelés sur chaque réponse reçue par les pages (enregistrement de fixtures)
+        self.response_hooks: List[Callable[[Response], Awaitable[None]]] = []
+
+        self._playwright = None
+        self._browsers: List[PooledBrowser] = []
+        self._draining: List[PooledBrowser] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._starting: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._rss_baseline = 0
+
+    async def start(self):
+        """
+        Démarrer Playwright et lancer les navigateurs chauds. Le démarrage est
+        une tâche unique créée avant tout await: les appels concurrents l'attendent
+        au lieu de lancer chacun leur driver et leurs navigateurs.
+        """
+        loop = asyncio.get_running_loop()
+
+        if self._loop is not loop:
+            if self._loop is not None:
+                # Les objets Playwright sont liés à leur boucle d'origine
+                logger.warning("Browser pool was bound to another event loop, restarting it")
+                self._forget()
+
+            self._loop = loop
+            self._starting = loop.create_task(self._start())
+
+        starting = self._starting
+        try:
+            # shield: l'annulation d'un appelant n'interrompt pas le démarrage des autres
+            await asyncio.shield(starting)
+        except Exception:
+            # Démarrage échoué: le prochain appel le retente
+            if self._starting is starting:
+                self._forget()
+            raise
+
+    async def _start(self):
+        self._lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(self.size * self.pages_per_browser)
+        self._playwright = await async_playwright().start()
+
+        try:
+            for _ in range(self.size):
+                self._browsers.append(await self._launch())
+        except Exception:
+            await self.close()
+            raise
+
+        self._rss_baseline = self._browsers_rss()
+        logger.info(f"Browser pool started with {self.size} browsers")
+
+    @asynccontextmanager
+    async def page(self, user_agent: Optional[str] = None, lean: bool = False, proxy: Optional[str] = None):
+        """
+        Emprunter une page dans le pool (fermée automatiquement à la sortie).
+        En mode lean, le contexte bloque images, médias, polices et trackers.
+        Avec un proxy, la page est ouverte dans un contexte dédié à ce proxy.
+        """
+        await self.start()
+
+        async with self._slots:
+            pooled = await self._acquire()
+            page: Optional[Page] = None
+            pending_hooks = set()
+
+            try:
+                context = await self._get_context(pooled, user_agent, lean, proxy)
+                page = await context.new_page()
+
+                if self.response_hooks:
+                    def dispatch(response: Response):
+                        for hook in self.response_hooks:
+                            task = asyncio.ensure_future(hook(response))
+                            pending_hooks.add(task)
+                            task.add_done_callback(pending_hooks.discard)
+
+                    page.on("response", dispatch)
+
+                yield page
+
+            finally:
+                # Les hooks lisent le corps des réponses: attendre avant de fermer la page
+                if pending_hooks:
+                    await asyncio.gather(*pending_hooks, return_exceptions=True)
+
+                if page is not None:
+                    try:
+                        await page.close()
+                    except Exception as e:
+                        logger.warning(f"Error closing pooled page: {str(e)}")
+
+                await self._release(pooled)
+
+    async def close(self):
+        """Fermer proprement tous les navigateurs du pool"""
+        if self._playwright is None:
+            return
+
+        for pooled in self._browsers + self._draining:
+            await self._close_browser(pooled)
+
+        try:
+            await self._playwright.stop()
+        except Exception as e:
+            logger.warning(f"Error stopping Playwright: {str(e)}")
+
+        self._forget()
+        logger.info("Browser pool closed")
+
+    def stats(self) -> Dict:
+        """Statistiques d'utilisation du pool"""
+        return {
+            "browsers": len(self._browsers),
+            "draining": len(self._draining),
+            "pages_served": [b.pages_served for b in self._browsers],
+            "in_flight": sum(b.in_flight for b in self._browsers + self._draining),
+            "rss_growth_mb": round((self._browsers_rss() - self._rss_baseline) / 1024 / 1024, 1)
+        }
+
+    async def _launch(self) -> PooledBrowser:
+        if self.proxied:
+            # Nécessaire à Chromium pour accepter un proxy par contexte
+            browser = await self._playwright.chromium.launch(
+                headless=self.headless, proxy={"server": "http://per-context"}
+            )
+        else:
+            browser = await self._playwright.chromium.launch(headless=self.headless)
+        return PooledBrowser(browser)
+
+    async def _acquire(self) -> PooledBrowser:
+        async with self._lock:
+            # Remplacer les navigateurs crashés
+            for pooled in list(self._browsers):
+                if not pooled.browser.is_connected():
+                    logger.warning("Pooled browser disconnected, relaunching")
+                    self._browsers.remove(pooled)
+                    self._browsers.append(await self._launch())
+
+            pooled = min(self._browsers, key=lambda b: b.in_flight)
+            pooled.in_flight += 1
+            pooled.pages_served += 1
+
+            if pooled.pages_served >= self.max_pages_per_browser:
+                await self._retire(pooled, reason=f"{pooled.pages_served} pages served")
+
+            return pooled
+
+    async def _release(self, pooled: PooledBrowser):
+        async with self._lock:
+            pooled.in_flight -= 1
+
+            if pooled in self._draining and pooled.in_flight == 0:
+                self._draining.remove(pooled)
+                await self._close_browser(pooled)
+
+            growth_mb = (self._browsers_rss() - self._rss_baseline) / 1024 / 1024
+            if growth_mb > self.max_rss_growth_mb and self._browsers:
+                heaviest = max(self._browsers, key=lambda b: b.pages_served)
+                await self._retire(heaviest, reason=f"RSS grew by {growth_mb:.0f} MB")
+                self._rss_baseline = self._browsers_rss()
+
+    async def _retire(self, pooled: PooledBrowser, reason: str):
+        """Remplacer un navigateur par un neuf; l'ancien est fermé une fois vidé"""
+        logger.info(f"Recycling pooled browser ({reason})")
+
+        self._browsers.remove(pooled)
+        self._browsers.append(await self._launch())
+
+        if pooled.in_flight > 0:
+            self._draining.append(pooled)
+        else:
+            await self._close_browser(pooled)
+
+    async def _get_context(
+        self,
+        pooled: PooledBrowser,
+        user_agent: Optional[str],
+        lean: bool,
+        proxy: Optional[str]
+    ) -> BrowserContext:
+        key = f"{user_agent or ''}|{'lean' if lean else 'full'}|{proxy or ''}"
+
+        if key not in pooled.contexts:
+            context = await pooled.browser.new_context(
+                user_agent=user_agent,
+                proxy=playwright_proxy(proxy) if proxy else None
+            )
+            if lean:
+                await context.route("**/*", block_heavy_resources)
+            pooled.contexts[key] = context
+
+        return pooled.contexts[key]
+
+    async def _close_browser(self, pooled: PooledBrowser):
+        try:
+            await pooled.browser.close()
+        except Exception as e:
+            logger.warning(f"Error closing pooled browser: {str(e)}")
+
+    def _browsers_rss(self) -> int:
+        """RSS cumulée des process enfants (driver Playwright et Chromium)"""
+        total = 0
+        try:
+            for child in psutil.Process().children(recursive=True):
+                try:
+                    total += child.memory_info().rss
+                except psutil.Error:
+                    continue
+        except psutil.Error:
+            pass
+        return total
+
+    def _forget(self):
+        self._playwright = None
+        self._browsers = []
+        self._draining = []
+        self._loop = None
+        self._starting = None
+        self._lock = None
+        self._slots = None
+        self._rss_baseline = 0
+
+
+# Instance globale
+browser_pool = BrowserPool(
+    size=int(os.getenv("BROWSER_POOL_SIZE", "2")),
+    pages_per_browser=int(os.getenv("BROWSER_PAGES_PER_BROWSER", "4")),
+    max_pages_per_browser=int(os.getenv("BROWSER_MAX_PAGES", "200")),
+    max_rss_growth_mb=int(os.getenv("BROWSER_MAX_RSS_GROWTH_MB", "500")),
+    proxied=bool(proxy_rotator.proxies)
+)
@@ -0,0 +1,385 @@
+import asyncio
+import os
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import msgpack
+from loguru import logger
+
+
+# Au-delà de cette taille, les valeurs sont compressées avant d'aller dans Redis
+COMPRESSION_THRESHOLD = 1024
+
+_RAW = b"\x00"
+_ZLIB = b"\x01"
+
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def pack_value(value: Any) -> bytes:
+    """Sérialiser une valeur en msgpack, compressée si elle est volumineuse"""
+    payload = msgpack.packb(value, use_bin_type=True, default=str)
+    if len(payload) > COMPRESSION_THRESHOLD:
+        return _ZLIB + zlib.compress(payload, 6)
+    return _RAW + payload
+
+
+def unpack_value(data: bytes) -> Any:
+    """Désérialiser une valeur produite par pack_value"""
+    flag, payload = data[:1], data[1:]
+    if flag == _ZLIB:
+        payload = zlib.decompress(payload)
+    return msgpack.unpackb(payload, raw=False)
+
+
+class ScraperCache:
+    """
+    Cache à deux niveaux pour éviter de scraper les mêmes données trop souvent:
+    un LRU local borné avec TTL devant Redis, partagé par tous les workers.
+    Les miss concurrents sur une même clé sont regroupés (un seul scrape).
+    """
+
+    def __init__(
+        self,
+        cache_duration_hours: int = 6,
+        max_local_entries: int = 256,
+        local_ttl_seconds: int = 300,
+        redis_url: Optional[str] = None,
+        lock_timeout_seconds: int = 120,
+        namespace: str = "scraper_cache"
+    ):
+        self.cache_duration = cache_duration_hours * 3600
+        self.max_local_entries = max_local_entries
+        self.local_ttl = local_ttl_seconds
+        self.redis_url = redis_url
+        self.lock_timeout = lock_timeout_seconds
+        self.namespace = namespace
+
+        self.cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._redis = None
+        self._release_lock = None
+        self._redis_down_until = 0.0
+        self._stats = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "coalesced": 0,
+            "redis_errors": 0
+        }
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Récupérer une valeur du cache (local puis Redis)"""
+        value = self._get_local(key)
+        if value is not None:
+            self._stats["local_hits"] += 1
+            logger.info(f"Cache hit for {key}")
+            return value
+
+        client = await self._get_redis()
+        if client is not None:
+            try:
+                data = await client.get(self._redis_key(key))
+                if data is not None:
+                    value = unpack_value(data)
+                    self._set_local(key, value)
+                    self._stats["redis_hits"] += 1
+                    logger.info(f"Cache hit for {key} (redis)")
+                    return value
+            except Exception as e:
+                self._redis_failed(e)
+
+        self._stats["misses"] += 1
+        return None
+
+    async def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        """Stocker une valeur dans le cache"""
+        ttl = ttl or self.cache_duration
+        self._set_local(key, value, min(ttl, self.local_ttl))
+        self._stats["sets"] += 1
+
+        client = await self._get_redis()
+        if client is not None:
+            try:
+                await client.set(self._redis_key(key), pack_value(value), ex=ttl)
+            except Exception as e:
+                self._redis_failed(e)
+
+        logger.info(f"Cached {key}")
+
+    async def get_or_set(self, key: str, fetch: Callable[[], Awaitable[Any]], ttl: Optional[int] = None) -> Any:
+        """
+        Retourner la valeur en cache ou la calculer avec fetch().
+        Un seul appel à fetch() par clé, y compris entre workers (verrou Redis).
+        Les résultats vides ne sont pas mis en cache.
+        """
+        value = await self.get(key)
+        if value:
+            return value
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            self._stats["coalesced"] += 1
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        # Évite l'avertissement "exception never retrieved" quand personne n'attend
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._pending[key] = future
+
+        try:
+            value = await self._fill(key, fetch, ttl)
+            future.set_result(value)
+            return value
+
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+
+        finally:
+            del self._pending[key]
+
+    async def stream_or_set(
+        self,
+        key: str,
+        produce: Callable[[], AsyncIterator[Any]],
+        ttl: Optional[int] = None
+    ) -> AsyncIterator[Any]:
+        """
+        Version flux de get_or_set pour une valeur liste: les éléments sont transmis
+        dès qu'ils sont produits, puis la liste complète est mise en cache.
+        Les appels concurrents sur la clé (même process ou autres workers via le
+        verrou Redis) attendent la fin du flux et rejouent son résultat. Un flux
+        interrompu par son consommateur n'est pas mis en cache: ceux qui
+        l'attendaient produisent alors leur propre flux.
+        """
+        value = await self.get(key)
+        if value:
+            for item in value:
+                yield item
+            return
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            self._stats["coalesced"] += 1
+            value = await asyncio.shield(pending)
+            async for item in self._replay_or_produce(key, value, produce, ttl):
+                yield item
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._pending[key] = future
+
+        lock_key = f"{self.namespace}:lock:{key}"
+        token = uuid.uuid4().hex
+        acquired = await self._acquire_lock(lock_key, token)
+
+        try:
+            if acquired:
+                value = await self.get(key)
+            else:
+                # Un autre worker produit déjà cette clé: attendre son résultat
+                value = await self._wait_for_peer(key, lock_key)
+                if value:
+                    self._stats["coalesced"] += 1
+
+            if value:
+                future.set_result(value)
+                for item in value:
+                    yield item
+                return
+
+            items: List[Any] = []
+            async for item in produce():
+                items.append(item)
+                yield item
+
+            if items:
+                await self.set(key, items, ttl)
+            future.set_result(items)
+
+        except GeneratorExit:
+            # Consommateur arrêté avant la fin: rien de partiel pour les autres
+            # (le résultat est déjà publié si la valeur venait du cache ou d'un pair)
+            if not future.done():
+                future.set_result(None)
+            raise
+
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+            raise
+
+        finally:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+            if acquired:
+                await self._unlock(lock_key, token)
+
+    async def _replay_or_produce(
+        self,
+        key: str,
+        value: Optional[List[Any]],
+        produce: Callable[[], AsyncIterator[Any]],
+        ttl: Optional[int]
+    ) -> AsyncIterator[Any]:
+        if value:
+            for item in value:
+                yield item
+            return
+
+        # Flux attendu interrompu ou vide: produire sans regroupement
+        items: List[Any] = []
+        async for item in produce():
+            items.append(item)
+            yield item
+
+        if items:
+            await self.set(key, items, ttl)
+
+    def clear(self):
+        """Vider le cache local"""
+        self.cache.clear()
+        logger.info("Cache cleared")
+
+    async def aclose(self):
+        """Fermer la connexion Redis (arrêt du worker)"""
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def stats(self) -> Dict[str, int]:
+        """Compteurs hit/miss/eviction du cache"""
+        return {**self._stats, "local_entries": len(self.cache)}
+
+    async def _fill(self, key: str, fetch: Callable[[], Awaitable[Any]], ttl: Optional[int]) -> Any:
+        lock_key = f"{self.namespace}:lock:{key}"
+        token = uuid.uuid4().hex
+        acquired = await self._acquire_lock(lock_key, token)
+
+        if not acquired:
+            # Un autre worker scrape déjà cette clé: attendre son résultat
+            value = await self._wait_for_peer(key, lock_key)
+            if value:
+                self._stats["coalesced"] += 1
+                return value
+
+        try:
+            value = await self.get(key) if acquired else None
+            if value:
+                return value
+
+            value = await fetch()
+            if value:
+                await self.set(key, value, ttl)
+            return value
+
+        finally:
+            if acquired:
+                await self._unlock(lock_key, token)
+
+    async def _acquire_lock(self, lock_key: str, token: str) -> bool:
+        client = await self._get_redis()
+        if client is None:
+            return True
+
+        try:
+            return bool(await client.set(lock_key, token, nx=True, ex=self.lock_timeout))
+        except Exception as e:
+            self._redis_failed(e)
+            return True
+
+    async def _unlock(self, lock_key: str, token: str):
+        client = await self._get_redis()
+        if client is None:
+            return
+
+        try:
+            await self._release_lock(keys=[lock_key], args=[token])
+        except Exception as e:
+            self._redis_failed(e)
+
+    async def _wait_for_peer(self, key: str, lock_key: str) -> Optional[Any]:
+        deadline = time.monotonic() + self.lock_timeout
+        client = await self._get_redis()
+
+        while client is not None and time.monotonic() < deadline:
+            await asyncio.sleep(0.5)
+            try:
+                data = await client.get(self._redis_key(key))
+                if data is not None:
+                    value = unpack_value(data)
+                    self._set_local(key, value)
+                    return value
+                if not await client.exists(lock_key):
+                    return None
+            except Exception as e:
+                self._redis_failed(e)
+                return None
+
+        return None
+
+    def _get_local(self, key: str) -> Optional[Any]:
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+
+        value, expires_at = entry
+        if time.time() >= expires_at:
+            logger.info(f"Cache expired for {key}")
+            del self.cache[key]
+            self._stats["expirations"] += 1
+            return None
+
+        self.cache.move_to_end(key)
+        return value
+
+    def _set_local(self, key: str, value: Any, ttl: Optional[int] = None):
+        self.cache[key] = (value, time.time() + (ttl or self.local_ttl))
+        self.cache.move_to_end(key)
+
+        while len(self.cache) > self.max_local_entries:
+            self.cache.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    async def _get_redis(self):
+        if not self.redis_url or time.monotonic() < self._redis_down_until:
+            return None
+
+        if self._redis is None:
+            import redis.asyncio as aioredis
+
+            self._redis = aioredis.from_url(self.redis_url, socket_timeout=2.0)
+            self._release_lock = self._redis.register_script(_RELEASE_LOCK_SCRIPT)
+
+        return self._redis
+
+    def _redis_failed(self, error: Exception):
+        # Continuer en local seulement pendant 30s plutôt que d'attendre Redis à chaque appel
+        self._stats["redis_errors"] += 1
+        self._redis_down_until = time.monotonic() + 30
+        logger.warning(f"Redis cache unavailable, using local cache only: {str(error)}")
+
+
+# Instance globale
+scraper_cache = ScraperCache(
+    cache_duration_hours=6,
+    max_local_entries=int(os.getenv("SCRAPER_CACHE_LOCAL_ENTRIES", "256")),
+    local_ttl_seconds=int(os.getenv("SCRAPER_CACHE_LOCAL_TTL", "300")),
+    redis_url=os.getenv("REDIS_URL", "redis://localhost:6379/0")
+)
@@ -1,8 +1,21 @@
-import httpx
-from bs4 import BeautifulSoup
 from typing import List, Dict, Optional
 from loguru import logger
-from scrapers.utils import get_headers, rate_limiter, scraper_cache, handle_scraping_error
+from scrapers.utils import get_headers, handle_scraping_error
+from scrapers.cache import scraper_cache
+from scrapers.http_client import conditional_get
+from scrapers.parsing import SelectorSet, parse_html
+from scrapers.streaming import ProductStream, collect, stream_cached
+
+
+# Sélecteurs précompilés pour les résultats eBay
+SELECTORS = SelectorSet(
+    item="li.s-item",
+    title="div.s-item__title",
+    price="span.s-item__price",
+    link="a.s-item__link",
+    image="img",
+    sold_date="span.s-item__endedDate"
+)
 
 
 class EbayScraper:
@@ -17,93 +30,103 @@ class EbayScraper:
         Scraper les articles vendus sur eBay
         """
         cache_key = f"ebay_sold_{keyword}"
-        cached_data = scraper_cache.get(cache_key)
+        return await scraper_cache.get_or_set(cache_key, lambda: collect(self._iter_sold_items(keyword, limit)))
+    
+    def iter_sold_items(self, keyword: str, limit: int = 50) -> ProductStream:
+        """
+        Articles vendus sur eBay en flux
+        """
+        cache_key = f"ebay_sold_{keyword}"
+        return stream_cached(cache_key, lambda: self._iter_sold_items(keyword, limit))
+    
+    async def _iter_sold_items(self, keyword: str, limit: int) -> ProductStream:
+        # URL pour articles vendus
+        url = f"{self.base_url}/sch/i.html?_nkw={keyword}&LH_Sold=1&LH_Complete=1&_sop=13"
+        
+        try:
+            logger.info(f"Scraping eBay sold items: {url}")
+            
+            # Le résultat parsé d'une page est conservé entier pour les réponses 304
+            products = await conditional_get(
+                "ebay", url, self.headers,
+                parse=lambda response: self._parse_sold_items(response.text, keyword, limit),
+                variant=str(limit)
+            )
+        
+        except Exception as e:
+            error = handle_scraping_error(e, "ebay", url)
+            return
         
-        if cached_data:
-            return cached_data
+        for product in products:
+            yield product
         
+        logger.info(f"Successfully scraped {len(products)} eBay sold items")
+    
+    def _parse_sold_items(self, html: str, keyword: str, limit: int) -> List[Dict]:
+        """
+        Parser la page de résultats eBay
+        """
         products = []
         
-        try:
-            async with httpx.AsyncClient(
-                headers=self.headers, 
-                timeout=30.0,
-                follow_redirects=True
-            ) as client:
-                # URL pour articles vendus
-                url = f"{self.base_url}/sch/i.html?_nkw={keyword}&LH_Sold=1&LH_Complete=1&_sop=13"
+        doc = parse_html(html)
+        
+        # Parser les produits
+        product_items = doc.select(SELECTORS.item, limit)
+        
+        for item in product_items:
+            try:
+                # Nom du produit
+                title_elem = item.select_one(SELECTORS.title)
+                title = title_elem.text.strip() if title_elem else "Unknown"
                 
-                logger.info(f"Scraping eBay sold items: {url}")
-                rate_limiter.wait()
+                if title == "Shop on eBay":
+                    continue
                 
-                response = await client.get(url)
-                response.raise_for_status()
+                # Prix
+                price_elem = item.select_one(SELECTORS.price)
+                price = 0.0
+                if price_elem:
+                    price_text = price_elem.text.replace('$', '').replace(',', '').strip()
+                    try:
+                        price = float(price_text)
+                    except:
+                        price = 0.0
                 
-                soup = BeautifulSoup(response.text, 'html.parser')
+                # URL
+                link_elem = item.select_one(SELECTORS.link)
+                href = link_elem.attr('href') if link_elem else None
+                product_url = href if href is not None else ""
                 
-                # Parser les produits
-                product_items = soup.find_all('li', {'class': 's-item'})[:limit]
+                # Image
+                img_elem = item.select_one(SELECTORS.image)
+                src = img_elem.attr('src') if img_elem else None
+                image_url = src if src is not None else ""
                 
-                for item in product_items:
-                    try:
-                        # Nom du produit
-                        title_elem = item.find('div', {'class': 's-item__title'})
-                        title = title_elem.text.strip() if title_elem else "Unknown"
-                        
-                        if title == "Shop on eBay":
-                            continue
-                        
-                        # Prix
-                        price_elem = item.find('span', {'class': 's-item__price'})
-                        price = 0.0
-                        if price_elem:
-                            price_text = price_elem.text.replace('$', '').replace(',', '').strip()
-                            try:
-                                price = float(price_text)
-                            except:
-                                price = 0.0
-                        
-                        # URL
-                        link_elem = item.find('a', {'class': 's-item__link'})
-                        product_url = link_elem['href'] if link_elem and 'href' in link_elem.attrs else ""
-                        
-                        # Image
-                        img_elem = item.find('img')
-                        image_url = img_elem['src'] if img_elem and 'src' in img_elem.attrs else ""
-                        
-                        # Date de vente
-                        sold_date_elem = item.find('span', {'class': 's-item__endedDate'})
-                        sold_date = sold_date_elem.text.strip() if sold_date_elem else ""
-                        
-                        product = {
-                            "nom": title,
-                            "prix": price,
-                            "url": product_url,
-                            "source": "ebay",
-                            "categorie": keyword,
-                            "image_url": image_url,
-                            "rating": 0.0,
-                            "reviews_count": 0,
-                            "stock_status": "sold",
-                            "description": f"Sold on {sold_date}"
-                        }
-                        
-                        products.append(product)
-                        logger.info(f"Scraped eBay sold item: {title[:50]}...")
-                    
-                    except Exception as e:
-                        logger.error(f"Error parsing eBay item: {str(e)}")
-                        continue
+                # Date de vente
+                sold_date_elem = item.select_one(SELECTORS.sold_date)
+                sold_date = sold_date_elem.text.strip() if sold_date_elem else ""
                 
-                # Mettre en cache
-                scraper_cache.set(cache_key, products)
+                product = {
+                    "nom": title,
+                    "prix": price,
+                    "url": product_url,
+                    "source": "ebay",
+                    "categorie": keyword,
+                    "image_url": image_url,
+                    "rating": 0.0,
+                    "reviews_count": 0,
+                    "stock_status": "sold",
+                    "description": f"Sold on {sold_date}"
+                }
                 
-                logger.info(f"Successfully scraped {len(products)} eBay sold items")
-                return products
+                products.append(product)
+                logger.info(f"Scraped eBay sold item: {title[:50]}...")
+            
+            except Exception as e:
+                logger.error(f"Error parsing eBay item: {str(e)}")
+                continue
         
-        except Exception as e:
-            error = handle_scraping_error(e, "ebay", url)
-            return []
+        return products
 
 
 # Instance globale
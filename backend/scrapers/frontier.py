@@ -0,0 +1,190 @@
+import hashlib
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+# Intervalle de re-crawl des listings (bestsellers, recherches, stores) et des fiches produit (secondes)
+RECRAWL_INTERVALS = {
+    "listing": int(os.getenv("FRONTIER_LISTING_INTERVAL", str(24 * 3600))),
+    "product": int(os.getenv("FRONTIER_PRODUCT_INTERVAL", str(7 * 24 * 3600)))
+}
+
+# Sortir des jobs dus et les réserver pour `lease` secondes: un worker qui meurt
+# ne perd pas ses jobs, ils redeviennent dus à l'expiration du bail
+_POP_DUE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1])
+local jobs = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now, 'LIMIT', 0, tonumber(ARGV[1]))
+for _, job in ipairs(jobs) do
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), job)
+end
+return jobs
+"""
+
+# Filtre de Bloom sur un bitmap Redis: ARGV[1] = nombre de hash, puis k positions par clé.
+# Retourne les index (base 0) des clés jamais vues; elles sont marquées vues au passage
+_BLOOM_ADD_SCRIPT = """
+local k = tonumber(ARGV[1])
+local count = (#ARGV - 1) / k
+local new = {}
+for i = 0, count - 1 do
+    local seen = 1
+    for j = 1, k do
+        if redis.call('SETBIT', KEYS[1], ARGV[1 + i * k + j], 1) == 0 then
+            seen = 0
+        end
+    end
+    if seen == 0 then
+        table.insert(new, i)
+    end
+end
+return new
+"""
+
+
+def job_key(source: str, kind: str, target: str) -> str:
+    """Identifiant d'un job du frontier: source|type|cible (catégorie, store, ASIN...)"""
+    return f"{source}|{kind}|{target}"
+
+
+def parse_job(job: str) -> Tuple[str, str, str]:
+    source, kind, target = job.split("|", 2)
+    return source, kind, target
+
+
+def seen_key(job: str) -> str:
+    """Clé du filtre de Bloom: cible normalisée pour qu'une même URL ne soit vue qu'une fois"""
+    source, kind, target = parse_job(job)
+    target = target.strip().lower()
+    for scheme in ("https://", "http://"):
+        if target.startswith(scheme):
+            target = target[len(scheme):]
+    return job_key(source, kind, target.rstrip("/"))
+
+
+class CrawlFrontier:
+    """
+    Frontier de crawl partagé dans Redis.
+    Les jobs sont dans un ZSET trié par date d'échéance (le plus en retard d'abord);
+    un nombre quelconque de workers en retire des lots de façon atomique.
+    Un filtre de Bloom (SETBIT) déduplique à la planification les jobs de toutes les sources
+    (listings, stores, fiches produit) entre runs.
+    """
+
+    def __init__(
+        self,
+        redis_url: str,
+        namespace: str = "frontier",
+        lease_seconds: int = 900,
+        retry_seconds: int = 1800,
+        bloom_bits: int = 2 ** 24,
+        bloom_hashes: int = 7
+    ):
+        self.redis_url = redis_url
+        self.lease_seconds = lease_seconds
+        self.retry_seconds = retry_seconds
+        self.bloom_bits = bloom_bits
+        self.bloom_hashes = bloom_hashes
+        self.queue_key = f"{namespace}:due"
+        self.seen_key = f"{namespace}:seen"
+        self._redis = None
+        self._scripts = {}
+
+    async def schedule(self, jobs: Iterable[str], due_at: Optional[float] = None, only_new: bool = True) -> int:
+        """
+        Planifier des jobs (dus immédiatement par défaut). Avec only_new, les jobs
+        déjà vus par le filtre de Bloom sont écartés, quelle que soit leur source,
+        et un job déjà présent garde son échéance.
+        """
+        jobs = list(dict.fromkeys(jobs))
+        if only_new:
+            jobs = await self.filter_new(jobs)
+        if not jobs:
+            return 0
+
+        client = await self._get_redis()
+        if due_at is None:
+            due_at = float((await client.time())[0])
+
+        return await client.zadd(self.queue_key, {job: due_at for job in jobs}, nx=only_new)
+
+    async def pop_due(self, batch_size: int) -> List[str]:
+        """Retirer (sous bail) jusqu'à `batch_size` jobs dus, les plus en retard d'abord"""
+        await self._get_redis()
+        jobs = await self._scripts["pop_due"](keys=[self.queue_key], args=[batch_size, self.lease_seconds])
+        return [job.decode() if isinstance(job, bytes) else job for job in jobs]
+
+    async def complete(self, job: str, succeeded: bool = True):
+        """
+        Replanifier un job terminé selon l'intervalle de re-crawl de son type,
+        ou après `retry_seconds` s'il a échoué
+        """
+        client = await self._get_redis()
+        now = float((await client.time())[0])
+
+        if succeeded:
+            interval = RECRAWL_INTERVALS["product" if parse_job(job)[1] == "product" else "listing"]
+        else:
+            interval = self.retry_seconds
+
+        await client.zadd(self.queue_key, {job: now + interval}, xx=True)
+
+    async def filter_new(self, keys: Iterable[str]) -> List[str]:
+        """Garder les jobs jamais vus (filtre de Bloom) et les marquer comme vus"""
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return []
+
+        await self._get_redis()
+
+        positions = []
+        for key in keys:
+            positions.extend(self._bloom_positions(seen_key(key)))
+
+        new_indexes = await self._scripts["bloom_add"](keys=[self.seen_key], args=[self.bloom_hashes] + positions)
+        return [keys[int(i)] for i in new_indexes]
+
+    async def stats(self) -> Dict:
+        client = await self._get_redis()
+        now = float((await client.time())[0])
+
+        return {
+            "queued": await client.zcard(self.queue_key),
+            "due": await client.zcount(self.queue_key, "-inf", now),
+            "seen_bits_set": await client.bitcount(self.seen_key)
+        }
+
+    async def aclose(self):
+        """Fermer la connexion Redis (arrêt du worker)"""
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    def _bloom_positions(self, key: str) -> List[int]:
+        """k positions par double hachage (h1 + i * h2)"""
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.bloom_bits for i in range(self.bloom_hashes)]
+
+    async def _get_redis(self):
+        if self._redis is None:
+            import redis.asyncio as aioredis
+
+            self._redis = aioredis.from_url(self.redis_url)
+            self._scripts = {
+                "pop_due": self._redis.register_script(_POP_DUE_SCRIPT),
+                "bloom_add": self._redis.register_script(_BLOOM_ADD_SCRIPT)
+            }
+
+        return self._redis
+
+
+# Instance globale
+crawl_frontier = CrawlFrontier(
+    redis_url=os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+    lease_seconds=int(os.getenv("FRONTIER_LEASE_SECONDS", "900")),
+    retry_seconds=int(os.getenv("FRONTIER_RETRY_SECONDS", "1800")),
+    bloom_bits=int(os.getenv("FRONTIER_BLOOM_BITS", str(2 ** 24))),
+    bloom_hashes=int(os.getenv("FRONTIER_BLOOM_HASHES", "7"))
+)
@@ -0,0 +1,168 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+from loguru import logger
+
+from scrapers.cache import scraper_cache
+from scrapers.rate_limiter import rate_limiter
+from scrapers.proxy_rotator import proxy_rotator
+from scrapers.resilience import resilient_fetch
+
+
+# Profils de timeout par source
+SOURCE_TIMEOUTS: Dict[str, httpx.Timeout] = {
+    "aliexpress": httpx.Timeout(30.0, connect=10.0),
+    "ebay": httpx.Timeout(20.0, connect=5.0),
+    "shopify": httpx.Timeout(15.0, connect=5.0)
+}
+
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+# Durée de conservation des validateurs (ETag / Last-Modified) et du résultat parsé
+VALIDATORS_TTL = 7 * 24 * 3600
+
+
+class HttpClientRegistry:
+    """
+    Clients httpx partagés par source (pool de connexions, keep-alive, HTTP/2).
+    Les connexions sont réutilisées entre appels et entre tâches du worker.
+    Un client distinct est gardé pour chaque proxy utilisé par la source.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        http2: bool = True
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.http2 = http2
+        # Hooks appelés sur chaque réponse (enregistrement de fixtures)
+        self.response_hooks: List[Callable[[httpx.Response], Awaitable[None]]] = []
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def get(self, source: str, proxy: Optional[str] = None) -> httpx.AsyncClient:
+        """Récupérer (ou créer) le client partagé d'une source (et d'un proxy)"""
+        loop = asyncio.get_running_loop()
+
+        if self._loop is not loop:
+            if self._clients:
+                # Les connexions sont liées à la boucle qui les a ouvertes
+                logger.warning("HTTP clients were bound to another event loop, recreating them")
+            self._clients = {}
+            self._loop = loop
+
+        key = f"{source}|{proxy}" if proxy else source
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=self.limits,
+                timeout=SOURCE_TIMEOUTS.get(source, DEFAULT_TIMEOUT),
+                follow_redirects=True,
+                proxy=proxy,
+                event_hooks={"response": list(self.response_hooks)}
+            )
+            self._clients[key] = client
+            logger.info(f"Created shared HTTP client for {source}" + (f" via {proxy}" if proxy else ""))
+
+        return client
+
+    @asynccontextmanager
+    async def client(self, source: str, proxy: Optional[str] = None):
+        """
+        Emprunter le client partagé d'une source (il n'est pas fermé à la sortie)
+        """
+        yield self.get(source, proxy)
+
+    async def aclose(self):
+        """Fermer tous les clients (arrêt du worker)"""
+        for key, client in self._clients.items():
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"Error closing HTTP client for {key}: {str(e)}")
+
+        self._clients = {}
+        self._loop = None
+
+
+async def conditional_get(
+    source: str,
+    url: str,
+    headers: Dict[str, str],
+    parse: Callable[[httpx.Response], Any],
+    variant: str = "",
+    cache: bool = True
+) -> Any:
+    """
+    GET conditionnel: envoie If-None-Match / If-Modified-Since quand des
+    validateurs sont connus pour l'URL. Sur un 304, le résultat parsé stocké
+    est réutilisé sans re-télécharger ni re-parser la page.
+    `variant` distingue les résultats parsés différemment pour une même URL.
+    `cache=False`: GET simple, sans validateurs ni résultat stockés (pages d'un
+    parcours paginé, dont le stockage croîtrait avec la taille du catalogue).
+    """
+    validators_key = f"validators_{url}_{variant}"
+    stored = await scraper_cache.get(validators_key) if cache else None
+
+    request_headers = dict(headers)
+    if stored:
+        if stored.get("etag"):
+            request_headers["If-None-Match"] = stored["etag"]
+        if stored.get("last_modified"):
+            request_headers["If-Modified-Since"] = stored["last_modified"]
+
+    async def fetch() -> httpx.Response:
+        await rate_limiter.acquire(source, url)
+
+        # Les timeouts et erreurs de connexion comptent comme des échecs du proxy
+        async with proxy_rotator.lease() as lease:
+            async with http_clients.client(source, lease.proxy) as client:
+                response = await client.get(url, headers=request_headers)
+            lease.report(response.status_code)
+
+        await rate_limiter.observe(source, url, response.status_code, response.headers)
+
+        if not (response.status_code == 304 and stored):
+            response.raise_for_status()
+        return response
+
+    # Retries sur les erreurs transitoires, derrière le circuit breaker de la source
+    response = await resilient_fetch(source, fetch)
+
+    if response.status_code == 304:
+        logger.info(f"Not modified, reusing parsed result for {url}")
+        await scraper_cache.set(validators_key, stored, ttl=VALIDATORS_TTL)
+        return stored["result"]
+
+    result = parse(response)
+
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if cache and (etag or last_modified):
+        await scraper_cache.set(validators_key, {
+            "etag": etag,
+            "last_modified": last_modified,
+            "result": result
+        }, ttl=VALIDATORS_TTL)
+
+    return result
+
+
+# Instance globale
+http_clients = HttpClientRegistry(
+    max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "20")),
+    max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "10")),
+    keepalive_expiry=float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30")),
+    http2=os.getenv("HTTP_HTTP2", "true").lower() == "true"
+)
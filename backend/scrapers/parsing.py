@@ -0,0 +1,123 @@
+import os
+from typing import List, Optional
+
+from bs4 import BeautifulSoup
+from cssselect import GenericTranslator
+from lxml import etree, html as lxml_html
+
+
+# Backend de parsing: "lxml" (rapide) ou "bs4" (html.parser, comportement historique)
+PARSER_BACKEND = os.getenv("SCRAPER_PARSER", "lxml")
+
+_translator = GenericTranslator()
+
+
+class Selector:
+    """Sélecteur CSS compilé une seule fois en XPath"""
+
+    __slots__ = ("css", "in_document", "in_node")
+
+    def __init__(self, css: str):
+        self.css = css
+        self.in_document = etree.XPath(_translator.css_to_xpath(css, prefix="descendant-or-self::"))
+        # Comme find() de BeautifulSoup: uniquement les descendants, pas le noeud lui-même
+        self.in_node = etree.XPath(_translator.css_to_xpath(css, prefix="descendant::"))
+
+
+class SelectorSet:
+    """Ensemble de sélecteurs précompilés pour une source"""
+
+    def __init__(self, **selectors: str):
+        for name, css in selectors.items():
+            setattr(self, name, Selector(css))
+
+
+class LxmlNode:
+    """Élément HTML (backend lxml)"""
+
+    __slots__ = ("element",)
+
+    def __init__(self, element):
+        self.element = element
+
+    def _query(self, selector: Selector):
+        return selector.in_node(self.element)
+
+    def select(self, selector: Selector, limit: Optional[int] = None) -> List["LxmlNode"]:
+        elements = self._query(selector)
+        if limit is not None:
+            elements = elements[:limit]
+        return [LxmlNode(e) for e in elements]
+
+    def select_one(self, selector: Selector) -> Optional["LxmlNode"]:
+        elements = self._query(selector)
+        return LxmlNode(elements[0]) if elements else None
+
+    @property
+    def text(self) -> str:
+        return str(self.element.text_content())
+
+    def attr(self, name: str) -> Optional[str]:
+        return self.element.get(name)
+
+
+class LxmlDocument(LxmlNode):
+    """Document HTML complet (backend lxml)"""
+
+    __slots__ = ()
+
+    def _query(self, selector: Selector):
+        if self.element is None:
+            return []
+        return selector.in_document(self.element)
+
+
+class SoupNode:
+    """Élément HTML (backend BeautifulSoup)"""
+
+    __slots__ = ("element",)
+
+    def __init__(self, element):
+        self.element = element
+
+    def select(self, selector: Selector, limit: Optional[int] = None) -> List["SoupNode"]:
+        elements = self.element.select(selector.css)
+        if limit is not None:
+            elements = elements[:limit]
+        return [SoupNode(e) for e in elements]
+
+    def select_one(self, selector: Selector) -> Optional["SoupNode"]:
+        element = self.element.select_one(selector.css)
+        return SoupNode(element) if element is not None else None
+
+    @property
+    def text(self) -> str:
+        return self.element.get_text()
+
+    def attr(self, name: str) -> Optional[str]:
+        value = self.element.get(name)
+        if isinstance(value, list):
+            return " ".join(value)
+        return value
+
+
+def parse_html(content: str, backend: Optional[str] = None):
+    """
+    Parser une page HTML avec le backend configuré.
+    Les deux backends exposent la même interface (select, select_one, text, attr).
+    """
+    backend = backend or PARSER_BACKEND
+
+    if backend == "bs4":
+        return SoupNode(BeautifulSoup(content, 'html.parser'))
+
+    if not content or not content.strip():
+        return LxmlDocument(None)
+
+    try:
+        root = lxml_html.fromstring(content)
+    except ValueError:
+        # Chaîne unicode avec déclaration d'encodage XML
+        root = lxml_html.fromstring(content.encode('utf-8'))
+
+    return LxmlDocument(root)
@@ -0,0 +1,232 @@
+import asyncio
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import httpx
+from loguru import logger
+from playwright.async_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+
+
+# Réponses qui signalent un proxy banni ou bloqué
+BAN_STATUS_CODES = {403, 407, 429}
+
+# Poids des dernières mesures dans les moyennes glissantes
+EWMA_ALPHA = 0.2
+
+# Latence supposée d'un proxy encore jamais utilisé (secondes)
+INITIAL_LATENCY = 1.0
+
+
+def is_proxy_failure(error: BaseException) -> bool:
+    """
+    Erreurs imputables au proxy: connexion refusée ou coupée, timeouts, erreurs
+    réseau Playwright (net::ERR_...). Pas les 5xx de l'origine ni le parsing.
+    """
+    if isinstance(error, (httpx.TransportError, asyncio.TimeoutError, PlaywrightTimeoutError)):
+        return True
+    return isinstance(error, PlaywrightError) and "net::ERR_" in str(error)
+
+
+class ProxyState:
+    """Santé d'un proxy: taux de succès et latence glissants, quarantaine"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.success_rate = 1.0
+        self.latency = INITIAL_LATENCY
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.quarantined_until = 0.0
+
+    def quarantined(self, now: float) -> bool:
+        return self.quarantined_until > now
+
+    @property
+    def weight(self) -> float:
+        """Les proxies rapides et fiables sont tirés plus souvent"""
+        return max(self.success_rate, 0.05) / max(self.latency, 0.05)
+
+
+class ProxyLease:
+    """Proxy emprunté pour une requête; l'appelant signale le résultat"""
+
+    def __init__(self, proxy: Optional[str]):
+        self.proxy = proxy
+        self.started_at = time.monotonic()
+        self.latency: Optional[float] = None
+        self.banned = False
+
+    def report(self, status_code: int, latency: Optional[float] = None):
+        """Enregistrer le statut HTTP obtenu (et la latence si mesurée par l'appelant)"""
+        self.latency = latency if latency is not None else time.monotonic() - self.started_at
+        if status_code in BAN_STATUS_CODES:
+            self.banned = True
+
+    def ban(self):
+        """Signaler un blocage détecté dans le contenu (captcha...)"""
+        self.banned = True
+
+
+def normalize_proxy(proxy: str) -> str:
+    """host:port -> http://host:port"""
+    return proxy if "://" in proxy else f"http://{proxy}"
+
+
+def playwright_proxy(proxy: str) -> Dict[str, str]:
+    """Configuration proxy au format Playwright (identifiants séparés)"""
+    parsed = urlparse(proxy)
+    settings = {"server": f"{parsed.scheme}://{parsed.hostname}:{parsed.port}"}
+    if parsed.username:
+        settings["username"] = parsed.username
+        settings["password"] = parsed.password or ""
+    return settings
+
+
+class ProxyRotator:
+    """
+    Rotation des proxies pondérée par leur santé.
+    Chaque proxy garde un taux de succès et une latence glissants; les bans et
+    timeouts le mettent en quarantaine avec un backoff exponentiel, et le nombre
+    de requêtes simultanées par proxy est plafonné.
+    Sans PROXY_LIST, les requêtes partent en direct (proxy None).
+    """
+
+    def __init__(
+        self,
+        proxies: Optional[List[str]] = None,
+        max_concurrency: int = 4,
+        quarantine_seconds: float = 30.0,
+        max_quarantine_seconds: float = 1800.0
+    ):
+        self.max_concurrency = max_concurrency
+        self.quarantine_seconds = quarantine_seconds
+        self.max_quarantine_seconds = max_quarantine_seconds
+        self._states: Dict[str, ProxyState] = {
+            normalize_proxy(p): ProxyState(normalize_proxy(p)) for p in proxies or []
+        }
+        self._available: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def proxies(self) -> List[str]:
+        return list(self._states)
+
+    @asynccontextmanager
+    async def lease(self):
+        """
+        Emprunter un proxy pour une requête. Un ban signalé (403 / 407 / 429,
+        captcha) ou une erreur de connexion / timeout levée dans le bloc compte
+        comme un échec du proxy; les autres exceptions (5xx de l'origine, parsing)
+        sont propagées sans pénaliser le proxy.
+        """
+        if not self._states:
+            yield ProxyLease(None)
+            return
+
+        state = await self._acquire()
+        lease = ProxyLease(state.url)
+        failed = None  # None: requête annulée, rien à enregistrer
+
+        try:
+            yield lease
+            failed = lease.banned
+        except Exception as e:
+            if lease.banned or is_proxy_failure(e):
+                failed = True
+            raise
+        finally:
+            await self._release(state, lease, failed)
+
+    def stats(self) -> Dict[str, Dict]:
+        """Santé de chaque proxy, pour repérer ceux qui ralentissent le scraping"""
+        now = time.monotonic()
+        return {
+            url: {
+                "success_rate": round(state.success_rate, 3),
+                "latency_ms": round(state.latency * 1000, 1),
+                "in_flight": state.in_flight,
+                "requests": state.requests,
+                "failures": state.failures,
+                "quarantined_for_s": round(max(0.0, state.quarantined_until - now), 1)
+            }
+            for url, state in self._states.items()
+        }
+
+    def _condition(self) -> asyncio.Condition:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # La condition est liée à la boucle du worker
+            self._available = asyncio.Condition()
+            self._loop = loop
+        return self._available
+
+    async def _acquire(self) -> ProxyState:
+        available = self._condition()
+
+        async with available:
+            while True:
+                state = self._choose()
+                if state is not None:
+                    state.in_flight += 1
+                    state.requests += 1
+                    return state
+
+                # Tous les proxies sains sont à leur plafond de requêtes simultanées
+                await available.wait()
+
+    def _choose(self) -> Optional[ProxyState]:
+        now = time.monotonic()
+        states = list(self._states.values())
+
+        healthy = [s for s in states if not s.quarantined(now)]
+        if not healthy:
+            # Tout est en quarantaine: sonder celui qui en sort le plus tôt
+            probe = min(states, key=lambda s: s.quarantined_until)
+            logger.warning(f"All proxies quarantined, probing {probe.url}")
+            healthy = [probe]
+
+        candidates = [s for s in healthy if s.in_flight < self.max_concurrency]
+        if not candidates:
+            return None
+
+        return random.choices(candidates, weights=[s.weight for s in candidates])[0]
+
+    async def _release(self, state: ProxyState, lease: ProxyLease, failed: Optional[bool]):
+        if failed:
+            state.failures += 1
+            state.consecutive_failures += 1
+            state.success_rate = (1 - EWMA_ALPHA) * state.success_rate
+
+            backoff = min(
+                self.max_quarantine_seconds,
+                self.quarantine_seconds * 2 ** (state.consecutive_failures - 1)
+            )
+            state.quarantined_until = time.monotonic() + backoff
+            logger.warning(f"Proxy {state.url} quarantined for {backoff:.0f}s "
+                           f"({state.consecutive_failures} consecutive failures)")
+        elif failed is not None:
+            state.consecutive_failures = 0
+            state.success_rate = (1 - EWMA_ALPHA) * state.success_rate + EWMA_ALPHA
+
+            latency = lease.latency if lease.latency is not None else time.monotonic() - lease.started_at
+            state.latency = (1 - EWMA_ALPHA) * state.latency + EWMA_ALPHA * latency
+
+        available = self._condition()
+        async with available:
+            state.in_flight -= 1
+            available.notify_all()
+
+
+# Instance globale
+proxy_rotator = ProxyRotator(
+    proxies=[p.strip() for p in os.getenv("PROXY_LIST", "").split(",") if p.strip()],
+    max_concurrency=int(os.getenv("PROXY_MAX_CONCURRENCY", "4")),
+    quarantine_seconds=float(os.getenv("PROXY_QUARANTINE_SECONDS", "30")),
+    max_quarantine_seconds=float(os.getenv("PROXY_MAX_QUARANTINE_SECONDS", "1800"))
+)
@@ -0,0 +1,260 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional, Tuple
+from urllib.parse import urlparse
+
+from loguru import logger
+
+
+# Débit par source: (requêtes par minute, burst)
+SOURCE_RATE_LIMITS: Dict[str, Tuple[float, int]] = {
+    "amazon": (10, 2),
+    "aliexpress": (20, 4),
+    "ebay": (20, 4),
+    "shopify": (40, 8),
+    "tiktok": (10, 2),
+    "pinterest": (10, 2)
+}
+
+DEFAULT_RATE_LIMIT: Tuple[float, int] = (10, 2)
+
+# Délai appliqué sur un 429 sans en-tête Retry-After (secondes)
+DEFAULT_RETRY_AFTER = 60.0
+
+# Le débit ne descend jamais sous base_rate / MAX_SLOWDOWN après des 429
+MAX_SLOWDOWN = 8
+
+# Buckets partagés (Redis): après un 429 et la fin du blocage, le débit remonte de
+# 10% du débit nominal toutes les RATE_RECOVERY_SECONDS, sans dépendre d'un worker
+RATE_RECOVERY_SECONDS = float(os.getenv("RATE_RECOVERY_SECONDS", "60"))
+
+
+def get_source_rate_limit(source: str) -> Tuple[float, int]:
+    """
+    Configuration (par minute, burst) d'une source, surchargeable via
+    RATE_LIMIT_<SOURCE>="30/5"
+    """
+    override = os.getenv(f"RATE_LIMIT_{source.upper()}")
+    if override:
+        try:
+            per_minute, burst = override.split("/")
+            return float(per_minute), int(burst)
+        except ValueError:
+            logger.warning(f"Invalid RATE_LIMIT_{source.upper()} value: {override}")
+
+    return SOURCE_RATE_LIMITS.get(source, DEFAULT_RATE_LIMIT)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Convertir un en-tête Retry-After (secondes ou date HTTP) en secondes"""
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Token bucket local pour un domaine"""
+
+    def __init__(self, requests_per_minute: float, burst: int):
+        self.base_rate = requests_per_minute / 60.0
+        self.rate = self.base_rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+
+    def reserve(self) -> float:
+        """
+        Réserver un jeton et retourner le temps d'attente nécessaire.
+        Le jeton est consommé d'avance pour que les appels concurrents
+        s'ordonnent sans verrou.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+        wait = 0.0
+        if self.tokens < 1:
+            wait = (1 - self.tokens) / self.rate
+
+        self.tokens -= 1
+
+        if self.blocked_until > now:
+            wait = max(wait, self.blocked_until - now)
+
+        return wait
+
+    def penalize(self, retry_after: float):
+        """Bloquer le domaine et réduire le débit après un 429"""
+        now = time.monotonic()
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+        self.rate = max(self.base_rate / MAX_SLOWDOWN, self.rate / 2)
+        self.tokens = 0.0
+        self.updated_at = now
+
+    def recover(self):
+        """Remonter progressivement vers le débit nominal"""
+        self.rate = min(self.base_rate, self.rate + self.base_rate * 0.1)
+
+    @property
+    def throttled(self) -> bool:
+        return self.rate < self.base_rate
+
+
+# Scripts Lua: le bucket est partagé par tous les workers via Redis.
+# recovered_at: début du prochain palier de remontée du débit (fin du blocage après un 429)
+_RESERVE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local base_rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local recovery = tonumber(ARGV[3])
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'blocked_until', 'rate', 'recovered_at')
+local tokens = tonumber(b[1]) or burst
+local ts = tonumber(b[2]) or now
+local blocked = tonumber(b[3]) or 0
+local rate = tonumber(b[4]) or base_rate
+local recovered_at = tonumber(b[5]) or now
+if rate < base_rate and now - recovered_at >= recovery then
+    local steps = math.floor((now - recovered_at) / recovery)
+    rate = math.min(base_rate, rate + steps * base_rate * 0.1)
+    recovered_at = recovered_at + steps * recovery
+end
+tokens = math.min(burst, tokens + (now - ts) * rate)
+local wait = 0
+if tokens < 1 then wait = (1 - tokens) / rate end
+tokens = tokens - 1
+if blocked > now then wait = math.max(wait, blocked - now) end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now, 'rate', rate, 'recovered_at', recovered_at)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+"""
+
+_PENALIZE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local base_rate = tonumber(ARGV[1])
+local retry_after = tonumber(ARGV[2])
+local min_rate = tonumber(ARGV[3])
+local b = redis.call('HMGET', KEYS[1], 'blocked_until', 'rate')
+local blocked = math.max(tonumber(b[1]) or 0, now + retry_after)
+local rate = tonumber(b[2]) or base_rate
+redis.call('HSET', KEYS[1], 'tokens', 0, 'ts', now,
+    'blocked_until', blocked,
+    'rate', math.max(min_rate, rate / 2),
+    'recovered_at', blocked)
+redis.call('EXPIRE', KEYS[1], 3600)
+return 1
+"""
+
+
+class RateLimiter:
+    """
+    Rate limiting asynchrone, un token bucket par domaine.
+    Avec RATE_LIMIT_BACKEND=redis, les buckets sont partagés entre workers et
+    leur débit remonte avec le temps (script de réservation); sinon, chaque
+    succès fait remonter le débit du bucket local.
+    """
+
+    def __init__(self, redis_url: Optional[str] = None):
+        self.redis_url = redis_url
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._throttled_keys = set()
+        self._redis = None
+        self._scripts = {}
+
+    async def acquire(self, source: str, url: Optional[str] = None):
+        """Attendre un jeton pour le domaine de l'URL (ou la source)"""
+        key = self._key(source, url)
+        requests_per_minute, burst = get_source_rate_limit(source)
+
+        wait = await self._reserve_shared(key, requests_per_minute, burst)
+        if wait is None:
+            wait = self._bucket(key, requests_per_minute, burst).reserve()
+
+        if wait > 0:
+            logger.info(f"Rate limiting {key}: waiting {wait:.2f}s")
+            await asyncio.sleep(wait)
+
+    async def observe(self, source: str, url: Optional[str], status_code: int, headers: Mapping[str, str]):
+        """
+        Adapter le bucket selon la réponse: 429 (ou 503 avec Retry-After)
+        bloque le domaine et réduit son débit, un succès fait remonter celui
+        du bucket local (le bucket partagé remonte seul, cf. _RESERVE_SCRIPT)
+        """
+        key = self._key(source, url)
+        requests_per_minute, burst = get_source_rate_limit(source)
+        retry_after = parse_retry_after(headers.get("Retry-After") or headers.get("retry-after"))
+
+        if status_code == 429 or (status_code == 503 and retry_after is not None):
+            retry_after = retry_after if retry_after is not None else DEFAULT_RETRY_AFTER
+            logger.warning(f"{key} returned {status_code}, backing off for {retry_after:.0f}s")
+
+            self._throttled_keys.add(key)
+            self._bucket(key, requests_per_minute, burst).penalize(retry_after)
+            await self._run_shared("penalize", key, requests_per_minute / 60.0, retry_after,
+                                   requests_per_minute / 60.0 / MAX_SLOWDOWN)
+
+        elif status_code < 400 and key in self._throttled_keys:
+            bucket = self._bucket(key, requests_per_minute, burst)
+            bucket.recover()
+
+            if not bucket.throttled:
+                self._throttled_keys.discard(key)
+
+    def _key(self, source: str, url: Optional[str]) -> str:
+        if url:
+            netloc = urlparse(url if "//" in url else f"https://{url}").netloc
+            if netloc:
+                return netloc.lower()
+        return source
+
+    def _bucket(self, key: str, requests_per_minute: float, burst: int) -> TokenBucket:
+        if key not in self._buckets:
+            self._buckets[key] = TokenBucket(requests_per_minute, burst)
+        return self._buckets[key]
+
+    async def _reserve_shared(self, key: str, requests_per_minute: float, burst: int) -> Optional[float]:
+        result = await self._run_shared("reserve", key, requests_per_minute / 60.0, burst, RATE_RECOVERY_SECONDS)
+        return float(result) if result is not None else None
+
+    async def _run_shared(self, script: str, key: str, *args):
+        """Exécuter un script Lua sur Redis; None si Redis n'est pas utilisé"""
+        if not self.redis_url:
+            return None
+
+        try:
+            if self._redis is None:
+                import redis.asyncio as aioredis
+
+                self._redis = aioredis.from_url(self.redis_url)
+                self._scripts = {
+                    "reserve": self._redis.register_script(_RESERVE_SCRIPT),
+                    "penalize": self._redis.register_script(_PENALIZE_SCRIPT)
+                }
+
+            return await self._scripts[script](keys=[f"ratelimit:{key}"], args=list(args))
+
+        except Exception as e:
+            logger.warning(f"Shared rate limiter unavailable, using local bucket: {str(e)}")
+            return None
+
+
+# Instance globale
+rate_limiter = RateLimiter(
+    redis_url=os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    if os.getenv("RATE_LIMIT_BACKEND", "local") == "redis" else None
+)
@@ -0,0 +1,199 @@
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+
+import httpx
+from loguru import logger
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from tenacity import AsyncRetrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+
+# Statuts HTTP transitoires qui justifient un nouvel essai
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_MAX_WAIT = float(os.getenv("RETRY_MAX_WAIT", "30"))
+
+T = TypeVar("T")
+
+
+class RetryableStatusError(Exception):
+    """Réponse transitoire obtenue hors httpx (pages Playwright)"""
+
+    def __init__(self, status_code: int, url: str):
+        super().__init__(f"HTTP {status_code} for {url}")
+        self.status_code = status_code
+
+
+class CircuitOpenError(Exception):
+    """Appel court-circuité: la source est considérée comme indisponible"""
+
+    def __init__(self, source: str, retry_in: float):
+        super().__init__(f"Circuit open for {source}, retry in {retry_in:.0f}s")
+        self.source = source
+        self.retry_in = retry_in
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Erreurs réseau, timeouts et statuts transitoires; pas les 4xx ni le parsing"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS_CODES
+    if isinstance(error, RetryableStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (httpx.TransportError, PlaywrightTimeoutError))
+
+
+# Compter un échec et ouvrir le circuit au seuil. À l'ouverture, le compteur est
+# laissé à seuil - 1: le premier échec après le cool-down (half-open) le rouvre
+_RECORD_FAILURE_SCRIPT = """
+local failures = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+if failures >= tonumber(ARGV[1]) then
+    redis.call('SET', KEYS[2], '1', 'EX', tonumber(ARGV[3]))
+    redis.call('SET', KEYS[1], tonumber(ARGV[1]) - 1, 'EX', tonumber(ARGV[3]) + tonumber(ARGV[2]))
+    return 1
+end
+return 0
+"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker par source. Après `failure_threshold` échecs transitoires dans
+    la fenêtre, les appels échouent immédiatement pendant `cooldown_seconds`.
+    Avec Redis, l'état est partagé par tous les workers.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        window_seconds: int = 300,
+        cooldown_seconds: int = 120,
+        redis_url: Optional[str] = None
+    ):
+        self.failure_threshold = failure_threshold
+        self.window_seconds = window_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.redis_url = redis_url
+        self._failures: Dict[str, int] = {}
+        self._open_until: Dict[str, float] = {}
+        self._redis = None
+        self._record_failure = None
+        self._redis_down_until = 0.0
+
+    async def check(self, source: str):
+        """Lever CircuitOpenError si le circuit de la source est ouvert"""
+        retry_in = self._open_until.get(source, 0.0) - time.monotonic()
+
+        client = await self._get_redis()
+        if client is not None:
+            try:
+                ttl = await client.ttl(f"circuit:{source}:open")
+                retry_in = max(retry_in, float(ttl))
+            except Exception as e:
+                self._redis_failed(e)
+
+        if retry_in > 0:
+            raise CircuitOpenError(source, retry_in)
+
+    async def record_success(self, source: str):
+        self._failures.pop(source, None)
+
+        client = await self._get_redis()
+        if client is not None:
+            try:
+                await client.delete(f"circuit:{source}:failures")
+            except Exception as e:
+                self._redis_failed(e)
+
+    async def record_failure(self, source: str):
+        opened = False
+
+        client = await self._get_redis()
+        if client is not None:
+            try:
+                opened = bool(await self._record_failure(
+                    keys=[f"circuit:{source}:failures", f"circuit:{source}:open"],
+                    args=[self.failure_threshold, self.window_seconds, self.cooldown_seconds]
+                ))
+            except Exception as e:
+                self._redis_failed(e)
+                client = None
+
+        if client is None:
+            failures = self._failures.get(source, 0) + 1
+            self._failures[source] = failures
+            if failures >= self.failure_threshold:
+                self._failures[source] = self.failure_threshold - 1
+                opened = True
+
+        if opened:
+            self._open_until[source] = time.monotonic() + self.cooldown_seconds
+            logger.warning(f"Circuit opened for {source} for {self.cooldown_seconds}s")
+
+    def stats(self) -> Dict[str, Dict]:
+        now = time.monotonic()
+        return {
+            source: {"open_for_s": round(max(0.0, until - now), 1), "failures": self._failures.get(source, 0)}
+            for source, until in self._open_until.items()
+        }
+
+    async def _get_redis(self):
+        if not self.redis_url or time.monotonic() < self._redis_down_until:
+            return None
+
+        if self._redis is None:
+            import redis.asyncio as aioredis
+
+            self._redis = aioredis.from_url(self.redis_url)
+            self._record_failure = self._redis.register_script(_RECORD_FAILURE_SCRIPT)
+
+        return self._redis
+
+    def _redis_failed(self, error: Exception):
+        logger.warning(f"Shared circuit breaker unavailable, using local state: {str(error)}")
+        self._redis_down_until = time.monotonic() + 30
+
+
+async def resilient_fetch(source: str, fetch: Callable[[], Awaitable[T]]) -> T:
+    """
+    Exécuter un fetch idempotent avec retries (backoff exponentiel avec jitter)
+    derrière le circuit breaker de la source
+    """
+    await circuit_breaker.check(source)
+
+    retrying = AsyncRetrying(
+        stop=stop_after_attempt(RETRY_MAX_ATTEMPTS),
+        wait=wait_random_exponential(multiplier=1, max=RETRY_MAX_WAIT),
+        retry=retry_if_exception(is_retryable),
+        before_sleep=lambda state: logger.warning(
+            f"Retrying {source} fetch (attempt {state.attempt_number}): {str(state.outcome.exception())}"
+        ),
+        reraise=True
+    )
+
+    async for attempt in retrying:
+        with attempt:
+            # Le circuit peut s'ouvrir entre deux essais (autres workers)
+            if attempt.retry_state.attempt_number > 1:
+                await circuit_breaker.check(source)
+
+            try:
+                result = await fetch()
+            except Exception as e:
+                if is_retryable(e):
+                    await circuit_breaker.record_failure(source)
+                raise
+
+    await circuit_breaker.record_success(source)
+    return result
+
+
+# Instance globale
+circuit_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+    window_seconds=int(os.getenv("CIRCUIT_WINDOW_SECONDS", "300")),
+    cooldown_seconds=int(os.getenv("CIRCUIT_COOLDOWN_SECONDS", "120")),
+    redis_url=os.getenv("REDIS_URL", "redis://localhost:6379/0")
+    if os.getenv("CIRCUIT_BREAKER_BACKEND", "redis") == "redis" else None
+)
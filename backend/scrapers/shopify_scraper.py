@@ -1,10 +1,17 @@
-import httpx
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 from loguru import logger
-from scrapers.utils import get_headers, rate_limiter, scraper_cache, handle_scraping_error
+from contextlib import aclosing
+from scrapers.utils import get_headers, handle_scraping_error
+from scrapers.cache import scraper_cache
+from scrapers.http_client import conditional_get
+from scrapers.streaming import ProductStream, collect, stream_cached
 import json
 
 
+# Taille de page maximale acceptée par /products.json
+MAX_PAGE_SIZE = 250
+
+
 class ShopifyScraper:
     """Scraper pour Shopify stores"""
     
@@ -16,71 +23,164 @@ class ShopifyScraper:
         Scraper les produits d'un store Shopify via /products.json
         """
         cache_key = f"shopify_{store_url}"
-        cached_data = scraper_cache.get(cache_key)
+        return await scraper_cache.get_or_set(cache_key, lambda: collect(self._iter_products(store_url, limit)))
+    
+    def iter_products(self, store_url: str, limit: int = 50) -> ProductStream:
+        """
+        Produits d'un store Shopify en flux
+        """
+        cache_key = f"shopify_{store_url}"
+        return stream_cached(cache_key, lambda: self._iter_products(store_url, limit))
+    
+    async def _iter_products(self, store_url: str, limit: int) -> ProductStream:
+        """
+        Les `limit` premiers produits du catalogue, page par page
+        """
+        count = 0
         
-        if cached_data:
-            return cached_data
+        async with aclosing(self.iter_store_products(store_url, page_size=limit)) as pages:
+            async for products, cursor in pages:
+                for product in products[:limit - count]:
+                    count += 1
+                    yield product
+                
+                if count >= limit:
+                    break
         
-        products = []
+        logger.info(f"Successfully scraped {count} Shopify products from {store_url}")
+    
+    async def iter_store_products(
+        self,
+        store_url: str,
+        page_size: int = MAX_PAGE_SIZE,
+        cursor: Optional[Dict] = None,
+        use_since_id: bool = False
+    ) -> AsyncIterator[Tuple[List[Dict], Optional[Dict]]]:
+        """
+        Parcourir tout le catalogue d'un store, une page à la fois.
+        Produit (produits normalisés, curseur de la page suivante); le curseur
+        vaut None sur la dernière page et peut être sauvegardé pour reprendre
+        le parcours plus tard: {"page": n} ou {"since_id": id}.
+        """
+        store_url = self._normalize_store_url(store_url)
+        page_size = max(1, min(page_size, MAX_PAGE_SIZE))
         
-        try:
-            # Nettoyer l'URL
-            if not store_url.startswith('http'):
-                store_url = f"https://{store_url}"
+        if cursor is None:
+            cursor = {"since_id": 0} if use_since_id else {"page": 1}
+        
+        while cursor is not None:
+            if "since_id" in cursor:
+                url = f"{store_url}products.json?limit={page_size}&since_id={cursor['since_id']}"
+            else:
+                url = f"{store_url}products.json?limit={page_size}&page={cursor['page']}"
             
-            if not store_url.endswith('/'):
-                store_url += '/'
+            logger.info(f"Scraping Shopify catalogue page: {url}")
             
-            async with httpx.AsyncClient(
-                headers=self.headers, 
-                timeout=30.0,
-                follow_redirects=True
-            ) as client:
-                url = f"{store_url}products.json?limit={limit}"
-                
-                logger.info(f"Scraping Shopify store: {url}")
-                rate_limiter.wait()
-                
-                response = await client.get(url)
-                response.raise_for_status()
-                
-                data = response.json()
-                
-                if 'products' in data:
-                    for item in data['products']:
-                        try:
-                            # Récupérer le premier variant pour le prix
-                            variant = item.get('variants', [{}])[0]
-                            
-                            product = {
-                                "nom": item.get('title', 'Unknown'),
-                                "prix": float(variant.get('price', 0)),
-                                "url": f"{store_url}products/{item.get('handle', '')}",
-                                "source": "shopify",
-                                "categorie": item.get('product_type', 'general'),
-                                "image_url": item.get('images', [{}])[0].get('src', '') if item.get('images') else '',
-                                "rating": 0.0,
-                                "reviews_count": 0,
-                                "stock_status": "in_stock" if variant.get('available', False) else "out_of_stock",
-                                "description": item.get('body_html', '')[:500]  # Limiter la description
-                            }
-                            
-                            products.append(product)
-                            logger.info(f"Scraped Shopify product: {product['nom'][:50]}...")
-                        
-                        except Exception as e:
-                            logger.error(f"Error parsing Shopify product: {str(e)}")
-                            continue
-                
-                # Mettre en cache
-                scraper_cache.set(cache_key, products)
-                
-                logger.info(f"Successfully scraped {len(products)} Shopify products from {store_url}")
-                return products
+            try:
+                # Pages non mises en cache: la mémoire reste constante quelle que soit la taille du catalogue
+                page = await conditional_get(
+                    "shopify", url, self.headers,
+                    parse=lambda response: self._parse_catalogue_page(response.json(), store_url),
+                    cache=False
+                )
+            
+            except Exception as e:
+                # Le dernier curseur produit permet de reprendre à cet endroit
+                error = handle_scraping_error(e, "shopify", url)
+                return
+            
+            if page["count"] < page_size:
+                next_cursor = None
+            elif "since_id" in cursor:
+                next_cursor = {"since_id": page["last_id"]}
+            else:
+                next_cursor = {"page": cursor["page"] + 1}
+            
+            yield page["products"], next_cursor
+            cursor = next_cursor
+    
+    async def fetch_current_price(self, product_url: str) -> Optional[float]:
+        """
+        Prix actuel d'un produit via <store>/products/<handle>.json
+        (requête conditionnelle: un produit inchangé coûte un 304)
+        """
+        url = f"{product_url.rstrip('/')}.json"
+        
+        try:
+            return await conditional_get(
+                "shopify", url, self.headers,
+                parse=lambda response: self._parse_product_price(response.json())
+            )
         
         except Exception as e:
-            error = handle_scraping_error(e, "shopify", store_url)
-            return []
+            handle_scraping_error(e, "shopify", url)
+            return None
+    
+    def _parse_product_price(self, data: Dict) -> Optional[float]:
+        """
+        Prix du premier variant d'une réponse products/<handle>.json
+        """
+        variants = data.get('product', {}).get('variants') or [{}]
+        price = variants[0].get('price')
+        return float(price) if price is not None else None
+    
+    def _parse_catalogue_page(self, data: Dict, store_url: str) -> Dict:
+        """
+        Normaliser une page du catalogue en gardant de quoi calculer le curseur suivant
+        """
+        items = data.get('products', [])
+        
+        return {
+            "products": self._parse_products(data, store_url),
+            "count": len(items),
+            "last_id": max((item.get('id', 0) for item in items), default=0)
+        }
+    
+    def _normalize_store_url(self, store_url: str) -> str:
+        """
+        Nettoyer l'URL du store
+        """
+        if not store_url.startswith('http'):
+            store_url = f"https://{store_url}"
+        
+        if not store_url.endswith('/'):
+            store_url += '/'
+        
+        return store_url
+    
+    def _parse_products(self, data: Dict, store_url: str) -> List[Dict]:
+        """
+        Normaliser les produits d'une réponse products.json
+        """
+        products = []
+        
+        if 'products' in data:
+            for item in data['products']:
+                try:
+                    # Récupérer le premier variant pour le prix
+                    variant = item.get('variants', [{}])[0]
+                    
+                    product = {
+                        "nom": item.get('title', 'Unknown'),
+                        "prix": float(variant.get('price', 0)),
+                        "url": f"{store_url}products/{item.get('handle', '')}",
+                        "source": "shopify",
+                        "categorie": item.get('product_type', 'general'),
+                        "image_url": item.get('images', [{}])[0].get('src', '') if item.get('images') else '',
+                        "rating": 0.0,
+                        "reviews_count": 0,
+                        "stock_status": "in_stock" if variant.get('available', False) else "out_of_stock",
+                        "description": item.get('body_html', '')[:500]  # Limiter la description
+                    }
+                    
+                    products.append(product)
+                    logger.info(f"Scraped Shopify product: {product['nom'][:50]}...")
+                
+                except Exception as e:
+                    logger.error(f"Error parsing Shopify product: {str(e)}")
+                    continue
+        
+        return products
     
     async def detect_trending_stores(self, niche: str = "fashion") -> List[str]:
         """
@@ -2,7 +2,10 @@ import httpx
 from bs4 import BeautifulSoup
 from typing import List, Dict, Optional
 from loguru import logger
-from scrapers.utils import get_headers, rate_limiter, scraper_cache, handle_scraping_error
+from scrapers.utils import get_headers, handle_scraping_error
+from scrapers.cache import scraper_cache
+from scrapers.rate_limiter import rate_limiter
+from scrapers.streaming import ProductStream, iterate, stream_cached
 import json
 
 
@@ -19,11 +22,16 @@ class SocialScraper:
         Cette version utilise une approche simplifiée
         """
         cache_key = f"tiktok_trending_{hashtag}"
-        cached_data = scraper_cache.get(cache_key)
-        
-        if cached_data:
-            return cached_data
-        
+        return await scraper_cache.get_or_set(cache_key, lambda: self._scrape_tiktok_trending(hashtag, limit))
+    
+    def iter_tiktok_trending(self, hashtag: str = "tiktokmademebuyit", limit: int = 50) -> ProductStream:
+        """
+        Produits viraux TikTok en flux
+        """
+        cache_key = f"tiktok_trending_{hashtag}"
+        return stream_cached(cache_key, lambda: iterate(self._scrape_tiktok_trending(hashtag, limit)))
+    
+    async def _scrape_tiktok_trending(self, hashtag: str, limit: int) -> List[Dict]:
         products = []
         
         try:
@@ -31,7 +39,7 @@ class SocialScraper:
             # Ici on simule avec des données de démonstration
             
             logger.info(f"Scraping TikTok trending products for #{hashtag}")
-            rate_limiter.wait()
+            await rate_limiter.acquire("tiktok")
             
             # Exemple de produits tendances TikTok (à remplacer par vraie API)
             demo_products = [
@@ -75,9 +83,6 @@ class SocialScraper:
             
             products = demo_products[:limit]
             
-            # Mettre en cache
-            scraper_cache.set(cache_key, products)
-            
             logger.info(f"Successfully scraped {len(products)} TikTok trending products")
             return products
         
@@ -90,16 +95,21 @@ class SocialScraper:
         Détecter les produits viraux sur Pinterest
         """
         cache_key = f"pinterest_trending_{keyword}"
-        cached_data = scraper_cache.get(cache_key)
-        
-        if cached_data:
-            return cached_data
-        
+        return await scraper_cache.get_or_set(cache_key, lambda: self._scrape_pinterest_trending(keyword, limit))
+    
+    def iter_pinterest_trending(self, keyword: str = "trending products", limit: int = 50) -> ProductStream:
+        """
+        Produits viraux Pinterest en flux
+        """
+        cache_key = f"pinterest_trending_{keyword}"
+        return stream_cached(cache_key, lambda: iterate(self._scrape_pinterest_trending(keyword, limit)))
+    
+    async def _scrape_pinterest_trending(self, keyword: str, limit: int) -> List[Dict]:
         products = []
         
         try:
             logger.info(f"Scraping Pinterest trending products for: {keyword}")
-            rate_limiter.wait()
+            await rate_limiter.acquire("pinterest")
             
             # Pinterest nécessite une API ou scraping avancé
             # Simulation avec données de démonstration
@@ -145,9 +155,6 @@ class SocialScraper:
             
             products = demo_products[:limit]
             
-            # Mettre en cache
-            scraper_cache.set(cache_key, products)
-            
             logger.info(f"Successfully scraped {len(products)} Pinterest trending products")
             return products
         
@@ -0,0 +1,33 @@
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from scrapers.cache import scraper_cache
+
+
+# Contrat commun des scrapers: un flux de produits normalisés, produits au fil du parsing
+ProductStream = AsyncIterator[Dict]
+
+
+async def collect(stream: ProductStream) -> List[Dict]:
+    """Matérialiser un flux de produits en liste"""
+    return [product async for product in stream]
+
+
+async def iterate(products: Awaitable[List[Dict]]) -> ProductStream:
+    """Exposer une source qui produit une liste comme un flux"""
+    for product in await products:
+        yield product
+
+
+def stream_cached(
+    cache_key: str,
+    produce: Callable[[], ProductStream],
+    ttl: Optional[int] = None
+) -> ProductStream:
+    """
+    Flux avec cache: les produits déjà en cache sont rejoués, sinon ils sont
+    transmis dès qu'ils sont parsés puis mis en cache une fois le flux terminé.
+    Même clé de cache que les méthodes qui retournent une liste, et même
+    regroupement des scrapes concurrents que get_or_set.
+    """
+    # Un flux interrompu par le consommateur n'est pas mis en cache
+    return scraper_cache.stream_or_set(cache_key, produce, ttl)
@@ -1,6 +1,8 @@
 from celery_app import app
+from sqlalchemy import func, or_
 from sqlalchemy.orm import Session
-from models import SessionLocal, Alert, Product, PriceHistory
+from models import SessionLocal, Alert, Product, ProductObservationDaily
+from analytics.product_matching import cluster_competitor_count
 from loguru import logger
 from datetime import datetime, timedelta
 from decimal import Decimal
@@ -8,6 +10,14 @@ import os
 import httpx
 
 
+# Alertes dont le résultat ne change qu'avec le contenu du produit
+# (new_viral compte les relevés, contenu changé ou non: toujours réévaluée)
+PRODUCT_BOUND_ALERTS = ("price_drop",)
+
+# Fenêtre de changement examinée à chaque vérification (période du beat + marge)
+ALERT_CHANGE_WINDOW = timedelta(minutes=int(os.getenv("ALERT_CHANGE_WINDOW_MINUTES", "65")))
+
+
 @app.task(name='tasks.alert_tasks.check_alerts')
 def check_alerts():
     """
@@ -18,8 +28,19 @@ def check_alerts():
     db = SessionLocal()
     
     try:
-        # Récupérer toutes les alertes actives
-        alerts = db.query(Alert).filter(Alert.actif == True).all()
+        # Alertes actives; celles qui dépendent du produit seul ne sont réévaluées
+        # que si son contenu a changé depuis la vérification précédente, ou si
+        # elles viennent d'être créées (première évaluation)
+        changed_since = datetime.utcnow() - ALERT_CHANGE_WINDOW
+        
+        alerts = db.query(Alert).join(Product, Alert.product_id == Product.id).filter(
+            Alert.actif == True,
+            or_(
+                Alert.type_alerte.notin_(PRODUCT_BOUND_ALERTS),
+                Product.date_scrape >= changed_since,
+                Alert.created_at >= changed_since
+            )
+        ).all()
         
         triggered_alerts = []
         
@@ -42,23 +63,22 @@ def check_alerts():
                 
                 elif alert.type_alerte == "new_viral":
                     # Vérifier si le produit devient viral (augmentation rapide des reviews)
-                    recent_history = db.query(PriceHistory).filter(
-                        PriceHistory.product_id == product.id,
-                        PriceHistory.date >= datetime.utcnow() - timedelta(days=7)
-                    ).count()
+                    # Relevés sur 7 jours, prix changé ou non (l'historique ne garde que les changements)
+                    recent_history = db.query(func.coalesce(func.sum(ProductObservationDaily.observations), 0)).filter(
+                        ProductObservationDaily.product_id == product.id,
+                        ProductObservationDaily.bucket >= (datetime.utcnow() - timedelta(days=7)).date()
+                    ).scalar()
                     
                     if recent_history > 10:  # Activité élevée
                         should_trigger = True
                         message = f"🔥 Produit viral détecté ! {product.nom[:50]} - {product.reviews_count} reviews"
                 
                 elif alert.type_alerte == "low_saturation":
-                    # Vérifier si le marché est peu saturé
-                    competitors_count = db.query(Product).filter(
-                        Product.nom.ilike(f"%{product.nom[:20]}%"),
-                        Product.id != product.id
-                    ).count()
+                    # Vérifier si le marché est peu saturé (produits du même groupe,
+                    # produit pas encore rapproché: vérifié au passage suivant)
+                    competitors_count = cluster_competitor_count(db, product.id)
                     
-                    if competitors_count < 5:  # Peu de concurrence
+                    if competitors_count is not None and competitors_count < 5:  # Peu de concurrence
                         should_trigger = True
                         message = f"💎 Opportunité ! {product.nom[:50]} - Seulement {competitors_count} concurrents"
                 
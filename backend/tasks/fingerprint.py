@@ -0,0 +1,78 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from models import Product
+
+
+# Champs d'un produit normalisé couverts par l'empreinte (l'URL sert de clé, pas de contenu)
+FINGERPRINT_FIELDS = (
+    "nom", "categorie", "prix", "image_url", "description",
+    "asin", "reviews_count", "rating", "stock_status"
+)
+
+# Champs numériques arrondis comme en base (Numeric(10, 2) / Numeric(3, 2))
+_DECIMAL_FIELDS = {"prix", "rating"}
+
+# Un produit inchangé n'est "touché" qu'une fois par période (minutes)
+LAST_SEEN_RESOLUTION = timedelta(minutes=int(os.getenv("PRODUCT_LAST_SEEN_RESOLUTION_MINUTES", "60")))
+
+
+def _normalize(field: str, value) -> Optional[str]:
+    if value is None or value == "":
+        return None
+
+    if field in _DECIMAL_FIELDS:
+        try:
+            return f"{float(value):.2f}"
+        except (TypeError, ValueError):
+            return None
+
+    if field == "reviews_count":
+        try:
+            return str(int(value))
+        except (TypeError, ValueError):
+            return None
+
+    # Espaces superflus sans effet sur le contenu
+    return " ".join(str(value).split()) or None
+
+
+def product_fingerprint(product: Dict) -> str:
+    """
+    Empreinte stable d'un produit normalisé: deux scrapes du même contenu
+    (aux espaces et à l'arrondi près) donnent la même empreinte
+    """
+    canonical = {field: _normalize(field, product.get(field)) for field in FINGERPRINT_FIELDS}
+    payload = json.dumps(canonical, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def row_fingerprint(product: Product) -> str:
+    """
+    Empreinte d'un produit en base, après une écriture hors ingestion (prix
+    rafraîchi): le scrape suivant et le rapprochement voient le changement
+    """
+    return product_fingerprint({field: getattr(product, field) for field in FINGERPRINT_FIELDS})
+
+
+def touch_last_seen(db: Session, product_ids: Iterable[int], now: Optional[datetime] = None) -> int:
+    """
+    Marquer des produits inchangés comme vus, en une requête.
+    Les produits déjà vus depuis moins de LAST_SEEN_RESOLUTION ne sont pas réécrits.
+    """
+    product_ids = list(set(product_ids))
+    if not product_ids:
+        return 0
+
+    now = now or datetime.utcnow()
+
+    return db.query(Product).filter(
+        Product.id.in_(product_ids),
+        or_(Product.last_seen_at.is_(None), Product.last_seen_at < now - LAST_SEEN_RESOLUTION)
+    ).update({Product.last_seen_at: now}, synchronize_session=False)
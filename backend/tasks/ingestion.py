@@ -0,0 +1,222 @@
+import json
+import os
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional
+
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from models import Product
+from tasks.fingerprint import LAST_SEEN_RESOLUTION, product_fingerprint
+from tasks.price_history import OBSERVATIONS_UPSERT, ROLLUP_CTES
+
+
+# Produits envoyés par requête d'upsert
+UPSERT_CHUNK_SIZE = int(os.getenv("UPSERT_CHUNK_SIZE", "1000"))
+
+# Upsert d'un lot en une seule requête:
+# - incoming: lot dédoublonné sur la clé d'URL (le dernier scrapé l'emporte)
+# - upserted: insertion, ou mise à jour si l'empreinte a changé (RETURNING xmax = 0 -> inséré)
+# - previous: prix stockés avant la requête (toutes les CTE voient le même instantané)
+# - history: entrée d'historique pour chaque produit nouveau ou dont le prix a changé,
+#   répercutée dans les rollups journalier et hebdomadaire
+# - touched: last_seen_at des produits inchangés, au plus une fois par LAST_SEEN_RESOLUTION
+# - observed: un relevé du jour pour chaque produit du lot, modifié (upserted) ou inchangé
+# Les CTE upserted et touched portent sur des lignes disjointes (empreinte différente / identique).
+# Un champ optionnel absent du scrape (description, image...) garde sa valeur en base.
+_UPSERT_PRODUCTS = text("""
+    WITH incoming AS (
+        SELECT DISTINCT ON (product_url_key(r.url)) r.*
+        FROM jsonb_to_recordset(CAST(:rows AS jsonb)) AS r(
+            seq INTEGER, nom TEXT, categorie TEXT, prix NUMERIC, url TEXT, source TEXT,
+            image_url TEXT, description TEXT, asin TEXT, reviews_count INTEGER, rating NUMERIC,
+            stock_status TEXT, content_hash TEXT
+        )
+        ORDER BY product_url_key(r.url), r.seq DESC
+    ),
+    previous AS (
+        SELECT products.url_key, products.prix
+        FROM products
+        JOIN incoming ON products.url_key = product_url_key(incoming.url)
+    ),
+    upserted AS (
+        INSERT INTO products (
+            nom, categorie, prix, url, source, image_url, description, asin, reviews_count,
+            rating, stock_status, content_hash, date_scrape, last_seen_at, created_at, updated_at
+        )
+        SELECT
+            nom, categorie, prix, url, source, image_url, description, asin, reviews_count,
+            rating, stock_status, content_hash, :now, :now, :now, :now
+        FROM incoming
+        ON CONFLICT (url_key) DO UPDATE SET
+            nom = EXCLUDED.nom,
+            prix = EXCLUDED.prix,
+            categorie = COALESCE(EXCLUDED.categorie, products.categorie),
+            image_url = COALESCE(EXCLUDED.image_url, products.image_url),
+            description = COALESCE(EXCLUDED.description, products.description),
+            asin = COALESCE(EXCLUDED.asin, products.asin),
+            reviews_count = COALESCE(EXCLUDED.reviews_count, products.reviews_count),
+            rating = COALESCE(EXCLUDED.rating, products.rating),
+            stock_status = COALESCE(EXCLUDED.stock_status, products.stock_status),
+            content_hash = EXCLUDED.content_hash,
+            date_scrape = EXCLUDED.date_scrape,
+            last_seen_at = EXCLUDED.last_seen_at
+        WHERE products.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+        RETURNING id, url_key, prix, source, (xmax = 0) AS inserted
+    ),
+    history AS (
+        INSERT INTO price_history (product_id, prix, date, source)
+        SELECT upserted.id, upserted.prix, :now, upserted.source
+        FROM upserted
+        LEFT JOIN previous ON previous.url_key = upserted.url_key
+        WHERE previous.prix IS DISTINCT FROM upserted.prix
+        RETURNING product_id, prix, date
+    ),{rollups},
+    touched AS (
+        UPDATE products SET last_seen_at = :now
+        FROM incoming
+        WHERE products.url_key = product_url_key(incoming.url)
+            AND products.content_hash = incoming.content_hash
+            AND (products.last_seen_at IS NULL OR products.last_seen_at < :seen_before)
+        RETURNING products.id
+    ),
+    observed AS ({observations}
+    )
+    SELECT
+        (SELECT COUNT(*) FROM upserted WHERE inserted) AS inserted,
+        (SELECT COUNT(*) FROM upserted WHERE NOT inserted) AS updated,
+        (SELECT COUNT(*) FROM history) AS price_changes,
+        (SELECT COUNT(*) FROM touched) AS touched
+""".replace("{rollups}", ROLLUP_CTES).replace("{observations}", OBSERVATIONS_UPSERT.replace("{observed}", """(
+            SELECT id AS product_id FROM upserted
+            UNION ALL
+            SELECT products.id FROM products
+            JOIN incoming ON products.url_key = product_url_key(incoming.url)
+                AND products.content_hash = incoming.content_hash
+        ) observed""")))
+
+
+# Bornes des colonnes Numeric(10, 2) / Numeric(3, 2) et INTEGER
+_MAX_PRIX = Decimal("99999999.99")
+_MAX_RATING = Decimal("9.99")
+_MAX_INTEGER = 2 ** 31 - 1
+
+
+def _text(product: Dict, field: str) -> Optional[str]:
+    """Texte sans octet nul (refusé par Postgres), tronqué à la longueur de la colonne"""
+    value = product.get(field)
+    if value is None:
+        return None
+
+    value = str(value).replace("\x00", "")
+    length = getattr(Product.__table__.c[field].type, "length", None)
+    return value[:length] if length else value
+
+
+def _decimal(value, maximum: Decimal) -> Optional[Decimal]:
+    """Valeur arrondie au centime, None si elle n'est pas un nombre dans [0, maximum]"""
+    try:
+        number = Decimal(str(value)).quantize(Decimal("0.01"))
+    except (InvalidOperation, ValueError):
+        return None
+    return number if number.is_finite() and 0 <= number <= maximum else None
+
+
+def _upsert_row(seq: int, product: Dict) -> Dict:
+    """
+    Ligne du lot JSON: valeurs par défaut d'un nouveau produit, valeurs ramenées
+    aux types et bornes des colonnes, empreinte.
+    Lève ValueError pour un prix invalide (produit rejeté).
+    """
+    prix = _decimal(product.get('prix') or 0, _MAX_PRIX)
+    if prix is None:
+        raise ValueError(f"invalid price {product.get('prix')!r}")
+
+    try:
+        reviews_count = min(max(int(product.get('reviews_count') or 0), 0), _MAX_INTEGER)
+    except (TypeError, ValueError):
+        reviews_count = 0
+
+    rating = product.get('rating')
+
+    row = {
+        "seq": seq,
+        "nom": _text(product, 'nom') or 'Unknown',
+        "categorie": _text(product, 'categorie'),
+        "prix": prix,
+        "url": _text(product, 'url'),
+        "source": _text(product, 'source') or 'unknown',
+        "image_url": _text(product, 'image_url'),
+        "description": _text(product, 'description'),
+        "asin": _text(product, 'asin'),
+        # Comme à la création d'un produit: nombre d'avis inconnu = 0
+        "reviews_count": reviews_count,
+        "rating": _decimal(rating, _MAX_RATING) if rating is not None else None,
+        "stock_status": _text(product, 'stock_status')
+    }
+    row["content_hash"] = product_fingerprint(row)
+    return row
+
+
+def _upsert_chunk(db: Session, chunk: List[Dict], now: datetime, counts: Dict[str, int]):
+    """
+    Écrire un morceau du lot dans un savepoint. Si la requête échoue (contrainte,
+    valeur refusée par la base), le morceau est coupé en deux et chaque moitié
+    réessayée, jusqu'à isoler et journaliser le produit fautif.
+    """
+    try:
+        with db.begin_nested():
+            result = db.execute(_UPSERT_PRODUCTS, {
+                "rows": json.dumps(chunk, default=str),
+                "now": now,
+                "seen_before": now - LAST_SEEN_RESOLUTION
+            }).one()
+
+    except DBAPIError as e:
+        if len(chunk) == 1:
+            logger.error(f"Rejected product {chunk[0]['url']}: {str(e.orig).splitlines()[0]}")
+            counts["rejected"] += 1
+            return
+
+        middle = len(chunk) // 2
+        _upsert_chunk(db, chunk[:middle], now, counts)
+        _upsert_chunk(db, chunk[middle:], now, counts)
+        return
+
+    counts["inserted"] += result.inserted
+    counts["updated"] += result.updated
+    counts["unchanged"] += len(chunk) - result.inserted - result.updated
+    counts["price_changes"] += result.price_changes
+
+
+def upsert_products(db: Session, products: List[Dict]) -> Dict[str, int]:
+    """
+    Écrire un lot de produits normalisés en une requête par UPSERT_CHUNK_SIZE produits.
+    Un produit nouveau ou dont le prix change reçoit une entrée d'historique dans
+    la même requête. Retourne {"inserted", "updated", "unchanged", "price_changes",
+    "rejected"}; les doublons d'un même lot (même clé d'URL) comptent comme
+    inchangés, un produit invalide ou refusé par la base est rejeté seul.
+    """
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0, "price_changes": 0, "rejected": 0}
+    rows = []
+
+    for seq, product in enumerate(products):
+        if not product.get('url'):
+            continue
+
+        try:
+            rows.append(_upsert_row(seq, product))
+        except ValueError as e:
+            logger.error(f"Rejected product {product.get('url')}: {str(e)}")
+            counts["rejected"] += 1
+
+    now = datetime.utcnow()
+
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        _upsert_chunk(db, rows[start:start + UPSERT_CHUNK_SIZE], now, counts)
+
+    db.commit()
+    return counts
@@ -0,0 +1,106 @@
+import asyncio
+import os
+from typing import Callable, Dict, List, Optional, Union
+
+from loguru import logger
+from sqlalchemy.orm import Session
+
+
+# Taille max d'un micro-batch et délai max avant écriture d'un batch incomplet
+PIPELINE_BATCH_SIZE = int(os.getenv("PIPELINE_BATCH_SIZE", "500"))
+PIPELINE_FLUSH_MS = int(os.getenv("PIPELINE_FLUSH_MS", "500"))
+
+_STOP = object()
+
+
+class ProductPipeline:
+    """
+    Étape d'écriture en micro-batches: les scrapers poussent leurs produits au fil
+    du parsing, un consommateur unique les écrit en base tous les `batch_size`
+    produits ou toutes les `flush_interval_ms` millisecondes.
+    La file est bornée: un scraper plus rapide que la base attend (backpressure).
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        save: Callable[[Session, List[Dict]], Union[int, Dict[str, int]]],
+        batch_size: int = PIPELINE_BATCH_SIZE,
+        flush_interval_ms: int = PIPELINE_FLUSH_MS
+    ):
+        self.db = db
+        self.save = save
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.saved = 0
+        self.batches = 0
+        self.counts: Dict[str, int] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._consumer: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "ProductPipeline":
+        self._queue = asyncio.Queue(maxsize=self.batch_size * 4)
+        self._consumer = asyncio.create_task(self._consume())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # Écrire ce qui reste en file avant de rendre la main
+        await self._queue.put(_STOP)
+        await self._consumer
+
+    async def put(self, product: Dict):
+        """Pousser un produit vers l'écriture en base"""
+        if self._consumer.done():
+            raise RuntimeError("Product pipeline consumer has stopped")
+        await self._queue.put(product)
+
+    async def _consume(self):
+        loop = asyncio.get_running_loop()
+        batch: List[Dict] = []
+        deadline = 0.0
+
+        while True:
+            timeout = max(0.0, deadline - loop.time()) if batch else None
+
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                await self._flush(batch)
+                batch = []
+                continue
+
+            if item is _STOP:
+                break
+
+            if not batch:
+                deadline = loop.time() + self.flush_interval
+            batch.append(item)
+
+            if len(batch) >= self.batch_size:
+                await self._flush(batch)
+                batch = []
+
+        await self._flush(batch)
+
+    async def _flush(self, batch: List[Dict]):
+        if not batch:
+            return
+
+        loop = asyncio.get_running_loop()
+
+        # La session n'est utilisée que par un seul save à la fois
+        try:
+            result = await loop.run_in_executor(None, self.save, self.db, batch)
+            self.batches += 1
+        except Exception as e:
+            logger.error(f"Error saving batch of {len(batch)} products: {str(e)}")
+            self.db.rollback()
+            return
+
+        # Un save peut retourner un total ou des compteurs détaillés (inserted, updated, unchanged)
+        if isinstance(result, dict):
+            for name, count in result.items():
+                self.counts[name] = self.counts.get(name, 0) + count
+            self.saved += result.get("inserted", 0) + result.get("updated", 0)
+        else:
+            self.saved += result
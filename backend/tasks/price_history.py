@@ -0,0 +1,322 @@
+"""
+Écriture, rollups, partitions et compaction de l'historique des prix.
+
+L'historique ne reçoit une entrée que lorsqu'un prix change (ingestion et
+rafraîchissement planifié); chaque écriture met à jour dans la même requête
+les rollups journalier et hebdomadaire (min / max / moyenne / dernier prix).
+Chaque scrape, prix changé ou non, est compté par jour dans
+product_observations_daily (activité d'un produit, conservée OBSERVATION_RETENTION_DAYS).
+La table est partitionnée par mois: les partitions sont créées à l'avance et
+détachées après PRICE_HISTORY_RETENTION_MONTHS (les rollups sont conservés).
+
+Maintenance manuelle (depuis backend/):
+    python -m tasks.price_history partitions
+    python -m tasks.price_history compact [--chunk-size 1000]
+"""
+import argparse
+import json
+import os
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, List
+
+from loguru import logger
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from models import PriceHistory
+
+
+# Partitions mensuelles créées à l'avance et durée de conservation des données brutes
+PRICE_HISTORY_MONTHS_AHEAD = int(os.getenv("PRICE_HISTORY_MONTHS_AHEAD", "3"))
+PRICE_HISTORY_RETENTION_MONTHS = int(os.getenv("PRICE_HISTORY_RETENTION_MONTHS", "24"))
+
+# Résolution servie en lecture selon la période demandée (jours)
+HISTORY_RAW_MAX_DAYS = int(os.getenv("HISTORY_RAW_MAX_DAYS", "31"))
+HISTORY_DAILY_MAX_DAYS = int(os.getenv("HISTORY_DAILY_MAX_DAYS", "365"))
+
+# Conservation des compteurs de relevés journaliers (jours)
+OBSERVATION_RETENTION_DAYS = int(os.getenv("OBSERVATION_RETENTION_DAYS", "120"))
+
+_PARTITION_NAME = re.compile(r"^price_history_(\d{4})_(\d{2})$")
+
+
+def _rollup_cte(name: str, table: str, unit: str) -> str:
+    """
+    CTE qui agrège les lignes d'une CTE "history" (product_id, prix, date)
+    dans un rollup, par produit et par bucket date_trunc(unit)
+    """
+    return f"""
+    {name} AS (
+        INSERT INTO {table} AS rollup (
+            product_id, bucket, min_prix, max_prix, sum_prix, sample_count, last_prix, last_at
+        )
+        SELECT
+            product_id, CAST(date_trunc('{unit}', date) AS DATE), MIN(prix), MAX(prix), SUM(prix), COUNT(*),
+            (ARRAY_AGG(prix ORDER BY date DESC))[1], MAX(date)
+        FROM history
+        GROUP BY product_id, CAST(date_trunc('{unit}', date) AS DATE)
+        ON CONFLICT (product_id, bucket) DO UPDATE SET
+            min_prix = LEAST(rollup.min_prix, EXCLUDED.min_prix),
+            max_prix = GREATEST(rollup.max_prix, EXCLUDED.max_prix),
+            sum_prix = rollup.sum_prix + EXCLUDED.sum_prix,
+            sample_count = rollup.sample_count + EXCLUDED.sample_count,
+            last_prix = CASE WHEN EXCLUDED.last_at >= rollup.last_at THEN EXCLUDED.last_prix ELSE rollup.last_prix END,
+            last_at = GREATEST(rollup.last_at, EXCLUDED.last_at)
+    )"""
+
+
+# À ajouter après une CTE "history" ... RETURNING product_id, prix, date
+ROLLUP_CTES = ",".join([
+    _rollup_cte("daily_rollup", "price_history_daily", "day"),
+    _rollup_cte("weekly_rollup", "price_history_weekly", "week")
+])
+
+# Relevés du jour de :now pour les produits de {observed} (une ligne par relevé, colonne product_id)
+OBSERVATIONS_UPSERT = """
+        INSERT INTO product_observations_daily AS counter (product_id, bucket, observations)
+        SELECT product_id, CAST(:now AS DATE), COUNT(*)
+        FROM {observed}
+        GROUP BY product_id
+        ON CONFLICT (product_id, bucket) DO UPDATE SET observations = counter.observations + EXCLUDED.observations"""
+
+_RECORD_OBSERVATIONS = text(OBSERVATIONS_UPSERT.replace(
+    "{observed}", "unnest(CAST(:product_ids AS INTEGER[])) AS observed(product_id)"
+))
+
+# Lot d'entrées d'historique + rollups en une requête
+_INSERT_PRICE_HISTORY = text(f"""
+    WITH incoming AS (
+        SELECT * FROM jsonb_to_recordset(CAST(:rows AS jsonb))
+            AS r(product_id INTEGER, prix NUMERIC, source TEXT, date TIMESTAMP)
+    ),
+    history AS (
+        INSERT INTO price_history (product_id, prix, source, date)
+        SELECT product_id, prix, source, date FROM incoming
+        RETURNING product_id, prix, date
+    ),
+    {ROLLUP_CTES}
+    SELECT COUNT(*) FROM history
+""")
+
+# Entrées identiques au prix précédent du même produit (ordre chronologique),
+# à partir de :keep_from (semaines entièrement dans les partitions attachées)
+_DELETE_CONSECUTIVE_DUPLICATES = text("""
+    DELETE FROM price_history
+    USING (
+        SELECT id, date FROM (
+            SELECT id, date, prix, LAG(prix) OVER (PARTITION BY product_id ORDER BY date, id) AS previous_prix
+            FROM price_history
+            WHERE product_id >= :first_id AND product_id < :last_id
+        ) ordered
+        WHERE prix = previous_prix AND date >= :keep_from
+    ) duplicates
+    WHERE price_history.id = duplicates.id AND price_history.date = duplicates.date
+    RETURNING price_history.product_id, CAST(price_history.date AS DATE) AS day
+""")
+
+
+def _recompute_rollup_cte(name: str, table: str, unit: str) -> str:
+    """
+    CTE qui recalcule depuis l'historique les buckets date_trunc(unit) d'un rollup
+    touchés par une CTE "touched" (product_id, day); un bucket vidé est supprimé
+    """
+    return f"""
+    {name}_buckets AS (
+        SELECT DISTINCT product_id, CAST(date_trunc('{unit}', CAST(day AS TIMESTAMP)) AS DATE) AS bucket FROM touched
+    ),
+    {name}_values AS (
+        SELECT
+            history.product_id, buckets.bucket, MIN(prix) AS min_prix, MAX(prix) AS max_prix, SUM(prix) AS sum_prix,
+            COUNT(*) AS sample_count, (ARRAY_AGG(prix ORDER BY date DESC))[1] AS last_prix, MAX(date) AS last_at
+        FROM {name}_buckets buckets
+        JOIN price_history history ON history.product_id = buckets.product_id
+            AND history.date >= buckets.bucket AND history.date < buckets.bucket + INTERVAL '1 {unit}'
+        GROUP BY history.product_id, buckets.bucket
+    ),
+    {name}_replaced AS (
+        INSERT INTO {table} (product_id, bucket, min_prix, max_prix, sum_prix, sample_count, last_prix, last_at)
+        SELECT * FROM {name}_values
+        ON CONFLICT (product_id, bucket) DO UPDATE SET
+            min_prix = EXCLUDED.min_prix,
+            max_prix = EXCLUDED.max_prix,
+            sum_prix = EXCLUDED.sum_prix,
+            sample_count = EXCLUDED.sample_count,
+            last_prix = EXCLUDED.last_prix,
+            last_at = EXCLUDED.last_at
+    ),
+    {name}_emptied AS (
+        DELETE FROM {table} rollup
+        USING {name}_buckets buckets
+        WHERE rollup.product_id = buckets.product_id AND rollup.bucket = buckets.bucket
+            AND NOT EXISTS (
+                SELECT 1 FROM {name}_values v WHERE v.product_id = buckets.product_id AND v.bucket = buckets.bucket
+            )
+    )"""
+
+
+# Rollups des jours (et semaines) dont des entrées viennent d'être supprimées.
+# Requête distincte de la suppression: les CTE d'une même requête ne voient pas ses effets.
+_RECOMPUTE_ROLLUPS = text(f"""
+    WITH touched AS (
+        SELECT DISTINCT product_id, day FROM jsonb_to_recordset(CAST(:days AS jsonb)) AS t(product_id INTEGER, day DATE)
+    ),
+    {_recompute_rollup_cte("daily", "price_history_daily", "day")},
+    {_recompute_rollup_cte("weekly", "price_history_weekly", "week")}
+    SELECT COUNT(*) FROM touched
+""")
+
+_DELETE_OLD_OBSERVATIONS = text("DELETE FROM product_observations_daily WHERE bucket < :cutoff")
+
+_ATTACHED_PARTITIONS = text("""
+    SELECT child.relname
+    FROM pg_inherits
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE pg_inherits.inhparent = 'price_history'::regclass
+""")
+
+
+def insert_price_history(db: Session, rows: List[Dict]) -> int:
+    """
+    Ajouter des entrées d'historique (rows: product_id, prix, source, date) et
+    mettre à jour les rollups, en une requête
+    """
+    if not rows:
+        return 0
+
+    return db.execute(_INSERT_PRICE_HISTORY, {"rows": json.dumps(rows, default=str)}).scalar()
+
+
+def record_observations(db: Session, product_ids: List[int], at: datetime) -> None:
+    """Compter un relevé du jour de `at` pour chaque produit scrapé (prix changé ou non)"""
+    if product_ids:
+        db.execute(_RECORD_OBSERVATIONS, {"product_ids": list(product_ids), "now": at})
+
+
+def prune_observations(db: Session, retention_days: int = OBSERVATION_RETENTION_DAYS) -> int:
+    """Supprimer les compteurs de relevés plus anciens que la rétention"""
+    result = db.execute(_DELETE_OLD_OBSERVATIONS, {"cutoff": date.today() - timedelta(days=retention_days)})
+    db.commit()
+    return result.rowcount
+
+
+def history_resolution(days: int) -> str:
+    """Résolution lue pour une période: brute, journalière ou hebdomadaire"""
+    if days <= HISTORY_RAW_MAX_DAYS:
+        return "raw"
+    if days <= HISTORY_DAILY_MAX_DAYS:
+        return "daily"
+    return "weekly"
+
+
+def _add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def ensure_partitions(db: Session, months_ahead: int = PRICE_HISTORY_MONTHS_AHEAD) -> List[str]:
+    """
+    Créer les partitions du mois courant et des `months_ahead` mois suivants.
+    Un mois déjà couvert (partition legacy, lignes dans la partition par défaut)
+    est ignoré.
+    """
+    current = date.today().replace(day=1)
+    ensured = []
+
+    for offset in range(months_ahead + 1):
+        start = _add_months(current, offset)
+        name = f"price_history_{start.year:04d}_{start.month:02d}"
+
+        try:
+            with db.begin_nested():
+                db.execute(text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF price_history "
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{_add_months(start, 1).isoformat()}')"
+                ))
+            ensured.append(name)
+        except Exception as e:
+            logger.warning(f"Price history partition {name} not created: {str(e).splitlines()[0]}")
+
+    db.commit()
+    return ensured
+
+
+def detach_old_partitions(db: Session, retention_months: int = PRICE_HISTORY_RETENTION_MONTHS) -> List[str]:
+    """
+    Détacher les partitions mensuelles plus anciennes que la rétention.
+    Elles restent en base comme tables autonomes (archivage ou suppression manuelle).
+    """
+    cutoff = _add_months(date.today().replace(day=1), -retention_months)
+    detached = []
+
+    for (name,) in db.execute(_ATTACHED_PARTITIONS).all():
+        match = _PARTITION_NAME.match(name)
+        if not match or date(int(match.group(1)), int(match.group(2)), 1) >= cutoff:
+            continue
+
+        db.execute(text(f"ALTER TABLE price_history DETACH PARTITION {name}"))
+        detached.append(name)
+
+    db.commit()
+
+    if detached:
+        logger.info(f"Detached price history partitions: {', '.join(detached)}")
+    return detached
+
+
+def compact_price_history(db: Session, chunk_size: int = 1000) -> Dict[str, int]:
+    """
+    Supprimer les entrées consécutives identiques, `chunk_size` produits par
+    transaction pour ne pas verrouiller toute la table. Les buckets journaliers et
+    hebdomadaires touchés sont recalculés dans la même transaction.
+    Les semaines qui débordent sur un mois au-delà de la rétention (partition
+    détachée ou sur le point de l'être) ne sont pas compactées: leur rollup ne
+    pourrait plus être recalculé depuis l'historique.
+    """
+    cutoff = _add_months(date.today().replace(day=1), -PRICE_HISTORY_RETENTION_MONTHS)
+    keep_from = cutoff + timedelta(days=-cutoff.weekday() % 7)  # Premier lundi à partir du mois limite
+
+    max_id = db.query(func.max(PriceHistory.product_id)).scalar() or 0
+    deleted = 0
+    chunks = 0
+
+    for first_id in range(0, max_id + 1, chunk_size):
+        days = db.execute(_DELETE_CONSECUTIVE_DUPLICATES, {
+            "first_id": first_id,
+            "last_id": first_id + chunk_size,
+            "keep_from": keep_from
+        }).all()
+
+        if days:
+            db.execute(_RECOMPUTE_ROLLUPS, {
+                "days": json.dumps([{"product_id": product_id, "day": day} for product_id, day in days], default=str)
+            })
+
+        db.commit()
+        deleted += len(days)
+        chunks += 1
+
+    logger.info(f"Price history compacted: {deleted} duplicate rows removed in {chunks} chunks")
+    return {"deleted": deleted, "chunks": chunks}
+
+
+if __name__ == "__main__":
+    from models import SessionLocal
+
+    arg_parser = argparse.ArgumentParser(description="Price history maintenance")
+    arg_parser.add_argument("command", choices=["partitions", "compact"])
+    arg_parser.add_argument("--chunk-size", type=int, default=1000)
+    args = arg_parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        started = datetime.utcnow()
+        if args.command == "partitions":
+            ensured = ensure_partitions(session)
+            detached = detach_old_partitions(session)
+            print(f"Partitions ensured: {', '.join(ensured) or 'none'}; detached: {', '.join(detached) or 'none'}")
+        else:
+            result = compact_price_history(session, args.chunk_size)
+            print(f"Removed {result['deleted']} rows in {(datetime.utcnow() - started).total_seconds():.1f}s")
+    finally:
+        session.close()
@@ -0,0 +1,184 @@
+import os
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+
+from models import Alert, PriceHistory, Product, Trend
+
+
+# Bornes de l'intervalle de rafraîchissement d'un produit (minutes)
+REFRESH_MIN_INTERVAL = timedelta(minutes=int(os.getenv("REFRESH_MIN_INTERVAL_MINUTES", "60")))
+REFRESH_MAX_INTERVAL = timedelta(minutes=int(os.getenv("REFRESH_MAX_INTERVAL_MINUTES", str(48 * 60))))
+
+# Intervalle d'un produit sans historique suffisant pour mesurer sa volatilité
+REFRESH_DEFAULT_INTERVAL = timedelta(minutes=int(os.getenv("REFRESH_DEFAULT_INTERVAL_MINUTES", str(6 * 60))))
+
+# Intervalle maximal d'un produit portant une alerte active
+REFRESH_ALERT_MAX_INTERVAL = timedelta(minutes=int(os.getenv("REFRESH_ALERT_MAX_INTERVAL_MINUTES", "180")))
+
+# Fenêtre d'historique utilisée pour mesurer la volatilité
+REFRESH_VOLATILITY_WINDOW_DAYS = int(os.getenv("REFRESH_VOLATILITY_WINDOW_DAYS", "14"))
+
+# Coefficient de variation à partir duquel un produit est rafraîchi au rythme minimal (0.05 = 5%)
+REFRESH_VOLATILITY_REFERENCE = float(os.getenv("REFRESH_VOLATILITY_REFERENCE", "0.05"))
+
+# Réduction maximale de l'intervalle pour un score de tendance de 100
+REFRESH_TREND_WEIGHT = float(os.getenv("REFRESH_TREND_WEIGHT", "0.5"))
+
+# Fenêtre sur laquelle les produits jamais planifiés sont répartis (heures)
+REFRESH_INITIAL_SPREAD_HOURS = int(os.getenv("REFRESH_INITIAL_SPREAD_HOURS", "24"))
+
+# Bail posé sur les produits réservés par un run: s'il échoue, ils redeviennent dus à son expiration (minutes)
+REFRESH_CLAIM_MINUTES = int(os.getenv("REFRESH_CLAIM_MINUTES", "60"))
+
+# Dispersion aléatoire de l'échéance (+/-) pour ne pas resynchroniser un lot
+REFRESH_JITTER = 0.1
+
+# Répartition de Weyl: id * nombre d'or (mod 1) donne des phases uniformes pour des ids consécutifs
+_SPREAD_NEW_PRODUCTS = text("""
+    UPDATE products
+    SET next_refresh_at = NOW() AT TIME ZONE 'UTC'
+        + make_interval(secs => (id * 0.6180339887 - FLOOR(id * 0.6180339887)) * :spread_seconds)
+    WHERE next_refresh_at IS NULL
+""")
+
+# Réserver les produits dus les plus en retard en repoussant leur échéance; SKIP LOCKED
+# laisse un run concurrent prendre les suivants au lieu d'attendre ou de doubler le lot
+_CLAIM_DUE_PRODUCTS = text("""
+    UPDATE products
+    SET next_refresh_at = :lease_until
+    WHERE id IN (
+        SELECT id FROM products
+        WHERE next_refresh_at <= :now
+        ORDER BY next_refresh_at
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id
+""")
+
+# (volatilité ou None si inconnue, alerte active, score de tendance)
+RefreshSignals = Tuple[Optional[float], bool, float]
+
+
+def refresh_interval(volatility: Optional[float], has_active_alert: bool, trend_score: float) -> timedelta:
+    """
+    Intervalle de rafraîchissement d'un produit.
+    La volatilité (coefficient de variation du prix) place l'intervalle entre
+    REFRESH_MAX_INTERVAL (prix stable) et REFRESH_MIN_INTERVAL (prix qui bouge
+    d'au moins REFRESH_VOLATILITY_REFERENCE), sur une échelle géométrique.
+    Un score de tendance élevé le raccourcit, une alerte active le plafonne.
+    """
+    if volatility is None:
+        interval = REFRESH_DEFAULT_INTERVAL
+    else:
+        position = min(1.0, volatility / REFRESH_VOLATILITY_REFERENCE)
+        ratio = REFRESH_MIN_INTERVAL / REFRESH_MAX_INTERVAL
+        interval = REFRESH_MAX_INTERVAL * (ratio ** position)
+
+    interval *= 1 - REFRESH_TREND_WEIGHT * min(max(trend_score, 0.0), 100.0) / 100
+
+    if has_active_alert:
+        interval = min(interval, REFRESH_ALERT_MAX_INTERVAL)
+
+    return max(REFRESH_MIN_INTERVAL, min(interval, REFRESH_MAX_INTERVAL))
+
+
+def next_refresh_time(now: datetime, interval: timedelta) -> datetime:
+    """Échéance suivante, dispersée de +/- REFRESH_JITTER autour de l'intervalle"""
+    return now + interval * random.uniform(1 - REFRESH_JITTER, 1 + REFRESH_JITTER)
+
+
+def load_refresh_signals(db: Session, product_ids: Iterable[int]) -> Dict[int, RefreshSignals]:
+    """
+    Signaux de planification d'un lot de produits, en requêtes agrégées:
+    volatilité récente des prix, alertes actives et dernier score de tendance
+    """
+    product_ids = list(product_ids)
+    if not product_ids:
+        return {}
+
+    since = datetime.utcnow() - timedelta(days=REFRESH_VOLATILITY_WINDOW_DAYS)
+
+    # L'historique ne reçoit une entrée que lorsque le prix change
+    volatility_rows = db.query(
+        PriceHistory.product_id,
+        func.stddev_pop(PriceHistory.prix),
+        func.avg(PriceHistory.prix)
+    ).filter(
+        PriceHistory.product_id.in_(product_ids),
+        PriceHistory.date >= since
+    ).group_by(PriceHistory.product_id).having(func.count(PriceHistory.id) >= 2).all()
+
+    volatility = {
+        product_id: float(stddev) / float(average) if average else 0.0
+        for product_id, stddev, average in volatility_rows
+    }
+
+    # Aucun changement sur toute la fenêtre: prix stable (un produit plus récent reste inconnu)
+    changed = {
+        product_id for (product_id,) in db.query(PriceHistory.product_id).filter(
+            PriceHistory.product_id.in_(product_ids),
+            PriceHistory.date >= since
+        ).distinct()
+    }
+    for (product_id,) in db.query(Product.id).filter(Product.id.in_(product_ids), Product.created_at < since):
+        if product_id not in changed:
+            volatility[product_id] = 0.0
+
+    alerted = {
+        product_id for (product_id,) in db.query(Alert.product_id).filter(
+            Alert.product_id.in_(product_ids),
+            Alert.actif == True
+        ).distinct()
+    }
+
+    # Dernier calcul de tendance par produit
+    latest = db.query(
+        Trend.product_id,
+        func.max(Trend.date_calcul).label("date_calcul")
+    ).filter(Trend.product_id.in_(product_ids)).group_by(Trend.product_id).subquery()
+
+    trends = dict(
+        db.query(Trend.product_id, Trend.score_tendance).join(
+            latest,
+            (Trend.product_id == latest.c.product_id) & (Trend.date_calcul == latest.c.date_calcul)
+        ).all()
+    )
+
+    return {
+        product_id: (
+            volatility.get(product_id),
+            product_id in alerted,
+            float(trends.get(product_id) or 0)
+        )
+        for product_id in product_ids
+    }
+
+
+def schedule_new_products(db: Session) -> int:
+    """
+    Donner une première échéance aux produits jamais planifiés, répartie
+    uniformément sur REFRESH_INITIAL_SPREAD_HOURS
+    """
+    result = db.execute(_SPREAD_NEW_PRODUCTS, {"spread_seconds": REFRESH_INITIAL_SPREAD_HOURS * 3600})
+    db.commit()
+    return result.rowcount
+
+
+def claim_due_products(db: Session, batch_size: int, now: datetime) -> List[int]:
+    """
+    Réserver jusqu'à `batch_size` produits arrivés à échéance et valider aussitôt:
+    un run qui déborde sur le suivant ne reprend pas les mêmes produits
+    """
+    result = db.execute(_CLAIM_DUE_PRODUCTS, {
+        "now": now,
+        "lease_until": now + timedelta(minutes=REFRESH_CLAIM_MINUTES),
+        "batch_size": batch_size
+    })
+    product_ids = [row[0] for row in result]
+    db.commit()
+    return product_ids
@@ -1,111 +1,347 @@
 from celery_app import app
-from sqlalchemy.orm import Session
-from models import SessionLocal, Product, PriceHistory, Trend
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session, aliased
+from models import SessionLocal, Product, ProductCluster, Trend
+from analytics.product_matching import MATCH_BATCH_SIZE, cluster_sizes, match_pending_products
 from scrapers.amazon_scraper import amazon_scraper
 from scrapers.aliexpress_scraper import aliexpress_scraper
 from scrapers.ebay_scraper import ebay_scraper
 from scrapers.shopify_scraper import shopify_scraper
+from scrapers.utils import run_async
+from scrapers.cache import scraper_cache
+from scrapers.proxy_rotator import proxy_rotator
+from scrapers.resilience import circuit_breaker
+from scrapers.frontier import crawl_frontier, job_key, parse_job
+from tasks.pipeline import ProductPipeline
+from tasks.fingerprint import row_fingerprint, touch_last_seen
+from tasks.ingestion import upsert_products
+from tasks.price_history import (
+    compact_price_history,
+    detach_old_partitions,
+    ensure_partitions,
+    insert_price_history,
+    prune_observations,
+    record_observations
+)
+from tasks.refresh_scheduler import (
+    REFRESH_MAX_INTERVAL,
+    claim_due_products,
+    load_refresh_signals,
+    next_refresh_time,
+    refresh_interval,
+    schedule_new_products
+)
 from loguru import logger
 from datetime import datetime
 from decimal import Decimal
 import asyncio
+import os
+
+
+# Nombre maximum de jobs simultanés par source
+SOURCE_CONCURRENCY = {
+    "amazon": int(os.getenv("SCRAPE_CONCURRENCY_AMAZON", "2")),
+    "aliexpress": int(os.getenv("SCRAPE_CONCURRENCY_ALIEXPRESS", "3")),
+    "ebay": int(os.getenv("SCRAPE_CONCURRENCY_EBAY", "3")),
+    "shopify": int(os.getenv("SCRAPE_CONCURRENCY_SHOPIFY", "3"))
+}
+
+# Catégories à scraper
+CRAWL_CATEGORIES = [c.strip() for c in os.getenv("CRAWL_CATEGORIES", "electronics,fashion,home,sports").split(",") if c.strip()]
+
+# Niches dont les stores Shopify sont ajoutés au frontier
+CRAWL_SHOPIFY_NICHES = [n.strip() for n in os.getenv("CRAWL_SHOPIFY_NICHES", "fashion").split(",") if n.strip()]
+
+# Jobs retirés du frontier par tâche de crawl
+FRONTIER_BATCH_SIZE = int(os.getenv("FRONTIER_BATCH_SIZE", "8"))
+
+# Job de listing du frontier -> flux de produits
+LISTING_STREAMS = {
+    ("amazon", "bestsellers"): lambda target: amazon_scraper.iter_bestsellers(category=target, limit=25),
+    ("aliexpress", "trending"): lambda target: aliexpress_scraper.iter_trending_products(category=target, limit=25),
+    ("ebay", "sold"): lambda target: ebay_scraper.iter_sold_items(keyword=target, limit=25),
+    ("shopify", "store"): lambda target: shopify_scraper.iter_products(target, limit=20)
+}
+
+# Produits rafraîchis par tâche update_prices (toutes les 15 minutes)
+REFRESH_BATCH_SIZE = int(os.getenv("REFRESH_BATCH_SIZE", "200"))
+
+# Source -> prix actuel d'un produit (asin, url), hors cache
+PRICE_REFRESHERS = {
+    "amazon": lambda asin, url: amazon_scraper.fetch_current_price(asin),
+    "aliexpress": lambda asin, url: aliexpress_scraper.fetch_current_price(url),
+    "shopify": lambda asin, url: shopify_scraper.fetch_current_price(url)
+}
 
 
 @app.task(name='tasks.scraping_tasks.scrape_all_sources')
 def scrape_all_sources():
     """
-    Tâche de scraping quotidien pour toutes les sources
+    Scraping immédiat de tous les listings du frontier (lancement manuel),
+    sans attendre leur échéance. Le crawl planifié passe par seed_crawl_frontier
+    et crawl_frontier_batch.
     """
-    logger.info("Starting daily scraping task for all sources")
+    logger.info("Starting full scraping of all sources")
     
     db = SessionLocal()
     
     try:
-        # Catégories à scraper
-        categories = ["electronics", "fashion", "home", "sports"]
+        total_scraped = run_async(_scrape_all_sources(db))
         
-        total_scraped = 0
-        
-        for category in categories:
-            logger.info(f"Scraping category: {category}")
-            
-            # Amazon
-            try:
-                amazon_products = asyncio.run(amazon_scraper.scrape_bestsellers(category=category, limit=25))
-                total_scraped += save_products_to_db(db, amazon_products)
-            except Exception as e:
-                logger.error(f"Error scraping Amazon {category}: {str(e)}")
-            
-            # AliExpress
-            try:
-                aliexpress_products = asyncio.run(aliexpress_scraper.scrape_trending_products(category=category, limit=25))
-                total_scraped += save_products_to_db(db, aliexpress_products)
-            except Exception as e:
-                logger.error(f"Error scraping AliExpress {category}: {str(e)}")
-            
-            # eBay
+        cache_stats = scraper_cache.stats()
+        proxy_stats = proxy_rotator.stats()
+        circuit_stats = circuit_breaker.stats()
+        logger.info(f"Full scraping completed. Total products scraped: {total_scraped}, cache: {cache_stats}, "
+                    f"proxies: {proxy_stats}, circuits: {circuit_stats}")
+        return {
+            "status": "success",
+            "total_scraped": total_scraped,
+            "cache": cache_stats,
+            "proxies": proxy_stats,
+            "circuits": circuit_stats
+        }
+    
+    except Exception as e:
+        logger.error(f"Error in scrape_all_sources: {str(e)}")
+        return {"status": "error", "message": str(e)}
+    
+    finally:
+        db.close()
+
+
+async def _scrape_all_sources(db: Session) -> int:
+    """
+    Lancer tous les listings (mêmes catégories et niches que le frontier) en parallèle
+    sur une seule boucle. Les produits sont transmis au fil du parsing à la pipeline,
+    qui les écrit en base par micro-batches pendant que les autres jobs continuent
+    """
+    semaphores = {source: asyncio.Semaphore(limit) for source, limit in SOURCE_CONCURRENCY.items()}
+    
+    async def run_job(pipeline: ProductPipeline, job: str):
+        source, kind, target = parse_job(job)
+        async with semaphores[source]:
+            logger.info(f"Scraping {job}")
+            count = 0
             try:
-                ebay_products = asyncio.run(ebay_scraper.scrape_sold_items(keyword=category, limit=25))
-                total_scraped += save_products_to_db(db, ebay_products)
+                async for product in LISTING_STREAMS[(source, kind)](target):
+                    await pipeline.put(product)
+                    count += 1
             except Exception as e:
-                logger.error(f"Error scraping eBay {category}: {str(e)}")
+                logger.error(f"Error scraping {job}: {str(e)}")
+            logger.info(f"Streamed {count} products from {job}")
+    
+    jobs = await _listing_jobs()
+    
+    async with ProductPipeline(db, save_products_to_db) as pipeline:
+        await asyncio.gather(*(run_job(pipeline, job) for job in jobs))
+    
+    logger.info(f"Pipeline wrote {pipeline.saved} products in {pipeline.batches} batches: {pipeline.counts}")
+    return pipeline.saved
+
+
+@app.task(name='tasks.scraping_tasks.seed_crawl_frontier')
+def seed_crawl_frontier():
+    """
+    Ajouter au frontier les listings à crawler (catégories et stores Shopify).
+    Les jobs déjà présents gardent leur échéance.
+    """
+    try:
+        added = run_async(_seed_crawl_frontier())
+        
+        logger.info(f"Crawl frontier seeded with {added} new jobs")
+        return {"status": "success", "added": added}
+    
+    except Exception as e:
+        logger.error(f"Error in seed_crawl_frontier: {str(e)}")
+        return {"status": "error", "message": str(e)}
+
+
+async def _seed_crawl_frontier() -> int:
+    return await crawl_frontier.schedule(await _listing_jobs())
+
+
+async def _listing_jobs() -> list:
+    """Listings à crawler: catégories de chaque source et stores Shopify des niches suivies"""
+    jobs = []
+    
+    for category in CRAWL_CATEGORIES:
+        jobs.append(job_key("amazon", "bestsellers", category))
+        jobs.append(job_key("aliexpress", "trending", category))
+        jobs.append(job_key("ebay", "sold", category))
+    
+    for niche in CRAWL_SHOPIFY_NICHES:
+        for store in await shopify_scraper.detect_trending_stores(niche=niche):
+            jobs.append(job_key("shopify", "store", store))
+    
+    return jobs
+
+
+@app.task(name='tasks.scraping_tasks.crawl_frontier_batch')
+def crawl_frontier_batch(batch_size: int = FRONTIER_BATCH_SIZE):
+    """
+    Traiter un lot de jobs dus du frontier. Plusieurs workers peuvent exécuter
+    cette tâche en parallèle: chaque job n'est distribué qu'à un seul d'entre eux.
+    """
+    db = SessionLocal()
+    
+    try:
+        result = run_async(_crawl_frontier_batch(db, batch_size))
         
-        # Shopify stores
-        try:
-            stores = asyncio.run(shopify_scraper.detect_trending_stores(niche="fashion"))
-            for store in stores[:3]:  # Limiter à 3 stores
-                shopify_products = asyncio.run(shopify_scraper.scrape_store_products(store, limit=20))
-                total_scraped += save_products_to_db(db, shopify_products)
-        except Exception as e:
-            logger.error(f"Error scraping Shopify stores: {str(e)}")
+        # Lot plein: il reste sans doute des jobs dus, enchaîner sur un autre worker
+        if result["jobs"] >= batch_size:
+            crawl_frontier_batch.delay(batch_size)
         
-        logger.info(f"Daily scraping completed. Total products scraped: {total_scraped}")
-        return {"status": "success", "total_scraped": total_scraped}
+        logger.info(f"Crawl frontier batch completed: {result}")
+        return {"status": "success", **result}
     
     except Exception as e:
-        logger.error(f"Error in scrape_all_sources: {str(e)}")
+        logger.error(f"Error in crawl_frontier_batch: {str(e)}")
         return {"status": "error", "message": str(e)}
     
     finally:
         db.close()
 
 
+async def _crawl_frontier_batch(db: Session, batch_size: int) -> dict:
+    """
+    Exécuter les jobs d'un lot: listings en parallèle vers la pipeline d'écriture,
+    puis fiches produit Amazon. Les ASINs jamais vus deviennent de nouveaux jobs.
+    """
+    jobs = await crawl_frontier.pop_due(batch_size)
+    if not jobs:
+        return {"jobs": 0, "saved": 0, "inserted": 0, "updated": 0, "unchanged": 0, "details_saved": 0, "discovered": 0}
+    
+    listing_jobs = [job for job in jobs if parse_job(job)[1] != "product"]
+    product_jobs = [job for job in jobs if parse_job(job)[1] == "product"]
+    
+    semaphores = {source: asyncio.Semaphore(limit) for source, limit in SOURCE_CONCURRENCY.items()}
+    discovered = []
+    
+    async def run_listing(pipeline: ProductPipeline, job: str):
+        source, kind, target = parse_job(job)
+        stream = LISTING_STREAMS.get((source, kind))
+        count = 0
+        
+        if stream is None:
+            logger.warning(f"Unknown frontier job: {job}")
+        else:
+            async with semaphores[source]:
+                try:
+                    async for product in stream(target):
+                        await pipeline.put(product)
+                        count += 1
+                        if product.get("asin"):
+                            discovered.append(job_key("amazon", "product", product["asin"]))
+                except Exception as e:
+                    logger.error(f"Error crawling {job}: {str(e)}")
+        
+        # Un listing vide (source bloquée, circuit ouvert) est retenté plus tôt
+        await crawl_frontier.complete(job, succeeded=count > 0)
+    
+    async with ProductPipeline(db, save_products_to_db) as pipeline:
+        await asyncio.gather(*(run_listing(pipeline, job) for job in listing_jobs))
+    
+    discovered_count = await crawl_frontier.schedule(discovered)
+    
+    details_saved = 0
+    if product_jobs:
+        enriched = set()
+        
+        async with ProductPipeline(db, save_product_details) as details_pipeline:
+            async for details in amazon_scraper.iter_product_details([parse_job(job)[2] for job in product_jobs]):
+                if details and not details.get("error"):
+                    enriched.add(details["asin"])
+                    await details_pipeline.put(details)
+        
+        for job in product_jobs:
+            await crawl_frontier.complete(job, succeeded=parse_job(job)[2] in enriched)
+        
+        details_saved = details_pipeline.saved
+    
+    return {
+        "jobs": len(jobs),
+        "saved": pipeline.saved,
+        **pipeline.counts,
+        "details_saved": details_saved,
+        "discovered": discovered_count
+    }
+
+
 @app.task(name='tasks.scraping_tasks.update_prices')
-def update_prices():
+def update_prices(batch_size: int = REFRESH_BATCH_SIZE):
     """
-    Mise à jour des prix toutes les 6h pour les produits suivis
+    Rafraîchir le prix des produits arrivés à échéance, les plus en retard d'abord,
+    puis les replanifier selon leur volatilité, leurs alertes et leur tendance
     """
     logger.info("Starting price update task")
     
     db = SessionLocal()
     
     try:
-        # Récupérer tous les produits actifs
-        products = db.query(Product).limit(100).all()  # Limiter pour ne pas surcharger
+        scheduled_count = schedule_new_products(db)
+        
+        now = datetime.utcnow()
+        product_ids = claim_due_products(db, batch_size, now)
+        products = db.query(Product).filter(Product.id.in_(product_ids)).all() if product_ids else []
         
-        updated_count = 0
+        prices = run_async(_fetch_current_prices(products))
+        
+        failed_count = 0
+        unchanged_ids = []
+        history_rows = []
         
         for product in products:
-            try:
-                # Enregistrer le prix actuel dans l'historique
-                price_history = PriceHistory(
-                    product_id=product.id,
-                    prix=product.prix,
-                    source=product.source,
-                    date=datetime.utcnow()
-                )
+            price = prices.get(product.id)
+            
+            if price and Decimal(str(price)).quantize(Decimal("0.01")) == product.prix:
+                # Prix inchangé: ni réécriture du produit, ni entrée d'historique
+                unchanged_ids.append(product.id)
+            
+            elif price:
+                product.prix = price
+                product.content_hash = row_fingerprint(product)
+                product.date_scrape = now
+                product.last_seen_at = now
                 
-                db.add(price_history)
-                updated_count += 1
+                # Nouveau prix: entrée d'historique (écrites ensemble plus bas)
+                history_rows.append({"product_id": product.id, "prix": price, "source": product.source, "date": now})
             
-            except Exception as e:
-                logger.error(f"Error updating price for product {product.id}: {str(e)}")
-                continue
+            elif product.source in PRICE_REFRESHERS:
+                failed_count += 1
+        
+        touch_last_seen(db, unchanged_ids, now)
+        updated_count = insert_price_history(db, history_rows)
+        record_observations(db, unchanged_ids + [row["product_id"] for row in history_rows], now)
+        
+        # Les nouveaux prix comptent dans la volatilité utilisée pour replanifier
+        db.flush()
+        signals = load_refresh_signals(db, [product.id for product in products])
+        
+        for product in products:
+            if product.source in PRICE_REFRESHERS:
+                interval = refresh_interval(*signals[product.id])
+            else:
+                # Source sans page produit rafraîchissable (ventes eBay, réseaux sociaux)
+                interval = REFRESH_MAX_INTERVAL
+            
+            product.next_refresh_at = next_refresh_time(now, interval)
         
         db.commit()
         
-        logger.info(f"Price update completed. {updated_count} prices updated")
-        return {"status": "success", "updated_count": updated_count}
+        backlog = db.query(Product).filter(Product.next_refresh_at <= now).count()
+        
+        logger.info(
+            f"Price update completed. {updated_count} prices updated, {len(unchanged_ids)} unchanged, {failed_count} failed, "
+            f"{scheduled_count} newly scheduled, {backlog} still due"
+        )
+        return {
+            "status": "success",
+            "updated_count": updated_count,
+            "unchanged_count": len(unchanged_ids),
+            "failed_count": failed_count,
+            "scheduled_count": scheduled_count,
+            "backlog": backlog
+        }
     
     except Exception as e:
         logger.error(f"Error in update_prices: {str(e)}")
@@ -116,21 +352,137 @@ def update_prices():
         db.close()
 
 
+async def _fetch_current_prices(products: list) -> dict:
+    """
+    Récupérer en parallèle le prix actuel des produits (par source, dans la limite
+    de SOURCE_CONCURRENCY). Retourne {product_id: prix} pour les prix obtenus.
+    """
+    semaphores = {source: asyncio.Semaphore(limit) for source, limit in SOURCE_CONCURRENCY.items()}
+    targets = [(product.id, product.source, product.asin, product.url) for product in products]
+    
+    async def fetch(product_id: int, source: str, asin: str, url: str):
+        async with semaphores[source]:
+            try:
+                return product_id, await PRICE_REFRESHERS[source](asin, url)
+            except Exception as e:
+                logger.error(f"Error refreshing price for product {product_id}: {str(e)}")
+                return product_id, None
+    
+    results = await asyncio.gather(*(
+        fetch(*target) for target in targets if target[1] in PRICE_REFRESHERS
+    ))
+    
+    return {product_id: price for product_id, price in results if price}
+
+
+@app.task(name='tasks.scraping_tasks.compact_price_history')
+def compact_price_history_task(chunk_size: int = 1000):
+    """
+    Supprimer de l'historique les prix identiques consécutifs (écrits avant
+    l'historisation sur changement de prix)
+    """
+    db = SessionLocal()
+    
+    try:
+        result = compact_price_history(db, chunk_size)
+        return {"status": "success", **result}
+    
+    except Exception as e:
+        logger.error(f"Error in compact_price_history: {str(e)}")
+        db.rollback()
+        return {"status": "error", "message": str(e)}
+    
+    finally:
+        db.close()
+
+
+@app.task(name='tasks.scraping_tasks.maintain_price_history')
+def maintain_price_history():
+    """
+    Créer les partitions mensuelles à venir de l'historique des prix, détacher
+    celles qui dépassent la durée de rétention et purger les anciens compteurs de relevés
+    """
+    db = SessionLocal()
+    
+    try:
+        ensured = ensure_partitions(db)
+        detached = detach_old_partitions(db)
+        pruned = prune_observations(db)
+        return {"status": "success", "partitions": ensured, "detached": detached, "observations_pruned": pruned}
+    
+    except Exception as e:
+        logger.error(f"Error in maintain_price_history: {str(e)}")
+        db.rollback()
+        return {"status": "error", "message": str(e)}
+    
+    finally:
+        db.close()
+
+
+@app.task(name='tasks.scraping_tasks.match_products')
+def match_products(batch_size: int = MATCH_BATCH_SIZE):
+    """
+    Rattacher les produits nouveaux ou modifiés à leurs groupes de produits
+    identiques entre sources (MinHash / LSH sur les titres)
+    """
+    db = SessionLocal()
+    
+    try:
+        counts = match_pending_products(db, batch_size)
+        return {"status": "success", **counts}
+    
+    except Exception as e:
+        logger.error(f"Error in match_products: {str(e)}")
+        db.rollback()
+        return {"status": "error", "message": str(e)}
+    
+    finally:
+        db.close()
+
+
 @app.task(name='tasks.scraping_tasks.calculate_trends')
 def calculate_trends():
     """
-    Calcul quotidien des scores de tendance
+    Calcul quotidien des scores de tendance.
+    Seuls les produits dont le contenu a changé depuis leur dernier calcul, ou dont le
+    groupe a gagné ou perdu des produits (saturation différente), sont recalculés.
     """
     logger.info("Starting trend calculation task")
     
     db = SessionLocal()
     
     try:
-        products = db.query(Product).all()
+        latest_trend = db.query(
+            Trend.product_id,
+            func.max(Trend.date_calcul).label("date_calcul")
+        ).group_by(Trend.product_id).subquery()
+        last_trend = aliased(Trend)
+        
+        # Concurrents: autres produits du même groupe (analytics.product_matching)
+        sizes = cluster_sizes()
+        competitors = func.coalesce(sizes.c.size - 1, 0)
+        
+        products = db.query(Product, competitors).outerjoin(
+            latest_trend, Product.id == latest_trend.c.product_id
+        ).outerjoin(
+            last_trend, and_(
+                last_trend.product_id == latest_trend.c.product_id,
+                last_trend.date_calcul == latest_trend.c.date_calcul
+            )
+        ).outerjoin(
+            ProductCluster, ProductCluster.product_id == Product.id
+        ).outerjoin(
+            sizes, sizes.c.cluster_id == ProductCluster.cluster_id
+        ).filter(or_(
+            latest_trend.c.date_calcul.is_(None),
+            Product.date_scrape > latest_trend.c.date_calcul,
+            # Même formule que saturation_marche ci-dessous
+            last_trend.saturation_marche.is_distinct_from(func.least(100, competitors * 5))
+        )).all()
         
         calculated_count = 0
         
-        for product in products:
+        for product, competitors_count in products:
             try:
                 # Calcul simple du score de tendance basé sur reviews et rating
                 score_tendance = 0.0
@@ -143,11 +495,6 @@ def calculate_trends():
                 volume_ventes_estime = product.reviews_count * 10 if product.reviews_count else 0
                 
                 # Calculer la saturation (nombre de concurrents)
-                competitors_count = db.query(Product).filter(
-                    Product.nom.ilike(f"%{product.nom[:20]}%"),
-                    Product.id != product.id
-                ).count()
-                
                 saturation_marche = min(100, competitors_count * 5)
                 
                 # Créer ou mettre à jour le trend
@@ -180,47 +527,25 @@ def calculate_trends():
         db.close()
 
 
-def save_products_to_db(db: Session, products: list) -> int:
+def save_product_details(db: Session, details: list) -> int:
     """
-    Sauvegarder les produits dans la base de données
+    Compléter les produits Amazon existants avec leurs fiches détaillées
     """
-    saved_count = 0
+    updated_count = 0
     
-    for product_data in products:
-        try:
-            # Vérifier si le produit existe déjà
-            existing = db.query(Product).filter(
-                Product.url == product_data.get('url')
-            ).first()
-            
-            if existing:
-                # Mettre à jour le prix
-                existing.prix = product_data.get('prix', 0)
-                existing.date_scrape = datetime.utcnow()
-            else:
-                # Créer nouveau produit
-                product = Product(
-                    nom=product_data.get('nom', 'Unknown'),
-                    categorie=product_data.get('categorie'),
-                    prix=product_data.get('prix', 0),
-                    url=product_data.get('url', ''),
-                    source=product_data.get('source', 'unknown'),
-                    image_url=product_data.get('image_url'),
-                    description=product_data.get('description'),
-                    asin=product_data.get('asin'),
-                    reviews_count=product_data.get('reviews_count', 0),
-                    rating=product_data.get('rating'),
-                    stock_status=product_data.get('stock_status', 'unknown'),
-                    date_scrape=datetime.utcnow()
-                )
-                
-                db.add(product)
-            
-            saved_count += 1
-        
-        except Exception as e:
-            logger.error(f"Error saving product: {str(e)}")
-            continue
+    for item in details:
+        updated_count += db.query(Product).filter(
+            Product.asin == item.get('asin')
+        ).update({"description": item.get('description')}, synchronize_session=False)
     
     db.commit()
-    return saved_count
+    return updated_count
+
+
+def save_products_to_db(db: Session, products: list) -> dict:
+    """
+    Sauvegarder les produits dans la base de données (upsert ensembliste sur la
+    clé d'URL normalisée). Retourne les nombres de produits insérés, mis à jour
+    et inchangés.
+    """
+    return upsert_products(db, products)